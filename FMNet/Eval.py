@@ -0,0 +1,54 @@
+import torch
+import argparse, time
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import load_checkpoint
+from utils.data_val import get_eval_loader
+from utils.metrics import CODMetrics, batch_maps, DISPLAY_NAMES
+from utils.utils import AMP_DTYPES
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--pth_path', type=str, default='', help='checkpoint to evaluate (runs the model)')
+parser.add_argument('--pred_root', type=str, default=None, help='or a directory of saved maps named like the GTs')
+parser.add_argument('--val_root', type=str, default='', help='dataset root with Imgs/ and GT/')
+parser.add_argument('--testsize', type=int, default=416, help='network input size')
+parser.add_argument('--batchsize', type=int, default=8, help='evaluation batch size')
+parser.add_argument('--num_workers', type=int, default=4, help='decode/resize workers')
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='cuda or cpu')
+parser.add_argument('--amp', type=str, default='none', choices=list(AMP_DTYPES), help='mixed precision inference')
+parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+opt = parser.parse_args()
+assert opt.pth_path or opt.pred_root, 'give --pth_path or --pred_root'
+
+device = torch.device(opt.device)
+amp_dtype = AMP_DTYPES[opt.amp]
+loader = get_eval_loader(opt.val_root + 'Imgs/', opt.val_root + 'GT/', opt.testsize, opt.batchsize,
+                         num_workers=opt.num_workers, pin_memory=device.type == 'cuda', pred_root=opt.pred_root)
+metrics = CODMetrics(device)
+
+model = None
+if opt.pred_root is None:
+    model = Network(channels=128, pretrained=False, encoder_path=opt.encoder_path, cache_dir=opt.cache_dir)
+    load_checkpoint(model, opt.pth_path, device=device)
+    model.to(device).eval()
+
+start = time.perf_counter()
+with torch.no_grad():
+    for items, gts, sizes, names in loader:
+        items = items.to(device, non_blocking=True)
+        if model is not None:
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                logits = model(items, return_all=False)
+            maps = batch_maps(logits, sizes, gts.shape[-2:])
+        else:
+            # saved uint8 maps, min-max normalized per image like the evaluation toolbox
+            maps = items.float() / 255
+            for i, (h, w) in enumerate(sizes.tolist()):
+                m = maps[i, :h, :w]
+                if m.max() > m.min():
+                    maps[i, :h, :w] = (m - m.min()) / (m.max() - m.min())
+        metrics.update(maps, gts, sizes)
+scores = metrics.compute()
+print(' '.join('{}: {:.4f}'.format(DISPLAY_NAMES[k], v) for k, v in scores.items()))
+print('> {} images in {:.2f}s'.format(len(loader.dataset), time.perf_counter() - start))
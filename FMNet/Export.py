@@ -0,0 +1,52 @@
+import torch
+import argparse, time
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import load_checkpoint
+from lib.export import METHODS, export_network, load_exported
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--pth_path', type=str, default='', help='.pth or converted .safetensors checkpoint')
+parser.add_argument('--out', type=str, default=None, help='artifact path (default: FMNet_<B>x<H>x<W>.pt / .pt2)')
+parser.add_argument('--testsize', type=int, nargs='+', default=[416], help='input size, one value or H W (multiples of 32)')
+parser.add_argument('--batchsize', type=int, default=1, help='batch size the artifact is specialized to')
+parser.add_argument('--method', type=str, default='trace', choices=METHODS, help='TorchScript trace or torch.export')
+parser.add_argument('--freeze', action='store_true', help='freeze the TorchScript graph for inference')
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='cuda or cpu')
+parser.add_argument('--iters', type=int, default=10, help='timed calls of the eager vs exported comparison')
+parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+opt = parser.parse_args()
+
+h, w = opt.testsize if len(opt.testsize) > 1 else opt.testsize * 2
+shape = (opt.batchsize, 3, h, w)
+out = opt.out or 'FMNet_{}x{}x{}.{}'.format(opt.batchsize, h, w, 'pt2' if opt.method == 'export' else 'pt')
+
+model = Network(channels=128, pretrained=False, encoder_path=opt.encoder_path, cache_dir=opt.cache_dir)
+load_checkpoint(model, opt.pth_path, device=opt.device)
+model.to(opt.device).eval()
+start = time.perf_counter()
+export_network(model, shape, out, method=opt.method, freeze=opt.freeze, device=opt.device)
+print('> {} captured in {:.2f}s'.format(out, time.perf_counter() - start))
+
+
+def latency(fn, x):
+    fn(x)
+    if x.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(opt.iters):
+        fn(x)
+    if x.is_cuda:
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / opt.iters
+
+
+exported, _ = load_exported(out, device=opt.device)
+x = torch.randn(*shape, device=opt.device)
+with torch.no_grad():
+    diff = (exported(x) - model(x, return_all=False)).abs().max().item()
+    eager = latency(lambda x: model(x, return_all=False), x)
+    graph = latency(exported, x)
+print('> max abs diff {:.2e} | eager {:.1f} ms, exported {:.1f} ms ({:.2f}x)'.format(
+    diff, eager * 1e3, graph * 1e3, eager / graph))
@@ -0,0 +1,40 @@
+import torch
+import argparse, asyncio
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import load_checkpoint
+from utils.serving import BatchPredictor, InferenceServer
+from utils.utils import AMP_DTYPES
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--pth_path', type=str, default='', help='.pth or converted .safetensors checkpoint')
+parser.add_argument('--host', type=str, default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8000)
+parser.add_argument('--testsize', type=int, default=416, help='testing size (multiple of 32)')
+parser.add_argument('--max_batch_size', type=int, default=8, help='largest dynamic batch')
+parser.add_argument('--max_wait_ms', type=float, default=5.0, help='longest wait for a batch to fill')
+parser.add_argument('--decode_workers', type=int, default=4, help='image decode threads')
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='cuda or cpu')
+parser.add_argument('--amp', type=str, default='none', choices=list(AMP_DTYPES), help='mixed precision inference')
+parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+opt = parser.parse_args()
+
+
+async def main():
+    model = Network(channels=128, pretrained=False, encoder_path=opt.encoder_path, cache_dir=opt.cache_dir)
+    load_checkpoint(model, opt.pth_path, device=opt.device)
+    predictor = BatchPredictor(model, testsize=opt.testsize, device=opt.device, amp_dtype=AMP_DTYPES[opt.amp])
+    server = await InferenceServer(predictor, opt.host, opt.port, max_batch_size=opt.max_batch_size,
+                                   max_wait_ms=opt.max_wait_ms, decode_workers=opt.decode_workers).start()
+    print('> serving on http://{}:{} (POST /predict, GET /metrics)'.format(opt.host, server.port), flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    pass
@@ -1,44 +1,66 @@
 import torch
-import torch.nn.functional as F
-import numpy as np
-import os, argparse
-import cv2
-from lib.FMNet_test import Network
-from utils.data_val import test_dataset
+import os, argparse, time
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import load_checkpoint
+from lib.compilation import compile_network
+from utils.inference import InferenceEngine
+from utils.tiling import TiledPredictor
+from utils.utils import AMP_DTYPES
 
 os.environ["CUDA_VISIBLE_DEVICES"] = '0'
 
 parser = argparse.ArgumentParser()
-parser.add_argument('--testsize', type=int, default=416, help='testing size') #
-parser.add_argument('--pth_path', type=str, default='')
+parser.add_argument('--testsize', type=int, nargs='+', default=[416], help='testing size, one value or H W (multiples of 32)') #
+parser.add_argument('--pth_path', type=str, default='', help='.pth or converted .safetensors checkpoint')
 parser.add_argument('--test_dataset_path', type=str, default='')
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='cuda or cpu')
+parser.add_argument('--batchsize', type=int, default=8, help='inference batch size')
+parser.add_argument('--num_workers', type=int, default=4, help='decode/resize workers')
+parser.add_argument('--write_workers', type=int, default=4, help='mask writer threads')
+parser.add_argument('--spectral', type=str, default='fft', choices=['fft', 'rfft'], help='spectral backend of MFM/FRD')
+parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+parser.add_argument('--amp', type=str, default='none', choices=list(AMP_DTYPES), help='mixed precision inference')
+parser.add_argument('--compile', action='store_true', help='torch.compile the decoder and encoder stages')
+parser.add_argument('--compile_decoder_only', action='store_true', help='with --compile, leave the encoder eager')
+parser.add_argument('--tile', type=int, default=0, help='sliding-window inference at native resolution with this window size (0: resize to testsize)')
+parser.add_argument('--overlap', type=int, default=64, help='overlap of neighbouring windows in --tile mode')
+parser.add_argument('--tile_scale', type=float, default=1.0, help='resize factor applied before tiling')
 opt = parser.parse_args()
 
+start = time.perf_counter()
+# the checkpoint holds the encoder weights too, so only the architecture is built here
+model = Network(channels=128, spectral=opt.spectral, pretrained=False,
+                encoder_path=opt.encoder_path, cache_dir=opt.cache_dir)
+built = time.perf_counter()
+load_checkpoint(model, opt.pth_path, device=opt.device)
+print('> construction {:.2f}s, checkpoint {:.2f}s'.format(built - start, time.perf_counter() - built))
+if opt.compile:
+    # compiles lazily: the first batch (per input shape) pays the compile time
+    compile_network(model, encoder=not opt.compile_decoder_only)
+if opt.tile:
+    engine = TiledPredictor(model, tile=opt.tile, overlap=opt.overlap, batch_size=opt.batchsize,
+                            device=opt.device, amp_dtype=AMP_DTYPES[opt.amp], scale=opt.tile_scale)
+else:
+    engine = InferenceEngine(model, device=opt.device, batch_size=opt.batchsize,
+                             num_workers=opt.num_workers, write_workers=opt.write_workers,
+                             amp_dtype=AMP_DTYPES[opt.amp])
+testsize = opt.testsize if len(opt.testsize) > 1 else opt.testsize[0]
+
 for _data_name in ['CAMO']:
     data_path = opt.test_dataset_path+'/{}/'.format(_data_name)
     save_path = '/workspace/codlab/codre/{}_3/{}/'.format(opt.pth_path.split('/')[-2], _data_name)
-    os.makedirs(save_path, exist_ok=True)
-
-    model = Network(channels=128)
-    model.load_state_dict({k.replace('module.',''):v for k,v in torch.load(opt.pth_path).items()})
-    model.cuda()
-    model.eval()
 
     image_root = '{}/Imgs/'.format(data_path)
-    gt_root = '{}/GT/'.format(data_path)
-    test_loader = test_dataset(image_root, gt_root, opt.testsize)
-
-    for i in range(test_loader.size):
-        image, gt, name, _ = test_loader.load_data()
-        print('> {} - {}'.format(_data_name, name))
-        
-        gt = np.asarray(gt, np.float32)
-        gt /= (gt.max() + 1e-8)
-        image = image.cuda()
-
-        result = model(image)
-
-        res = F.interpolate(result[4], size=gt.shape, mode='bilinear', align_corners=False)
-        res = res.sigmoid().data.cpu().numpy().squeeze()
-        res = (res - res.min()) / (res.max() - res.min() + 1e-8)
-        cv2.imwrite(save_path+name,res*255)
+    if opt.tile:
+        stats = engine.run(image_root, save_path)
+        summary = '> {}: {} images, {:.1f} MP in {:.2f}s, {:.2f} MP/s'.format(
+            _data_name, stats['images'], stats['megapixels'], stats['seconds'], stats['megapixels_per_sec'])
+        if stats['peak_memory_mb_per_megapixel'] is not None:  # CUDA allocator stats only
+            summary += ', peak memory {:.1f} MB/MP'.format(stats['peak_memory_mb_per_megapixel'])
+        print(summary)
+    else:
+        stats = engine.run(image_root, save_path, testsize=testsize)
+        print('> {}: {} images in {:.2f}s, {:.2f} img/s'.format(
+            _data_name, stats['images'], stats['seconds'], stats['images_per_sec']))
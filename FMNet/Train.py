@@ -1,13 +1,19 @@
 import os
 import torch
-import torch.nn.functional as F
-import numpy as np
-from datetime import datetime
-from torchvision.utils import make_grid
-from lib.FMNet_train import Network
-
-from utils.data_val import get_loader, test_dataset
-from utils.utils import clip_gradient, adjust_lr, get_coef,cal_ual
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import AsyncCheckpointer, training_state, resume_training
+from lib.compilation import compile_network, NO_BACKWARD
+
+from utils.data_val import get_loader, get_eval_loader
+from utils.data_cache import build_cache, cache_files
+from utils.batch_aug import batch_augment
+from utils.utils import clip_gradient, adjust_lr, get_coef, AMP_DTYPES
+from utils.losses import DeepSupervisionLoss
+from utils.telemetry import Telemetry
+from utils.metrics import CODMetrics, batch_maps, METRICS, HIGHER_IS_BETTER, DISPLAY_NAMES
+from utils.distributed import init_distributed, is_main, main_first, all_reduce_sum, cleanup
+from torch.nn.parallel import DistributedDataParallel
 from tensorboardX import SummaryWriter
 import logging
 import torch.backends.cudnn as cudnn
@@ -16,17 +22,6 @@ from thop import profile
 from ptflops import get_model_complexity_info
 
 
-def structure_loss(pred, mask):
-    weit = 1 + 5 * torch.abs(F.avg_pool2d(mask, kernel_size=31, stride=1, padding=15) - mask)
-    wbce = F.binary_cross_entropy_with_logits(pred, mask, reduction='none')
-    wbce = (weit * wbce).sum(dim=(2, 3)) / weit.sum(dim=(2, 3))
-
-    pred = torch.sigmoid(pred)
-    inter = ((pred * mask) * weit).sum(dim=(2, 3))
-    union = ((pred + mask) * weit).sum(dim=(2, 3))
-    wiou = 1 - (inter + 1) / (union - inter + 1)
-    return (wbce + wiou).mean()
-
 def dice_loss(predict, target):
     smooth = 1
     p = 2
@@ -39,74 +34,73 @@ def dice_loss(predict, target):
     loss = 1 - num / den
     return loss.mean()
 
+# supervision the losses below consume; add 'edge' together with an edge loss so the loader
+# reads, dilates and augments Edge/ again (and the packed cache stores it)
+TARGETS = ('gt',)
+
+
 def train(train_loader, model, optimizer, epoch, save_path, writer):
     global step
     model.train()
     loss_all = 0
     epoch_step = 0
+    if world_size > 1:
+        train_loader.sampler.set_epoch(epoch)
     try:
-        for i, (images, gts, edges) in enumerate(train_loader, start=1):
+        for i, (images, gts, *edges) in enumerate(train_loader, start=1):
             optimizer.zero_grad()
-            images = images.cuda(device=device_ids[0])
-            gts = gts.cuda(device=device_ids[0])
-            #edges = edges.cuda(device=device_ids[0])
+            images = images.to(device, non_blocking=True)
+            gts = gts.to(device, non_blocking=True)
+            #edges = edges.to(device, non_blocking=True)
+            if opt.batch_aug:
+                # the loader only resized; augment the uint8 batch on the GPU
+                images, gts, *edges = batch_augment(images, gts, *edges)
 
 
 
-            preds = model(images)
+            # convolutions / linear layers run in opt.amp, the spectral and RoPE math stays
+            # fp32 inside the modules; the losses are computed in fp32
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                preds = model(images)
+            preds = [pred.float() for pred in preds]
 
+            # weighted structure losses of the five outputs + 2 * ual, boundary weights computed once
             ual_coef = get_coef(iter_percentage=i/total_step, method='cos')
-            ual_loss = cal_ual(seg_logits=preds[4], seg_gts=gts)
-            ual_loss *= ual_coef
-
-            loss_init = structure_loss(preds[0], gts)*0.0625 + structure_loss(preds[1], gts)*0.125 + structure_loss(preds[2], gts)*0.25 + \
-                        structure_loss(preds[3], gts)*0.5
-            loss_final = structure_loss(preds[4], gts)
-            loss = loss_init + loss_final + 2 * ual_loss
-            loss.backward()
+            loss, loss_init, loss_final = criterion(preds, gts, ual_coef=ual_coef)
+            scaler.scale(loss).backward()
+            # clip the real gradients, not the fp16-scaled ones
+            scaler.unscale_(optimizer)
             clip_gradient(optimizer, opt.clip)
-            optimizer.step()
+            scaler.step(optimizer)
+            scaler.update()
 
 
 
 
             step += 1
             epoch_step += 1
-            loss_all += loss.data
-
-            if i % 20 == 0 or i == total_step or i == 1:
-                print('{} Epoch [{:03d}/{:03d}], Step [{:04d}/{:04d}], Total_loss: {:.4f} Loss1: {:.4f} Loss2: {:0.4f}'.
-                      format(datetime.now(), epoch, opt.epoch, i, total_step, loss.data, loss_init.data, loss_final.data)) # loss_edge.data
-                logging.info(
-                    '[Train Info]:Epoch [{:03d}/{:03d}], Step [{:04d}/{:04d}], Total_loss: {:.4f} Loss1: {:.4f} Loss2: {:0.4f}'.
-                        format(epoch, opt.epoch, i, total_step, loss.data, loss_init.data, loss_final.data))
-                # TensorboardX-Loss
-                writer.add_scalars('Loss_Statistics',
-                                   {'Loss_init': loss_init.data, 'Loss_final': loss_final.data,  'Loss_total': loss.data},
-                                   global_step=step)
-                # TensorboardX-Training Data
-                grid_image = make_grid(images[0].clone().cpu().data, 1, normalize=True)
-                writer.add_image('RGB', grid_image, step)
-                grid_image = make_grid(gts[0].clone().cpu().data, 1, normalize=True)
-                writer.add_image('GT', grid_image, step)
-
-                # TensorboardX-Outputs
-                res = preds[0][0].clone()
-                res = res.sigmoid().data.cpu().numpy().squeeze()
-                res = (res - res.min()) / (res.max() - res.min() + 1e-8)
-                writer.add_image('Pred_init', torch.tensor(res), step, dataformats='HW')
-
-                res = preds[4][0].clone()
-                res = res.sigmoid().data.cpu().numpy().squeeze()
-                res = (res - res.min()) / (res.max() - res.min() + 1e-8)
-                writer.add_image('Pred_final', torch.tensor(res), step, dataformats='HW')
+            loss_all += loss.detach()
 
+            # rank 0 only, with its local batch: means since the last flush and sample
+            # images, copied and written off the training thread (no host sync here)
+            telemetry.update(Loss_total=loss, Loss_init=loss_init, Loss_final=loss_final)
+            telemetry.log(step, 'Epoch [{:03d}/{:03d}], Step [{:04d}/{:04d}]'.format(epoch, opt.epoch, i, total_step),
+                          force=i == total_step)
+            telemetry.images(step, maps={'RGB': images[0], 'GT': gts[0]},
+                             logits={'Pred_init': preds[0][0], 'Pred_final': preds[4][0]})
+
+        loss_all, epoch_step = all_reduce_sum([float(loss_all), epoch_step], device)
         loss_all /= epoch_step
-        logging.info('[Train Info]: Epoch [{:03d}/{:03d}], Loss_AVG: {:.4f}'.format(epoch, opt.epoch, loss_all))
-        writer.add_scalar('Loss-epoch', loss_all, global_step=epoch)
-        if epoch % 80 == 0:
-            torch.save(model.state_dict(), save_path + 'Net_epoch_{}.pth'.format(epoch))
+        if is_main():
+            logging.info('[Train Info]: Epoch [{:03d}/{:03d}], Loss_AVG: {:.4f}'.format(epoch, opt.epoch, loss_all))
+            writer.add_scalar('Loss-epoch', loss_all, global_step=epoch)
+        if epoch % 80 == 0 and is_main():
+            checkpointer.save(model.state_dict(), save_path + 'Net_epoch_{}.pth'.format(epoch))
     except KeyboardInterrupt:
+        if not is_main():
+            raise
+        # let the last resume checkpoint finish writing, it is the one to restart from
+        checkpointer.wait()
         print('Keyboard Interrupt: save model and exit.')
         if not os.path.exists(save_path):
             os.makedirs(save_path)
@@ -115,42 +109,47 @@ def train(train_loader, model, optimizer, epoch, save_path, writer):
         raise
 
 
-def val(test_loader, model, epoch, save_path, writer):
+def val(val_loader, model, epoch, save_path, writer):
     """
-    validation function
+    validation function: batched, COD metrics accumulated on device (utils.metrics); each rank
+    scores its slice of the set and the sums are reduced. The best checkpoint is selected by
+    opt.select_metric.
     """
-    global best_mae, best_epoch
-    model.eval()
+    global best_score, best_epoch
+    # the wrapped module: ranks see different image counts, so no DDP collectives here
+    net = model.module if isinstance(model, DistributedDataParallel) else model
+    net.eval()
+    metrics.reset()
     with torch.no_grad():
-        mae_sum = 0
-        mae_sum_edge = 0
-        for i in range(test_loader.size):
-            image, gt,  name, img_for_post = test_loader.load_data()
-            gt = np.asarray(gt, np.float32)
-            gt /= (gt.max() + 1e-8)
-            image = image.cuda(device=device_ids[0])
-
-            result = model(image)
-
-            res = F.interpolate(result[4], size=gt.shape, mode='bilinear', align_corners=False)
-            res = res.sigmoid().data.cpu().numpy().squeeze()
-            res = (res - res.min()) / (res.max() - res.min() + 1e-8)
-            mae_sum += np.sum(np.abs(res - gt)) * 1.0 / (gt.shape[0] * gt.shape[1])
-
-        mae = mae_sum / test_loader.size
-        writer.add_scalar('MAE', torch.tensor(mae), global_step=epoch)
-        print('Epoch: {}, MAE: {}, bestMAE: {}, bestEpoch: {}.'.format(epoch, mae, best_mae, best_epoch))
-        if epoch == 1:
-            best_mae = mae
-            best_epoch = 1
-        else:
-            if mae < best_mae:
-                best_mae = mae
-                best_epoch = epoch
-                torch.save(model.state_dict(), save_path + 'Net_epoch_best.pth')
+        for images, gts, sizes, names in val_loader:
+            images = images.to(device, non_blocking=True)
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                logits = net(images, return_all=False)
+            metrics.update(batch_maps(logits, sizes, gts.shape[-2:]), gts, sizes)
+
+    metrics.all_reduce()
+    scores = metrics.compute()
+    score = scores[opt.select_metric]
+    name = DISPLAY_NAMES[opt.select_metric]
+    summary = ' '.join('{}: {:.4f}'.format(DISPLAY_NAMES[k], v) for k, v in scores.items())
+    # every rank tracks the same best_score; only rank 0 writes
+    if is_main():
+        for k, v in scores.items():
+            writer.add_scalar(DISPLAY_NAMES[k], v, global_step=epoch)
+        print('Epoch: {}, {}, best{}: {}, bestEpoch: {}.'.format(epoch, summary, name, best_score, best_epoch))
+    if epoch == 1 or best_score is None:
+        best_score = score
+        best_epoch = epoch
+    else:
+        if (score > best_score) if HIGHER_IS_BETTER[opt.select_metric] else (score < best_score):
+            best_score = score
+            best_epoch = epoch
+            if is_main():
+                checkpointer.save(model.state_dict(), save_path + 'Net_epoch_best.pth')
                 print('Save state_dict successfully! Best epoch:{}.'.format(epoch))
+    if is_main():
         logging.info(
-            '[Val Info]:Epoch:{} MAE:{} bestEpoch:{} bestMAE:{}'.format(epoch, mae, best_epoch, best_mae))
+            '[Val Info]:Epoch:{} {} bestEpoch:{} best{}:{}'.format(epoch, summary, best_epoch, name, best_score))
 
 if __name__ == '__main__':
     import argparse
@@ -158,29 +157,69 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--epoch', type=int, default=180, help='epoch number')
     parser.add_argument('--lr', type=float, default=1e-4, help='learning rate')
-    parser.add_argument('--batchsize', type=int, default=8, help='training batch size')
+    parser.add_argument('--batchsize', type=int, default=8, help='training batch size, split over all ranks')
     parser.add_argument('--trainsize', type=int, default=416, help='training dataset size')
     parser.add_argument('--clip', type=float, default=0.5, help='gradient clipping margin')
     parser.add_argument('--decay_rate', type=float, default=0.1, help='decay rate of learning rate')
     parser.add_argument('--decay_epoch', type=int, default=60, help='every n epochs decay learning rate')
-    parser.add_argument('--load', type=str, default=None, help='train from checkpoints')
-    parser.add_argument('--gpu_id', type=str, default='0,1', help='train use gpu')
+    parser.add_argument('--load', type=str, default=None,
+                        help='Net_resume.pth to continue a run, or a Net_epoch_*.pth to start from its weights')
+    parser.add_argument('--gpu_id', type=str, default='0,1', help='visible gpus, one torchrun process per gpu')
+    parser.add_argument('--backend', type=str, default=None, choices=['nccl', 'gloo'],
+                        help='process-group backend under torchrun (default nccl on CUDA, gloo on CPU)')
+    parser.add_argument('--sync_bn', action='store_true', help='synchronize BatchNorm statistics across ranks')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the decoder and encoder stages')
+    parser.add_argument('--compile_decoder_only', action='store_true', help='with --compile, leave the encoder eager')
+    parser.add_argument('--val_batchsize', type=int, default=8, help='validation batch size')
+    parser.add_argument('--select_metric', type=str, default='mae', choices=METRICS,
+                        help='metric that picks Net_epoch_best.pth (mae, sm, adp_em, mean_em, wfm)')
+    parser.add_argument('--log_every', type=int, default=20, help='steps between loss logs (interval means)')
+    parser.add_argument('--image_every', type=int, default=200, help='steps between TensorBoard sample images')
     parser.add_argument('--train_root', type=str, default='',
                         help='the training rgb images root')
     parser.add_argument('--val_root', type=str, default='',
                         help='the test rgb images root')
     parser.add_argument('--save_path', type=str,default='', help='the path to save model and log')
+    parser.add_argument('--batch_aug', action='store_true',
+                        help='augment resized uint8 batches on the GPU instead of per sample in the workers')
+    parser.add_argument('--work_size', type=int, default=None,
+                        help='downsample the shorter side to this size before augmenting (e.g. the trainsize)')
+    parser.add_argument('--train_cache', type=str, default=None,
+                        help='packed training-set cache (built from train_root on first use)')
+    parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+    parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+    parser.add_argument('--amp', type=str, default='none', choices=list(AMP_DTYPES),
+                        help='mixed precision; fp16 uses loss scaling, bf16 does not need it')
+    parser.add_argument('--checkpoint', type=str, nargs='*', default=[], choices=Network.CHECKPOINT_STAGES,
+                        help='decoder stages to activation-checkpoint, e.g. MFM_2 MFM_3 '
+                             '(benchmarks/checkpoint_memory.py compares configurations)')
     opt = parser.parse_args()
 
 
     os.environ["CUDA_VISIBLE_DEVICES"] = opt.gpu_id
     #print('USE GPU 0,1,2,3')
     cudnn.benchmark = True
-
-    # build the model
-    device_ids = [0,1] # if you want to use more gpus than 2, you shoule change it just like when use opt.gpu_id='1,2,6,8' , device_ids = [0,1,2,3]
-    model = torch.nn.DataParallel(Network(channels=128), device_ids=device_ids)
-    model = model.cuda(device=device_ids[0])
+    # one process per device under torchrun, a single process otherwise
+    rank, world_size, device = init_distributed(opt.backend)
+    assert opt.batchsize % world_size == 0, 'batchsize must be divisible by the number of ranks'
+    amp_dtype = AMP_DTYPES[opt.amp]
+    scaler = torch.amp.GradScaler(device.type, enabled=opt.amp == 'fp16')
+
+    # build the model; rank 0 fetches the encoder weights first, the others read the cache.
+    # With --load the checkpoint holds the encoder weights, only the architecture is built
+    with main_first():
+        model = Network(channels=128, encoder_path=opt.encoder_path, cache_dir=opt.cache_dir,
+                        checkpoint_stages=opt.checkpoint, pretrained=opt.load is None)
+    if opt.sync_bn and world_size > 1:
+        model = torch.nn.SyncBatchNorm.convert_sync_batchnorm(model)
+    model = model.to(device)
+    if opt.compile:
+        # stages compile in place, before DDP wraps the model (see lib.compilation)
+        compile_network(model, encoder=not opt.compile_decoder_only, exclude=NO_BACKWARD)
+    if world_size > 1:
+        # the encoder's classification head is never used, hence find_unused_parameters
+        model = DistributedDataParallel(model, device_ids=[device.index] if device.type == 'cuda' else None,
+                                        find_unused_parameters=True)
 
     
     # # 计算 FLOPs 和参数数量
@@ -189,53 +228,99 @@ if __name__ == '__main__':
     #     print(f"FLOPs: {flops}")
     #     print(f"Params: {params}")
 
-    # if opt.load is not None:
-    #     model.load_state_dict(torch.load(opt.load))
-    #     print('load model from ', opt.load)
-
     optimizer = torch.optim.Adam(model.parameters(), opt.lr)
+    criterion = DeepSupervisionLoss().to(device)
     save_path = opt.save_path
-    if not os.path.exists(save_path):
+    if is_main() and not os.path.exists(save_path):
         os.makedirs(save_path)
     
+    with main_first():
+        if is_main() and opt.train_cache is not None and not os.path.exists(cache_files(opt.train_cache)[1]):
+            print('Building training cache {} ...'.format(opt.train_cache))
+            build_cache(opt.train_root + 'Imgs/', opt.train_root + 'GT/',
+                        opt.train_root + 'Edge/' if 'edge' in TARGETS else None, opt.train_cache)
     train_loader = get_loader(image_root=opt.train_root + 'Imgs/',
                               gt_root=opt.train_root + 'GT/',
                               edge_root=opt.train_root + 'Edge/',
-                              batchsize=opt.batchsize,
+                              batchsize=opt.batchsize // world_size,
                               trainsize=opt.trainsize,
-                              num_workers=16)
-    val_loader = test_dataset(image_root=opt.val_root + 'Imgs/',
-                              gt_root=opt.val_root + 'GT/',
-                              testsize=opt.trainsize)
+                              num_workers=16 // world_size if world_size > 1 else 16,
+                              cache_path=opt.train_cache,
+                              augment=not opt.batch_aug,
+                              work_size=opt.work_size,
+                              targets=TARGETS,
+                              distributed=world_size > 1)
+    val_loader = get_eval_loader(image_root=opt.val_root + 'Imgs/',
+                                 gt_root=opt.val_root + 'GT/',
+                                 testsize=opt.trainsize,
+                                 batchsize=opt.val_batchsize,
+                                 num_workers=4,
+                                 rank=rank,
+                                 world_size=world_size)
+    metrics = CODMetrics(device)
     total_step = len(train_loader)
 
 
-    # logging
-    logging.basicConfig(filename=save_path + 'log.log',
-                        format='[%(asctime)s-%(filename)s-%(levelname)s:%(message)s]',
-                        level=logging.INFO, filemode='a', datefmt='%Y-%m-%d %I:%M:%S %p')
-    logging.info("Network-Train")
-    logging.info('Config: epoch: {}; lr: {}; batchsize: {}; trainsize: {}; clip: {}; decay_rate: {}; load: {}; '
-                 'save_path: {}; decay_epoch: {}'.format(opt.epoch, opt.lr, opt.batchsize, opt.trainsize, opt.clip,
-                                                         opt.decay_rate, opt.load, save_path, opt.decay_epoch))
+    # logging, rank 0 only (logging.info on the other ranks goes to an unconfigured root logger)
+    writer = None
+    if is_main():
+        logging.basicConfig(filename=save_path + 'log.log',
+                            format='[%(asctime)s-%(filename)s-%(levelname)s:%(message)s]',
+                            level=logging.INFO, filemode='a', datefmt='%Y-%m-%d %I:%M:%S %p')
+        logging.info("Network-Train")
+        logging.info('Config: epoch: {}; lr: {}; batchsize: {}; trainsize: {}; clip: {}; decay_rate: {}; load: {}; '
+                     'save_path: {}; decay_epoch: {}; world_size: {}'.format(
+                         opt.epoch, opt.lr, opt.batchsize, opt.trainsize, opt.clip, opt.decay_rate, opt.load,
+                         save_path, opt.decay_epoch, world_size))
+        writer = SummaryWriter(save_path + 'summary')
+    telemetry = Telemetry(writer, log_every=opt.log_every, image_every=opt.image_every, enabled=is_main())
 
     step = 0
-    writer = SummaryWriter(save_path + 'summary')
-    best_mae = 1
+    best_score = None
     best_epoch = 0
+    start_epoch = 1
     
     # learning rate schedule
     cosine_schedule = optim.lr_scheduler.CosineAnnealingLR(optimizer=optimizer, T_max=30, eta_min=1e-6)
-    print("Start train...")
-    for epoch in range(1, opt.epoch):
+
+    # Net_resume.pth restores the optimizer moments, schedule, counters and (on rank 0) the
+    # RNG streams behind data order and augmentation; a weights-only .pth just the model
+    if opt.load is not None:
+        counters = resume_training(opt.load, model, optimizer, cosine_schedule, scaler, restore_rng=is_main())
+        if counters is not None:
+            start_epoch = counters['epoch'] + 1
+            # checkpoints from before --select_metric store best_mae and no metric name
+            best_score = counters.get('best_score', counters.get('best_mae'))
+            step, best_epoch = counters['step'], counters['best_epoch']
+            if counters.get('select_metric', 'mae') != opt.select_metric:
+                # the best so far was picked by another metric, start the selection over
+                best_score, best_epoch = None, 0
+        if is_main():
+            print('load model from {}, starting at epoch {}'.format(opt.load, start_epoch))
+            logging.info('load model from {}, starting at epoch {}'.format(opt.load, start_epoch))
+    # checkpoints are written by a background thread, training only waits for the host copy
+    checkpointer = AsyncCheckpointer()
+
+    if is_main():
+        print("Start train...")
+    for epoch in range(start_epoch, opt.epoch):
 
         cur_lr = adjust_lr(optimizer, opt.lr, epoch, opt.decay_rate, opt.decay_epoch)
-        writer.add_scalar('learning_rate', cur_lr, global_step=epoch)
 
         cosine_schedule.step()
-        writer.add_scalar('learning_rate', cosine_schedule.get_last_lr()[0], global_step=epoch)
-        logging.info('>>> current lr: {}'.format(cosine_schedule.get_last_lr()[0]))
+        if is_main():
+            writer.add_scalar('learning_rate', cur_lr, global_step=epoch)
+            writer.add_scalar('learning_rate', cosine_schedule.get_last_lr()[0], global_step=epoch)
+            logging.info('>>> current lr: {}'.format(cosine_schedule.get_last_lr()[0]))
         
         train(train_loader, model, optimizer, epoch, save_path, writer)
         val(val_loader, model, epoch, save_path, writer)
+        if is_main():
+            checkpointer.save(training_state(model, optimizer, cosine_schedule, scaler, epoch=epoch, step=step,
+                                             best_score=best_score, best_epoch=best_epoch,
+                                             select_metric=opt.select_metric),
+                              save_path + 'Net_resume.pth')
+    checkpointer.close()
+    telemetry.close()
+    cleanup()
 
@@ -0,0 +1,33 @@
+import torch
+import argparse
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+from lib.checkpoint import load_checkpoint
+from utils.video import VideoPredictor, read_frames
+from utils.utils import AMP_DTYPES
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--source', type=str, required=True, help='video file, camera index or directory of frames')
+parser.add_argument('--pth_path', type=str, default='', help='.pth or converted .safetensors checkpoint')
+parser.add_argument('--save_path', type=str, default=None, help='directory for per-frame PNG masks')
+parser.add_argument('--video_out', type=str, default=None, help='.mp4 of the masks')
+parser.add_argument('--fps', type=float, default=25.0, help='frame rate of --video_out')
+parser.add_argument('--testsize', type=int, default=416, help='testing size (multiple of 32)')
+parser.add_argument('--batchsize', type=int, default=8, help='frames per batch')
+parser.add_argument('--threshold', type=float, default=0.0,
+                    help='mean abs change (0-1) from the last keyframe below which a frame reuses its mask (0: off)')
+parser.add_argument('--max_gap', type=int, default=10, help='force a keyframe after this many reused frames')
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='cuda or cpu')
+parser.add_argument('--amp', type=str, default='none', choices=list(AMP_DTYPES), help='mixed precision inference')
+parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME, help='hub id or local snapshot dir of the encoder')
+parser.add_argument('--cache_dir', type=str, default=None, help='pinned huggingface cache dir')
+opt = parser.parse_args()
+
+model = Network(channels=128, pretrained=False, encoder_path=opt.encoder_path, cache_dir=opt.cache_dir)
+load_checkpoint(model, opt.pth_path, device=opt.device)
+predictor = VideoPredictor(model, testsize=opt.testsize, batch_size=opt.batchsize, device=opt.device,
+                           amp_dtype=AMP_DTYPES[opt.amp], threshold=opt.threshold, max_gap=opt.max_gap)
+stats = predictor.run(read_frames(opt.source), save_path=opt.save_path, video_out=opt.video_out, fps=opt.fps,
+                      verbose=True)
+print('> {} frames ({} keyframes) in {:.2f}s, {:.2f} fps'.format(
+    stats['frames'], stats['keyframes'], stats['seconds'], stats['fps']))
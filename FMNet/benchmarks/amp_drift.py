@@ -0,0 +1,78 @@
+"""
+Mixed-precision drift and cost of the decoder stages: fp32 vs autocast outputs, a
+bf16/fp16 training step with finite gradients, and time / peak memory per stage.
+Runs on CPU with bf16 autocast by default.
+
+    python -m benchmarks.amp_drift --batchsize 2
+    python -m benchmarks.amp_drift --device cuda --dtype fp16
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import peak_memory, timeit
+from lib.modules import MFM, PFAE, FRD_3
+from utils.utils import AMP_DTYPES
+
+# (dim, resolution, mlp_ratio) of MFM_5 .. MFM_2 in Network with channels=128
+STAGES = [(512 + 128, 13, 4), (256 + 128, 26, 4), (128 + 128, 52, 8), (64 + 128, 104, 8)]
+
+
+def relative_error(ref, out):
+    return ((ref - out.float()).abs().max() / ref.abs().max().clamp_min(1e-6)).item()
+
+
+def report(name, module, inputs, opt):
+    device = torch.device(opt.device)
+    dtype = AMP_DTYPES[opt.dtype]
+    module = module.to(device).eval()
+    inputs = [x.to(device) for x in inputs]
+
+    def amp():
+        with torch.autocast(device.type, dtype=dtype):
+            return module(*inputs)
+
+    with torch.no_grad():
+        ref, out = module(*inputs), amp()
+        assert torch.isfinite(out).all(), '{}: non-finite output under {}'.format(name, opt.dtype)
+        err = relative_error(ref, out)
+        assert err < opt.rtol, '{}: relative drift {:.2e}'.format(name, err)
+        t_fp32 = timeit(lambda: module(*inputs), opt.iters, device=device)
+        t_amp = timeit(amp, opt.iters, device=device)
+        m_fp32 = peak_memory(lambda: module(*inputs), device)
+        m_amp = peak_memory(amp, device)
+
+    # one training step: forward under autocast, fp32 loss, gradients must stay finite
+    module.train()
+    with torch.autocast(device.type, dtype=dtype):
+        out = module(*inputs)
+    out.float().square().mean().backward()
+    for param_name, param in module.named_parameters():
+        if param.grad is not None:
+            assert torch.isfinite(param.grad).all(), '{}: non-finite grad in {}'.format(name, param_name)
+
+    print('{}: drift {:.1e} | fp32 {:.2f} ms {:.1f} MB | {} {:.2f} ms {:.1f} MB'.format(
+        name, err, t_fp32 * 1e3, m_fp32 / 2 ** 20, opt.dtype, t_amp * 1e3, m_amp / 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--dtype', type=str, default='bf16', choices=['bf16', 'fp16'])
+    parser.add_argument('--rtol', type=float, default=5e-2, help='max error relative to the fp32 output range')
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    b = opt.batchsize
+    for dim, res, mlp_ratio in STAGES:
+        module = MFM(dim=dim, out_channel=128, input_resolution=(res, res), mlp_ratio=mlp_ratio, num_heads=8)
+        report('MFM {}x{}'.format(res, res), module, [torch.randn(b, dim, res, res)], opt)
+    report('PFAE 13x13', PFAE(512, 128), [torch.randn(b, 512, 13, 13)], opt)
+    report('FRD_3 104x104', FRD_3(128, 128), [torch.randn(b, 128, 104, 104), torch.randn(b, 1, 52, 52),
+                                              torch.randn(b, 1, 26, 26), torch.randn(b, 1, 13, 13)], opt)
+
+
+if __name__ == '__main__':
+    main()
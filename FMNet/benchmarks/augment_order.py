@@ -0,0 +1,70 @@
+"""
+Per-sample augmentation cost with the original order (augment at source resolution, resize
+last) vs resize-before-augment (work_size), on a mix of source resolutions, and the
+salt-and-pepper noise both orders leave on blank masks: the energy (mean square, in [0, 1]^2)
+of the GT and the positive-pixel fraction of the thresholded edge map.
+
+    python -m benchmarks.augment_order --trainsize 416 --work_size 416
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from utils.data_val import PolypObjDataset
+
+SOURCES = [(640, 480), (1280, 720), (1920, 1080), (4000, 3000)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trainsize', type=int, default=416)
+    parser.add_argument('--work_size', type=int, default=416)
+    parser.add_argument('--iters', type=int, default=5)
+    opt = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        for sub in ('Imgs', 'GT', 'Edge'):
+            os.makedirs(os.path.join(root, sub))
+        for i, (w, h) in enumerate(SOURCES):
+            mask = Image.fromarray((rng.random((h, w)) > 0.7).astype(np.uint8) * 255)
+            Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(os.path.join(root, 'Imgs', '{}.jpg'.format(i)))
+            mask.save(os.path.join(root, 'GT', '{}.png'.format(i)))
+            mask.save(os.path.join(root, 'Edge', '{}.png'.format(i)))
+        modes = [(name, PolypObjDataset(root + '/Imgs/', root + '/GT/', root + '/Edge/', opt.trainsize, work_size=work_size))
+                 for name, work_size in (('augment first', None), ('resize first', opt.work_size))]
+        ds = modes[0][1]
+        samples = [(ds.rgb_loader(ds.images[i]), ds.binary_loader(ds.gts[i]), ds.binary_loader(ds.edges[i]))
+                   for i in range(len(ds))]
+
+    totals = dict.fromkeys((name for name, _ in modes), 0.0)
+    for (w, h), sample in zip(SOURCES, samples):
+        line = '{}x{}:'.format(w, h)
+        for name, ds in modes:
+            start = time.perf_counter()
+            for _ in range(opt.iters):
+                ds.augment_sample(*sample)
+            seconds = (time.perf_counter() - start) / opt.iters
+            totals[name] += seconds
+            line += ' {} {:.1f} ms,'.format(name, seconds * 1e3)
+        print(line.rstrip(','))
+    print('mixed-size mean:' + ','.join(' {} {:.1f} ms'.format(k, v / len(SOURCES) * 1e3) for k, v in totals.items()))
+
+    # salt is the only non-zero content of augmented blank maps (crop and rotation pad with 0)
+    for (w, h), (image, _, _) in zip(SOURCES, samples):
+        blank = Image.new('L', (w, h))
+        line = '{}x{} noise:'.format(w, h)
+        for name, ds in modes:
+            outputs = [ds.augment_sample(image, blank, blank) for _ in range(opt.iters)]
+            energy = np.mean([gt.square().mean().item() for _, gt, _ in outputs])
+            positive = np.mean([edge.mean().item() for _, _, edge in outputs])
+            line += ' {} GT energy {:.2e} edge positives {:.4f},'.format(name, energy, positive)
+        print(line.rstrip(','))
+
+
+if __name__ == '__main__':
+    main()
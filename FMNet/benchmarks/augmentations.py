@@ -0,0 +1,87 @@
+"""
+Per-augmentation CPU time of the vectorized randomPeper / randomGaussian against the old
+per-pixel Python loops, with a check that the noise statistics are unchanged.
+
+    python -m benchmarks.augmentations --sizes 480x640 1500x2000 3000x4000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from PIL import Image
+
+from utils.data_val import randomGaussian, randomPeper
+
+
+def legacy_peper(img):
+    img = np.array(img)
+    noiseNum = int(0.0015 * img.shape[0] * img.shape[1])
+    for i in range(noiseNum):
+        randX = random.randint(0, img.shape[0] - 1)
+        randY = random.randint(0, img.shape[1] - 1)
+        if random.randint(0, 1) == 0:
+            img[randX, randY] = 0
+        else:
+            img[randX, randY] = 255
+    return Image.fromarray(img)
+
+
+def legacy_gaussian(image, mean=0.1, sigma=0.35):
+    img = np.asarray(image)
+    width, height = img.shape
+    im = img[:].flatten()
+    for _i in range(len(im)):
+        im[_i] += random.gauss(mean, sigma)
+    return Image.fromarray(np.uint8(im.reshape([width, height])))
+
+
+def per_call(fn, *args, iters=3):
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn(*args)
+    return (time.perf_counter() - start) / iters
+
+
+def noise_stats(src, out):
+    src, out = np.asarray(src, np.int16), np.asarray(out, np.int16)
+    changed = out != src
+    return changed.mean(), (out[changed] == 255).mean() if changed.any() else 0.0
+
+
+def parse_size(text):
+    h, _, w = text.partition('x')
+    return int(h), int(w or h)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(480, 640), (1500, 2000)])
+    parser.add_argument('--skip_legacy_gaussian', action='store_true', help='the old loop takes minutes on large images')
+    opt = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    random.seed(0)
+    for h, w in opt.sizes:
+        # mid-grey so that salt and pepper are both visible
+        gt = Image.fromarray(np.full((h, w), 128, np.uint8))
+        legacy, new = per_call(legacy_peper, gt), per_call(randomPeper, gt, rng)
+        old_frac, old_salt = noise_stats(gt, legacy_peper(gt))
+        new_frac, new_salt = noise_stats(gt, randomPeper(gt, rng))
+        print('{}x{} randomPeper: {:.2f} ms -> {:.2f} ms ({:.0f}x) | noised {:.5f} vs {:.5f}, salt {:.3f} vs {:.3f}'.format(
+            h, w, legacy * 1e3, new * 1e3, legacy / new, old_frac, new_frac, old_salt, new_salt))
+
+        image = Image.fromarray(np.full((h, w), 128, np.uint8))
+        new = per_call(randomGaussian, image, 0.1, 0.35, rng)
+        new_mean = (np.asarray(randomGaussian(image, rng=rng), np.float64) - 128).mean()
+        if opt.skip_legacy_gaussian:
+            print('{}x{} randomGaussian: {:.2f} ms, mean shift {:.4f}'.format(h, w, new * 1e3, new_mean))
+            continue
+        legacy = per_call(legacy_gaussian, image, iters=1)
+        old_mean = (np.asarray(legacy_gaussian(image), np.float64) - 128).mean()
+        print('{}x{} randomGaussian: {:.2f} ms -> {:.2f} ms ({:.0f}x) | mean shift {:.4f} vs {:.4f}'.format(
+            h, w, legacy * 1e3, new * 1e3, legacy / new, old_mean, new_mean))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Per-sample PIL augmentation (PolypObjDataset.augment_sample) vs utils.batch_aug.batch_augment
+on a resized uint8 batch, both on already-decoded samples.
+
+    python -m benchmarks.batch_augment --batchsize 8 --trainsize 416 [--device cuda]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+from benchmarks.common import timeit
+from utils.batch_aug import batch_augment
+from utils.data_val import PolypObjDataset
+
+
+def synthetic_dataset(root, n, size, rng):
+    for sub in ('Imgs', 'GT', 'Edge'):
+        os.makedirs(os.path.join(root, sub))
+    for i in range(n):
+        mask = (rng.random(size) > 0.7).astype(np.uint8) * 255
+        Image.fromarray(rng.integers(0, 256, (*size, 3), dtype=np.uint8)).save(os.path.join(root, 'Imgs', '{}.png'.format(i)))
+        Image.fromarray(mask).save(os.path.join(root, 'GT', '{}.png'.format(i)))
+        Image.fromarray(mask).save(os.path.join(root, 'Edge', '{}.png'.format(i)))
+    return root + '/'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--trainsize', type=int, default=416)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--iters', type=int, default=5)
+    opt = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = synthetic_dataset(tmp, opt.batchsize, (opt.trainsize, opt.trainsize), rng)
+        pil = PolypObjDataset(root + 'Imgs/', root + 'GT/', root + 'Edge/', opt.trainsize)
+        raw = PolypObjDataset(root + 'Imgs/', root + 'GT/', root + 'Edge/', opt.trainsize, augment=False)
+        samples = [(pil.rgb_loader(pil.images[i]), pil.binary_loader(pil.gts[i]), pil.binary_loader(pil.edges[i]))
+                   for i in range(len(pil))]
+        batch = [torch.stack(t).to(opt.device) for t in zip(*(raw[i] for i in range(len(raw))))]
+
+    def per_sample():
+        for image, gt, edge in samples:
+            pil.augment_sample(image, gt, edge)
+
+    generator = torch.Generator().manual_seed(0)
+    per_sample_time = timeit(per_sample, opt.iters)
+    batched_time = timeit(lambda: batch_augment(*batch, generator=generator), opt.iters, device=opt.device)
+    print('batch of {} at {}x{}: per-sample PIL {:.1f} ms, batched on {} {:.1f} ms ({:.1f}x)'.format(
+        opt.batchsize, opt.trainsize, opt.trainsize, per_sample_time * 1e3, opt.device,
+        batched_time * 1e3, per_sample_time / batched_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Peak memory and time of one training step (forward, deep-supervision loss, backward) per
+activation-checkpointing configuration of Network, with a check that every configuration
+produces the same gradients and BatchNorm running stats as the plain one.
+
+    python -m benchmarks.checkpoint_memory --device cuda --batchsize 4 --trainsize 416
+    python -m benchmarks.checkpoint_memory --configs none MFM_2 MFM_2,MFM_3 all
+"""
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from benchmarks.common import peak_memory, timeit
+from lib.FMNet import Network
+from lib.encoder import ENCODER_NAME
+
+
+def parse_config(config):
+    if config == 'none':
+        return ()
+    if config == 'all':
+        return Network.CHECKPOINT_STAGES
+    if config == 'MFM':
+        return ('MFM_5', 'MFM_4', 'MFM_3', 'MFM_2')
+    return tuple(config.split(','))
+
+
+def step(model, images, gts):
+    model.zero_grad(set_to_none=True)
+    preds = model(images)
+    loss = sum(F.binary_cross_entropy_with_logits(pred, gts) for pred in preds)
+    loss.backward()
+
+
+def gradients(model):
+    return {name: param.grad.clone() for name, param in model.named_parameters() if param.grad is not None}
+
+
+def bn_stats(model):
+    return {name: buffer.clone() for name, buffer in model.named_buffers()
+            if name.rsplit('.', 1)[-1] in ('running_mean', 'running_var', 'num_batches_tracked')}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--configs', type=str, nargs='+', default=['none', 'MFM_2', 'MFM_2,MFM_3', 'MFM', 'all'],
+                        help="'none', 'all', 'MFM' or comma-separated stage names")
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batchsize', type=int, default=2)
+    parser.add_argument('--trainsize', type=int, default=416)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME)
+    parser.add_argument('--cache_dir', type=str, default=None)
+    parser.add_argument('--pretrained', action='store_true', help='load encoder weights (only the config is needed)')
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = Network(channels=128, pretrained=opt.pretrained, init=not opt.pretrained, encoder_path=opt.encoder_path,
+                    cache_dir=opt.cache_dir).to(opt.device).train()
+    images = torch.randn(opt.batchsize, 3, opt.trainsize, opt.trainsize, device=opt.device)
+    gts = (torch.rand(opt.batchsize, 1, opt.trainsize, opt.trainsize, device=opt.device) > 0.5).float()
+    # every configuration steps from the same BatchNorm running stats; they do not affect
+    # training-mode outputs, but one step must move them exactly as the plain run does
+    initial = bn_stats(model)
+    reference = None
+
+    for config in opt.configs:
+        model.checkpoint_stages = frozenset(parse_config(config))
+        model.load_state_dict(initial, strict=False)
+        step(model, images, gts)
+        grads, stats = gradients(model), bn_stats(model)
+        if reference is None:
+            reference = grads, stats
+        for name, grad in reference[0].items():
+            assert torch.allclose(grad, grads[name], rtol=1e-4, atol=1e-5), '{}: gradient of {} differs'.format(
+                config, name)
+        for name, buffer in reference[1].items():
+            assert torch.allclose(buffer, stats[name], rtol=1e-4, atol=1e-6), '{}: BatchNorm {} differs'.format(
+                config, name)
+        seconds = timeit(lambda: step(model, images, gts), opt.iters, warmup=1, device=opt.device)
+        peak = peak_memory(lambda: step(model, images, gts), opt.device)
+        print('{:<24s} peak {:8.1f} MB | step {:8.1f} ms'.format(config, peak / 2 ** 20, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
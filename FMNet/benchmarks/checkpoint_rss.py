@@ -0,0 +1,56 @@
+"""
+Peak RSS of one inference worker loading a checkpoint: the old torch.load + prefix-stripped
+copy vs lib.checkpoint.load_checkpoint (mmap / safetensors). Each mode runs in a fresh process.
+
+    python -m benchmarks.checkpoint_rss --pth_path Net_epoch_best.pth [--safetensors Net_epoch_best.safetensors]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+
+import torch
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker(mode, path, device):
+    from lib.FMNet import Network
+    from lib.checkpoint import load_checkpoint
+
+    model = Network(channels=128, pretrained=False)
+    built = peak_rss_mb()
+    if mode == 'legacy':
+        model.load_state_dict({k.replace('module.', ''): v for k, v in torch.load(path, map_location='cpu').items()})
+        model.to(device)
+    else:
+        load_checkpoint(model, path, device=device)
+    print('{:.1f} {:.1f}'.format(built, peak_rss_mb()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pth_path', type=str, required=True)
+    parser.add_argument('--safetensors', type=str, default=None)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--worker', type=str, default=None, help=argparse.SUPPRESS)
+    opt = parser.parse_args()
+
+    if opt.worker is not None:
+        worker(opt.worker, opt.safetensors if opt.worker == 'safetensors' else opt.pth_path, opt.device)
+        return
+
+    modes = ['legacy', 'mmap'] + (['safetensors'] if opt.safetensors else [])
+    for mode in modes:
+        cmd = [sys.executable, '-m', 'benchmarks.checkpoint_rss', '--pth_path', opt.pth_path,
+               '--device', opt.device, '--worker', mode]
+        if opt.safetensors:
+            cmd += ['--safetensors', opt.safetensors]
+        built, peak = map(float, subprocess.check_output(cmd).split())
+        print('{}: model {:.1f} MB, after load {:.1f} MB, checkpoint cost {:.1f} MB'.format(mode, built, peak, peak - built))
+
+
+if __name__ == '__main__':
+    main()
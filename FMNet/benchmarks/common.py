@@ -0,0 +1,43 @@
+import time
+
+import torch
+
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def timeit(fn, iters, warmup=2, device='cpu'):
+    """Mean seconds per call of fn()."""
+    for _ in range(warmup):
+        fn()
+    synchronize(device)
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    synchronize(device)
+    return (time.perf_counter() - start) / iters
+
+
+def peak_memory(fn, device='cpu'):
+    """
+    Peak bytes allocated by torch while running fn() once, above what was live before.
+    CUDA uses the allocator statistics; CPU replays the profiler's allocation events.
+    """
+    if torch.device(device).type == 'cuda':
+        synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        base = torch.cuda.memory_allocated(device)
+        fn()
+        synchronize(device)
+        return torch.cuda.max_memory_allocated(device) - base
+
+    with torch.autograd.profiler.profile(profile_memory=True) as prof:
+        fn()
+    live = peak = 0
+    for event in sorted(prof.function_events, key=lambda e: e.time_range.start):
+        # allocations are attributed to the op that made them, frees show up as '[memory]'
+        live += event.self_cpu_memory_usage
+        peak = max(peak, live)
+    return peak
@@ -0,0 +1,95 @@
+"""
+torch.compile of Network (lib.compilation): the graph-break report per module, then for
+inference and for a training step (forward + DeepSupervisionLoss + backward, with PFAE
+left eager, see lib.compilation.NO_BACKWARD) the one-off compile time and the steady-state
+time of eager, compiled decoder and compiled decoder + encoder, with outputs / gradients
+checked against eager.
+
+    python -m benchmarks.compile --device cpu --size 256 --batchsize 2
+"""
+import argparse
+import copy
+import time
+
+import torch
+import torch._dynamo as dynamo
+
+from benchmarks.common import synchronize, timeit
+from lib.FMNet import Network
+from lib.compilation import NO_BACKWARD, compile_network, graph_break_report
+from utils.losses import DeepSupervisionLoss
+
+CONFIGS = (('eager', None), ('decoder', False), ('decoder+encoder', True))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--batchsize', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--tasks', type=str, nargs='+', default=['inference', 'train'], choices=['inference', 'train'])
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    base = Network(channels=128, pretrained=False, init=True).to(opt.device)
+    images = torch.randn(opt.batchsize, 3, opt.size, opt.size, device=opt.device)
+    gts = (torch.rand(opt.batchsize, 1, opt.size, opt.size, device=opt.device) > 0.5).float()
+    criterion = DeepSupervisionLoss().to(opt.device)
+
+    for name, (graphs, reasons) in graph_break_report(base.eval(), images).items():
+        print('{:<16s} {} graph(s), {} break(s)'.format(name, graphs, len(reasons)))
+        for reason, where in reasons:
+            print('    {}: {}'.format(where, reason))
+
+    def infer(model):
+        with torch.no_grad():
+            return model(images, return_all=False)
+
+    def train_step(model, x=images):
+        model.zero_grad(set_to_none=True)
+        loss = criterion(model(x), gts)[0]
+        loss.backward()
+        return loss.detach()
+
+    def flat_grads(model):
+        return torch.cat([p.grad.flatten() for p in model.parameters() if p.grad is not None])
+
+    tasks = [(task, fn, training) for task, fn, training in (('inference', infer, False), ('train', train_step, True))
+             if task in opt.tasks]
+    for task, fn, training in tasks:
+        reference = tolerance = None
+        for config, encoder in CONFIGS:
+            dynamo.reset()
+            model = copy.deepcopy(base).train(training)
+            if encoder is not None:
+                compile_network(model, encoder=encoder, exclude=NO_BACKWARD if training else ())
+            synchronize(opt.device)
+            start = time.perf_counter()
+            out = fn(model)
+            synchronize(opt.device)
+            first = time.perf_counter() - start
+            grads = flat_grads(model) if training else None
+            if reference is None:
+                reference = (out, grads)
+                if training:
+                    # fp32 noise floor of eager itself: the same step in channels_last only
+                    # reorders reductions. Errors are relative to all gradients together, conv
+                    # biases ahead of train-mode BatchNorm have gradients that are 0 up to noise.
+                    other = copy.deepcopy(base).train().to(memory_format=torch.channels_last)
+                    train_step(other, images.contiguous(memory_format=torch.channels_last))
+                    floor = ((flat_grads(other) - grads).norm() / grads.norm()).item()
+                    tolerance = max(2 * floor, 1e-4)
+                    print('train      eager fp32 noise floor (channels_last vs contiguous): {:.1e}'.format(floor))
+            else:
+                assert torch.allclose(out, reference[0], rtol=1e-4, atol=1e-4), '{} {}: output differs'.format(task, config)
+                if training:
+                    error = ((grads - reference[1]).norm() / reference[1].norm()).item()
+                    assert error < tolerance, '{} {}: gradients differ by {:.1e}'.format(task, config, error)
+                    print('train      {:<16s} gradient error {:.1e}'.format(config, error))
+            seconds = timeit(lambda: fn(model), opt.iters, warmup=1, device=opt.device)
+            print('{:<10s} {:<16s} first call {:7.1f} s | steady {:8.1f} ms'.format(task, config, first, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Training-set start-up and per-epoch loading time, from the image folders vs a packed cache.
+
+    python -m benchmarks.data_loading --train_root TrainDataset/ --cache_path /tmp/cod_train --num_workers 16
+"""
+import argparse
+import os
+import time
+
+from utils.data_cache import build_cache, cache_files
+from utils.data_val import get_loader
+
+
+def epoch(opt, cache_path):
+    start = time.perf_counter()
+    loader = get_loader(image_root=opt.train_root + 'Imgs/', gt_root=opt.train_root + 'GT/',
+                        edge_root=opt.train_root + 'Edge/', batchsize=opt.batchsize, trainsize=opt.trainsize,
+                        num_workers=opt.num_workers, cache_path=cache_path)
+    built = time.perf_counter()
+    samples = 0
+    for images, gts, edges in loader:
+        samples += images.shape[0]
+    done = time.perf_counter()
+    return built - start, done - built, samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train_root', type=str, required=True)
+    parser.add_argument('--cache_path', type=str, required=True)
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--trainsize', type=int, default=416)
+    parser.add_argument('--num_workers', type=int, default=4)
+    opt = parser.parse_args()
+
+    if not os.path.exists(cache_files(opt.cache_path)[1]):
+        start = time.perf_counter()
+        build_cache(opt.train_root + 'Imgs/', opt.train_root + 'GT/', opt.train_root + 'Edge/', opt.cache_path)
+        print('cache built once in {:.2f}s'.format(time.perf_counter() - start))
+
+    for name, cache_path in (('folders', None), ('packed cache', opt.cache_path)):
+        startup, seconds, samples = epoch(opt, cache_path)
+        print('{}: start-up {:.2f}s, epoch {:.2f}s, {:.1f} samples/s'.format(name, startup, seconds, samples / seconds))
+
+
+if __name__ == '__main__':
+    main()
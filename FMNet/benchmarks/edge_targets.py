@@ -0,0 +1,39 @@
+"""
+Per-sample loading + augmentation cost with and without the edge target.
+
+    python -m benchmarks.edge_targets --train_root TrainDataset/ --samples 200
+"""
+import argparse
+import time
+
+from utils.data_val import PolypObjDataset
+
+
+def per_sample(opt, targets):
+    dataset = PolypObjDataset(opt.train_root + 'Imgs/', opt.train_root + 'GT/', opt.train_root + 'Edge/',
+                              opt.trainsize, targets=targets)
+    count = min(opt.samples, len(dataset))
+    dataset[0]
+    start = time.perf_counter()
+    for i in range(count):
+        sample = dataset[i]
+    elapsed = time.perf_counter() - start
+    assert len(sample) == 1 + len(targets)
+    return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train_root', type=str, required=True)
+    parser.add_argument('--trainsize', type=int, default=416)
+    parser.add_argument('--samples', type=int, default=200)
+    opt = parser.parse_args()
+
+    with_edge = per_sample(opt, ('gt', 'edge'))
+    without_edge = per_sample(opt, ('gt',))
+    print('gt+edge: {:.2f} ms/sample'.format(with_edge * 1e3))
+    print('gt only: {:.2f} ms/sample ({:.0%} less)'.format(without_edge * 1e3, 1 - without_edge / with_edge))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Eager Network vs its captured artifacts (lib.export): TorchScript trace, frozen trace and
+torch.export. Each artifact is saved, reloaded in a fresh interpreter that never imports
+the model code and checked against eager outputs on new inputs, then timed.
+
+    python -m benchmarks.export --device cpu --size 416 --batchsize 1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import torch
+
+from benchmarks.common import timeit
+from lib.FMNet import Network
+from lib.checkpoint import load_checkpoint
+from lib.export import export_network, load_exported
+
+# run by a separate interpreter: loads the artifact with torch only and replays the inputs
+STANDALONE = '''
+import sys, torch
+path, inputs, outputs = sys.argv[1:]
+module = torch.export.load(path).module() if path.endswith('.pt2') else torch.jit.load(path)
+with torch.no_grad():
+    torch.save([module(x) for x in torch.load(inputs)], outputs)
+assert not any(name == 'lib' or name.startswith('lib.') for name in sys.modules), 'model code was imported'
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--batchsize', type=int, default=1)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--pth_path', type=str, default=None)
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = Network(channels=128, pretrained=False, init=opt.pth_path is None)
+    if opt.pth_path is not None:
+        load_checkpoint(model, opt.pth_path)
+    model.to(opt.device).eval()
+    shape = (opt.batchsize, 3, opt.size, opt.size)
+    inputs = [torch.randn(*shape, device=opt.device) for _ in range(3)]
+    with torch.no_grad():
+        expected = [model(x, return_all=False) for x in inputs]
+        eager = timeit(lambda: model(inputs[0], return_all=False), opt.iters, device=opt.device)
+    print('{:<14s} {:8.1f} ms'.format('eager', eager * 1e3))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        torch.save(inputs, os.path.join(tmp, 'inputs.pt'))
+        for name, method, freeze, suffix in (('trace', 'trace', False, '.pt'), ('trace+freeze', 'trace', True, '.pt'),
+                                             ('torch.export', 'export', False, '.pt2')):
+            path = os.path.join(tmp, name + suffix)
+            export_network(model, shape, path, method=method, freeze=freeze, device=opt.device)
+            outputs = os.path.join(tmp, name + '.out')
+            subprocess.run([sys.executable, '-c', STANDALONE, path, os.path.join(tmp, 'inputs.pt'), outputs],
+                           check=True, cwd=tmp)
+            diff = max((a - b).abs().max().item() for a, b in zip(torch.load(outputs), expected))
+            assert diff < opt.atol, '{}: max abs diff {:.2e}'.format(name, diff)
+            module, captured = load_exported(path, device=opt.device)
+            assert captured == shape
+            with torch.no_grad():
+                seconds = timeit(lambda: module(inputs[0]), opt.iters, device=opt.device)
+            print('{:<14s} {:8.1f} ms ({:.2f}x eager), max abs diff {:.1e}'.format(
+                name, seconds * 1e3, eager / seconds, diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Per-call overhead of the old `shared_encoder.cuda().train()` re-placement in Network.forward.
+
+    python -m benchmarks.forward_overhead --device cpu --sizes 224 416
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import timeit
+from lib.FMNet import Network
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[224, 416])
+    parser.add_argument('--iters', type=int, default=10)
+    opt = parser.parse_args()
+
+    model = Network(channels=128, pretrained=False, init=True).to(opt.device).eval()
+    encoder = model.shared_encoder
+
+    def replace_encoder():
+        # what every forward used to do before touching the image
+        encoder.to(opt.device).eval()
+
+    walk = timeit(replace_encoder, opt.iters * 10)
+    print('encoder re-placement: {:.3f} ms/call ({} parameters)'.format(
+        walk * 1e3, sum(1 for _ in encoder.parameters())))
+
+    for size in opt.sizes:
+        image = torch.randn(1, 3, size, size, device=opt.device)
+
+        def forward():
+            with torch.no_grad():
+                model(image)
+
+        def legacy_forward():
+            replace_encoder()
+            forward()
+
+        before = timeit(legacy_forward, opt.iters, device=opt.device)
+        after = timeit(forward, opt.iters, device=opt.device)
+        print('{}x{}: before {:.2f} ms, after {:.2f} ms, overhead removed {:.2f} ms ({:.1f}%)'.format(
+            size, size, before * 1e3, after * 1e3, (before - after) * 1e3, 100 * (before - after) / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+DeepSupervisionLoss vs the five structure_loss calls + cal_ual Train.py used to sum:
+loss and gradient equivalence, then time and peak memory of forward + backward.
+
+    python -m benchmarks.fused_loss --batchsize 8 --size 416
+"""
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from benchmarks.common import peak_memory, timeit
+from utils.losses import DeepSupervisionLoss, box_mean, structure_loss
+from utils.utils import cal_ual
+
+WEIGHTS = (0.0625, 0.125, 0.25, 0.5, 1.0)
+
+
+def reference(preds, gts, ual_coef):
+    loss_init = sum(structure_loss(pred, gts) * w for pred, w in zip(preds[:-1], WEIGHTS[:-1]))
+    loss_final = structure_loss(preds[-1], gts)
+    return loss_init + loss_final + 2 * cal_ual(seg_logits=preds[-1], seg_gts=gts) * ual_coef
+
+
+def gradients(loss_fn, logits, gts):
+    preds = [p.clone().requires_grad_() for p in logits]
+    loss = loss_fn(preds, gts)
+    loss.backward()
+    return loss.detach(), [p.grad for p in preds]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    shape = (opt.batchsize, 1, opt.size, opt.size)
+    # a blurred random blob is closer to a real mask than white noise
+    gts = (F.avg_pool2d(torch.rand(shape), 31, 1, 15) > 0.5).float().to(opt.device)
+    logits = [torch.randn(shape, device=opt.device) * 3 for _ in WEIGHTS]
+    ual_coef = 0.7
+
+    assert torch.allclose(box_mean(gts, 15), F.avg_pool2d(gts, 31, 1, 15), atol=1e-6)
+    criterion = DeepSupervisionLoss().to(opt.device)
+    fused = lambda preds, gts: criterion(preds, gts, ual_coef=ual_coef)[0]
+    summed = lambda preds, gts: reference(preds, gts, ual_coef)
+
+    loss_ref, grads_ref = gradients(summed, logits, gts)
+    loss_fused, grads_fused = gradients(fused, logits, gts)
+    assert torch.allclose(loss_ref, loss_fused, rtol=1e-5), (loss_ref.item(), loss_fused.item())
+    for k, (a, b) in enumerate(zip(grads_ref, grads_fused)):
+        assert torch.allclose(a, b, rtol=1e-4, atol=1e-9), 'gradient of output {} differs'.format(k)
+
+    t_ref = timeit(lambda: gradients(summed, logits, gts), opt.iters, device=opt.device)
+    t_fused = timeit(lambda: gradients(fused, logits, gts), opt.iters, device=opt.device)
+    m_ref = peak_memory(lambda: gradients(summed, logits, gts), opt.device)
+    m_fused = peak_memory(lambda: gradients(fused, logits, gts), opt.device)
+    print('loss {:.6f} vs {:.6f}, gradients match'.format(loss_ref.item(), loss_fused.item()))
+    print('5x structure_loss + cal_ual: {:.2f} ms {:.1f} MB | DeepSupervisionLoss: {:.2f} ms {:.1f} MB'.format(
+        t_ref * 1e3, m_ref / 2 ** 20, t_fused * 1e3, m_fused / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Load generator for Serve.py: `--concurrency` clients on keep-alive connections POST images
+to /predict until `--requests` have completed, then client-side latency percentiles and
+throughput are printed next to the server's /metrics.
+
+    python Serve.py --pth_path Net_epoch_best.pth --max_batch_size 8 --max_wait_ms 5 &
+    python -m benchmarks.load_generator --port 8000 --concurrency 16 --requests 512 --image_dir data/Imgs/
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+async def call(reader, writer, method, path, body=b''):
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(
+        method, path, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(host, port, payloads, counter, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter[0] > 0:
+            counter[0] -= 1
+            body = payloads[counter[0] % len(payloads)]
+            start = time.perf_counter()
+            status, mask = await call(reader, writer, 'POST', '/predict', body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200 or cv2.imdecode(np.frombuffer(mask, np.uint8), cv2.IMREAD_GRAYSCALE) is None:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def load_payloads(image_dir, count, size):
+    if image_dir:
+        names = sorted(f for f in os.listdir(image_dir) if f.endswith('.jpg') or f.endswith('.png'))[:count]
+        return [open(os.path.join(image_dir, name), 'rb').read() for name in names]
+    rng = np.random.default_rng(0)
+    return [cv2.imencode('.jpg', rng.integers(0, 256, (size, size, 3), dtype=np.uint8))[1].tobytes()
+            for _ in range(count)]
+
+
+async def main(opt):
+    payloads = load_payloads(opt.image_dir, opt.images, opt.size)
+    counter, latencies, errors = [opt.requests], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(opt.host, opt.port, payloads, counter, latencies, errors)
+                           for _ in range(opt.concurrency)])
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(opt.host, opt.port)
+    _, metrics = await call(reader, writer, 'GET', '/metrics')
+    writer.close()
+
+    latencies = np.array(latencies) * 1e3
+    print('client: {} requests ({} failed) at concurrency {}: {:.2f} req/s, p50 {:.1f} ms, p99 {:.1f} ms'.format(
+        len(latencies), len(errors), opt.concurrency, len(latencies) / elapsed,
+        np.percentile(latencies, 50), np.percentile(latencies, 99)))
+    print('server: {}'.format(json.dumps(json.loads(metrics))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--image_dir', type=str, default=None, help='images to upload (default: random 640x640 jpgs)')
+    parser.add_argument('--images', type=int, default=32, help='distinct payloads')
+    parser.add_argument('--size', type=int, default=640, help='size of the random payloads')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,187 @@
+"""
+utils.metrics against a per-image NumPy / SciPy reference written after the PySODMetrics
+toolbox (MAE, S-measure, adaptive / mean E-measure, weighted F-measure), on maps of mixed
+sizes, then the time per batch of the batched evaluation vs the per-image loop.
+
+    python -m benchmarks.metrics --device cuda --batchsize 8
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy import ndimage
+
+from benchmarks.common import synchronize
+from utils.metrics import CODMetrics, distance_transform
+
+EPS = np.spacing(1)
+
+
+def ref_s_object(x, mask):
+    x = x[mask]
+    mean = np.mean(x)
+    return 2 * mean / (mean ** 2 + 1 + np.std(x, ddof=1) + EPS)
+
+
+def ref_ssim(pred, gt):
+    n = pred.size
+    if n == 0:
+        return 0.0
+    x, y = pred.mean(), gt.mean()
+    sigma_x = ((pred - x) ** 2).sum() / max(n - 1, 1)
+    sigma_y = ((gt - y) ** 2).sum() / max(n - 1, 1)
+    sigma_xy = ((pred - x) * (gt - y)).sum() / max(n - 1, 1)
+    alpha = 4 * x * y * sigma_xy
+    beta = (x ** 2 + y ** 2) * (sigma_x + sigma_y)
+    if alpha != 0:
+        return alpha / (beta + EPS)
+    return 1.0 if beta == 0 else 0.0
+
+
+def ref_s_measure(pred, gt):
+    y = gt.mean()
+    if y == 0:
+        return 1 - pred.mean()
+    if y == 1:
+        return pred.mean()
+    u = gt.mean()
+    obj = u * ref_s_object(pred * gt, gt) + (1 - u) * ref_s_object((1 - pred) * (1 - gt), ~gt)
+    h, w = gt.shape
+    cy, cx = np.argwhere(gt).mean(axis=0).round()
+    x, y = int(cx) + 1, int(cy) + 1
+    area = h * w
+    w1, w2, w3 = x * y / area, y * (w - x) / area, (h - y) * x / area
+    gtf = gt.astype(np.float64)
+    region = (w1 * ref_ssim(pred[:y, :x], gtf[:y, :x]) + w2 * ref_ssim(pred[:y, x:], gtf[:y, x:])
+              + w3 * ref_ssim(pred[y:, :x], gtf[y:, :x]) + (1 - w1 - w2 - w3) * ref_ssim(pred[y:, x:], gtf[y:, x:]))
+    return max(0.5 * obj + 0.5 * region, 0)
+
+
+def ref_em(fg_fg, fg_bg, gt_fg, n):
+    pred_fg = fg_fg + fg_bg
+    pred_bg = n - pred_fg
+    if gt_fg == 0:
+        total = pred_bg
+    elif gt_fg == n:
+        total = pred_fg
+    else:
+        bg_fg = gt_fg - fg_fg
+        bg_bg = pred_bg - bg_fg
+        mp, mg = pred_fg / n, gt_fg / n
+        total = 0
+        for count, a, b in ((fg_fg, 1 - mp, 1 - mg), (fg_bg, 1 - mp, -mg), (bg_fg, -mp, 1 - mg), (bg_bg, -mp, -mg)):
+            total += ((2 * a * b / (a ** 2 + b ** 2 + EPS)) + 1) ** 2 / 4 * count
+    return total / (n - 1 + EPS)
+
+
+def ref_e_measure(pred, gt):
+    n = gt.size
+    gt_fg = np.count_nonzero(gt)
+    binary = pred >= min(2 * pred.mean(), 1)
+    adaptive = ref_em(np.count_nonzero(binary & gt), np.count_nonzero(binary & ~gt), gt_fg, n)
+    levels = (pred * 255).astype(np.uint8)
+    bins = np.linspace(0, 256, 257)
+    fg_fg = np.cumsum(np.flip(np.histogram(levels[gt], bins=bins)[0]))
+    fg_bg = np.cumsum(np.flip(np.histogram(levels[~gt], bins=bins)[0]))
+    curve = [ref_em(a, b, gt_fg, n) for a, b in zip(fg_fg, fg_bg)]
+    return adaptive, np.mean(curve)
+
+
+def ref_wfm(pred, gt):
+    if not gt.any():
+        return 0.0
+    dst, idx = ndimage.distance_transform_edt(gt == 0, return_indices=True)
+    e = np.abs(pred - gt)
+    et = np.copy(e)
+    et[gt == 0] = et[idx[0][gt == 0], idx[1][gt == 0]]
+    yy, xx = np.ogrid[-3:4, -3:4]
+    k = np.exp(-(xx * xx + yy * yy) / (2 * 5 * 5))
+    k[k < np.finfo(k.dtype).eps * k.max()] = 0
+    k /= k.sum()
+    ea = ndimage.convolve(et, weights=k, mode='constant', cval=0)
+    min_e = np.where(gt & (ea < e), ea, e)
+    b = np.where(gt == 0, 2 - np.exp(np.log(0.5) / 5 * dst), np.ones_like(gt))
+    ew = min_e * b
+    tp = np.sum(gt) - np.sum(ew[gt == 1])
+    fp = np.sum(ew[gt == 0])
+    r = 1 - np.mean(ew[gt == 1])
+    p = tp / (tp + fp + EPS)
+    return 2 * r * p / (r + p + EPS)
+
+
+def reference(preds, gts):
+    scores = []
+    for pred, gt in zip(preds, gts):
+        pred = pred.astype(np.float64)
+        gt = gt > 128
+        adaptive, mean_em = ref_e_measure(pred, gt)
+        scores.append((np.abs(pred - gt).mean(), ref_s_measure(pred, gt), adaptive, mean_em, ref_wfm(pred, gt)))
+    return dict(zip(('mae', 'sm', 'adp_em', 'mean_em', 'wfm'), np.mean(scores, axis=0)))
+
+
+def sample(rng, h, w):
+    # a blurry blob prediction around a blob GT, sometimes empty
+    blob = F.avg_pool2d(torch.rand(1, 1, h, w, generator=rng), 15, 1, 7)[0, 0]
+    gt = ((blob > 0.5) * 255).to(torch.uint8)
+    if torch.rand(1, generator=rng).item() < 0.15:
+        gt.zero_()
+    pred = (blob + 0.1 * torch.rand(h, w, generator=rng)).clamp(0, 1)
+    pred = (pred - pred.min()) / (pred.max() - pred.min() + 1e-8)
+    return pred, gt
+
+
+def pad(maps):
+    h = max(m.shape[0] for m in maps)
+    w = max(m.shape[1] for m in maps)
+    out = maps[0].new_zeros(len(maps), h, w)
+    for i, m in enumerate(maps):
+        out[i, :m.shape[0], :m.shape[1]] = m
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--batches', type=int, default=3)
+    parser.add_argument('--max_size', type=int, default=320)
+    parser.add_argument('--atol', type=float, default=2e-3)
+    opt = parser.parse_args()
+
+    rng = torch.Generator().manual_seed(0)
+    metrics = CODMetrics(opt.device)
+    preds_all, gts_all = [], []
+    batched = 0.0
+    for _ in range(opt.batches):
+        sizes = torch.randint(opt.max_size // 2, opt.max_size + 1, (opt.batchsize, 2), generator=rng)
+        preds, gts = zip(*[sample(rng, h, w) for h, w in sizes.tolist()])
+        preds_all += [p.numpy() for p in preds]
+        gts_all += [g.numpy() for g in gts]
+        preds, gts = pad(preds).to(opt.device), pad(gts).to(opt.device)
+        synchronize(opt.device)
+        start = time.perf_counter()
+        metrics.update(preds, gts, sizes)
+        synchronize(opt.device)
+        batched += time.perf_counter() - start
+    start = time.perf_counter()
+    ref = reference(preds_all, gts_all)
+    looped = time.perf_counter() - start
+    scores = metrics.compute()
+
+    # the distance transform without a cutoff against scipy (distances; indices may break ties differently)
+    fg = torch.from_numpy(gts_all[0] > 128)
+    dist, _ = distance_transform(fg[None].to(opt.device))
+    if fg.any():
+        assert np.allclose(dist[0].cpu().numpy(), ndimage.distance_transform_edt(~fg.numpy()), atol=1e-4)
+
+    for name in ref:
+        print('{:<8s} batched {:.4f} | reference {:.4f}'.format(name, scores[name], ref[name]))
+        assert abs(scores[name] - ref[name]) < opt.atol, name
+    print('{} images: batched {:.1f} ms/batch | per-image NumPy {:.1f} ms/batch'.format(
+        len(gts_all), batched / opt.batches * 1e3, looped / opt.batches * 1e3))
+
+
+if __name__ == '__main__':
+    main()
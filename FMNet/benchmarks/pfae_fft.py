@@ -0,0 +1,104 @@
+"""
+PFAE with one spectrum per branch vs the previous four-FFTs-per-branch forward:
+numerical equivalence (outputs and gradients), FFT op count and CPU wall time.
+
+    python -m benchmarks.pfae_fft --size 13 --batchsize 4
+"""
+import argparse
+
+import torch
+import torch.nn.functional as F
+from einops import rearrange
+
+from benchmarks.common import timeit
+from lib.modules import PFAE, custom_complex_normalization
+
+
+class LegacyPFAE(PFAE):
+    """The pre-refactor PFAE.forward, running on the same parameters."""
+
+    def branch(self, conv):
+        attn_mod = self.freq_attn
+        b, c, h, w = conv.shape
+
+        q_f = torch.fft.fft2(conv.float())
+        k_f = torch.fft.fft2(conv.float())
+        v_f = torch.fft.fft2(conv.float())
+        tepqkv = torch.fft.fft2(conv.float())
+
+        q_f = rearrange(q_f, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
+        k_f = rearrange(k_f, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
+        v_f = rearrange(v_f, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
+
+        q_f = torch.nn.functional.normalize(q_f, dim=-1)
+        k_f = torch.nn.functional.normalize(k_f, dim=-1)
+        attn_f = (q_f @ k_f.transpose(-2, -1)) * attn_mod.temperature
+        attn_f = custom_complex_normalization(attn_f, dim=-1)
+        out_f = torch.abs(torch.fft.ifft2(attn_f @ v_f))
+        out_f = rearrange(out_f, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
+        out_f_l = torch.abs(torch.fft.ifft2(attn_mod.weight(tepqkv.real)*tepqkv))
+        out = attn_mod.project_out(torch.cat((out_f, out_f_l), 1))
+        return torch.add(out, conv)
+
+    def forward(self, x):
+        x = self.down_conv(x)
+        conv1 = self.conv1(x)
+        F_2 = self.branch(self.conv2(x))
+        F_3 = self.branch(self.conv3(x+F_2.repeat(1, 2, 1, 1)))
+        F_4 = self.branch(self.conv4(x+F_3.repeat(1, 2, 1, 1)))
+        F_5 = self.branch(self.conv5(x+F_4.repeat(1, 2, 1, 1)))
+        conv5 = F.interpolate(self.conv6(F.adaptive_avg_pool2d(x, 1)), size=x.size()[2:], mode='bilinear')
+        return self.out(self.fuse(torch.cat((conv1, F_2, F_3, F_4, F_5, conv5), 1)))
+
+
+def count_ffts(fn):
+    with torch.autograd.profiler.profile() as prof:
+        fn()
+    return sum(1 for e in prof.function_events if e.name.startswith('aten::fft_'))
+
+
+def check_equivalence(new, legacy, x, atol=1e-5):
+    x_new = x.clone().requires_grad_(True)
+    x_old = x.clone().requires_grad_(True)
+    out_new, out_old = new(x_new), legacy(x_old)
+    out_new.sum().backward()
+    out_old.sum().backward()
+    assert torch.allclose(out_new, out_old, atol=atol), (out_new - out_old).abs().max()
+    assert torch.allclose(x_new.grad, x_old.grad, atol=atol), (x_new.grad - x_old.grad).abs().max()
+    for (name, p_new), p_old in zip(new.named_parameters(), legacy.parameters()):
+        if p_new.grad is not None:
+            assert torch.allclose(p_new.grad, p_old.grad, atol=atol), name
+    return (out_new - out_old).abs().max().item()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=13, help='PFAE input resolution (13 at 416x416)')
+    parser.add_argument('--batchsize', type=int, default=4)
+    parser.add_argument('--iters', type=int, default=20)
+    opt = parser.parse_args()
+
+    torch.manual_seed(0)
+    new = PFAE(512, 128)
+    legacy = LegacyPFAE(512, 128)
+    # the residual gains start at zero, randomize everything so the check is not trivial
+    with torch.no_grad():
+        for p in new.parameters():
+            p.copy_(torch.randn_like(p) * 0.1)
+    legacy.load_state_dict(new.state_dict())
+    new.eval()
+    legacy.eval()
+
+    x = torch.randn(opt.batchsize, 512, opt.size, opt.size)
+    err = check_equivalence(new, legacy, x)
+    print('max |new - legacy| = {:.2e}'.format(err))
+
+    with torch.no_grad():
+        for name, model in (('legacy', legacy), ('shared spectrum', new)):
+            ffts = count_ffts(lambda: model(x))
+            latency = timeit(lambda: model(x), opt.iters)
+            print('{}: {} FFT ops, {:.2f} ms'.format(name, ffts, latency * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Inference latency across input resolutions, including non-square ones.
+
+    python -m benchmarks.resolution --device cpu --sizes 416 320 288 416x320
+"""
+import argparse
+import time
+
+import torch
+
+from lib.FMNet import Network
+from lib.checkpoint import load_checkpoint
+
+
+def parse_size(text):
+    h, _, w = text.partition('x')
+    return int(h), int(w or h)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(416, 416), (320, 320), (288, 288)])
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--pth_path', type=str, default=None)
+    opt = parser.parse_args()
+
+    model = Network(channels=128, pretrained=False, init=opt.pth_path is None)
+    if opt.pth_path is not None:
+        load_checkpoint(model, opt.pth_path)
+    model.to(opt.device).eval()
+
+    for h, w in opt.sizes:
+        image = torch.randn(1, 3, h, w, device=opt.device)
+        with torch.no_grad():
+            model(image)  # builds the RoPE tables for this shape
+            if image.is_cuda:
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(opt.iters):
+                model(image)
+            if image.is_cuda:
+                torch.cuda.synchronize()
+        print('{}x{}: {:.2f} ms/image'.format(h, w, (time.perf_counter() - start) / opt.iters * 1e3))
+
+
+if __name__ == '__main__':
+    main()
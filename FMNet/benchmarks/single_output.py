@@ -0,0 +1,38 @@
+"""
+Peak activation memory and latency of forward(x) vs forward(x, return_all=False).
+
+    python -m benchmarks.single_output --device cpu --sizes 416 640 832
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import peak_memory, timeit
+from lib.FMNet import Network
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[416, 640, 832])
+    parser.add_argument('--batchsize', type=int, default=4)
+    parser.add_argument('--iters', type=int, default=5)
+    opt = parser.parse_args()
+
+    model = Network(channels=128, pretrained=False, init=True).to(opt.device).eval()
+
+    for size in opt.sizes:
+        image = torch.randn(opt.batchsize, 3, size, size, device=opt.device)
+        for return_all in (True, False):
+            def forward():
+                with torch.no_grad():
+                    model(image, return_all=return_all)
+
+            latency = timeit(forward, opt.iters, device=opt.device)
+            peak = peak_memory(forward, device=opt.device)
+            print('{}x{} return_all={}: {:.2f} ms, peak {:.1f} MB'.format(
+                size, size, return_all, latency * 1e3, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
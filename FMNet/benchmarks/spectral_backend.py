@@ -0,0 +1,64 @@
+"""
+fft2/ifft2 vs rfft2/irfft2 spectral backend: tolerance check and CPU timing for the
+four MFM stages (13, 26, 52, 104 at 416x416) and the FRD decoders.
+
+    python -m benchmarks.spectral_backend --batchsize 2
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import peak_memory, timeit
+from lib.modules import MFM, FRD_3, spectrum_magnitude
+
+# (dim, resolution, mlp_ratio) of MFM_5 .. MFM_2 in Network with channels=128
+STAGES = [(512 + 128, 13, 4), (256 + 128, 26, 4), (128 + 128, 52, 8), (64 + 128, 104, 8)]
+
+
+def pair(build):
+    torch.manual_seed(0)
+    fft = build('fft').eval()
+    rfft = build('rfft').eval()
+    rfft.load_state_dict(fft.state_dict())
+    return fft, rfft
+
+
+def report(name, fft, rfft, inputs, iters, atol):
+    with torch.no_grad():
+        out_fft, out_rfft = fft(*inputs), rfft(*inputs)
+        err = (out_fft - out_rfft).abs().max().item()
+        assert err < atol, '{}: max error {:.2e}'.format(name, err)
+        t_fft = timeit(lambda: fft(*inputs), iters)
+        t_rfft = timeit(lambda: rfft(*inputs), iters)
+        m_fft = peak_memory(lambda: fft(*inputs))
+        m_rfft = peak_memory(lambda: rfft(*inputs))
+    print('{}: max err {:.1e} | fft {:.2f} ms {:.1f} MB | rfft {:.2f} ms {:.1f} MB'.format(
+        name, err, t_fft * 1e3, m_fft / 2 ** 20, t_rfft * 1e3, m_rfft / 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    opt = parser.parse_args()
+
+    # the mirrored half spectrum must reproduce the full magnitude, odd sizes included
+    for h, w in [(13, 13), (26, 26), (13, 20), (16, 9)]:
+        x = torch.randn(2, 1, h, w)
+        assert torch.allclose(spectrum_magnitude(x, 'fft'), spectrum_magnitude(x, 'rfft'), atol=1e-4), (h, w)
+
+    for dim, res, mlp_ratio in STAGES:
+        fft, rfft = pair(lambda spectral: MFM(dim=dim, out_channel=128, input_resolution=(res, res),
+                                              mlp_ratio=mlp_ratio, num_heads=8, spectral=spectral))
+        x = torch.randn(opt.batchsize, dim, res, res)
+        report('MFM {}x{}'.format(res, res), fft, rfft, (x,), opt.iters, opt.atol)
+
+    fft, rfft = pair(lambda spectral: FRD_3(128, 128, spectral=spectral))
+    inputs = (torch.randn(opt.batchsize, 128, 104, 104), torch.randn(opt.batchsize, 1, 52, 52),
+              torch.randn(opt.batchsize, 1, 26, 26), torch.randn(opt.batchsize, 1, 13, 13))
+    report('FRD_3 104x104', fft, rfft, inputs, opt.iters, opt.atol)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Training step time with telemetry off, with the old inline logging (.data formatting and
+NumPy image copies every `log_every` steps) and with utils.telemetry.Telemetry.
+
+    python -m benchmarks.telemetry --device cuda --steps 200
+"""
+import argparse
+import tempfile
+import time
+
+import torch
+import torch.nn.functional as F
+from tensorboardX import SummaryWriter
+from torchvision.utils import make_grid
+
+from benchmarks.common import synchronize
+from lib.modules import MFM
+from utils.telemetry import Telemetry
+
+
+def inline_logging(writer, step, loss, images, preds):
+    # what train() did before: every value and image is pulled to the host on the spot
+    print('Step [{:04d}], Total_loss: {:.4f}'.format(step, loss.data))
+    writer.add_scalars('Loss_Statistics', {'Loss_total': loss.data}, global_step=step)
+    writer.add_image('RGB', make_grid(images[0].clone().cpu().data, 1, normalize=True), step)
+    res = preds[0].clone().sigmoid().data.cpu().numpy().squeeze()
+    res = (res - res.min()) / (res.max() - res.min() + 1e-8)
+    writer.add_image('Pred', torch.tensor(res), step, dataformats='HW')
+
+
+def run(mode, opt, writer):
+    torch.manual_seed(0)
+    model = MFM(dim=256, out_channel=128, input_resolution=(52, 52), mlp_ratio=8, num_heads=8).to(opt.device)
+    head = torch.nn.Conv2d(128, 1, 1).to(opt.device)
+    optimizer = torch.optim.Adam(list(model.parameters()) + list(head.parameters()), 1e-4)
+    images = torch.randn(opt.batchsize, 256, 52, 52, device=opt.device)
+    gts = (torch.rand(opt.batchsize, 1, 52, 52, device=opt.device) > 0.5).float()
+    telemetry = Telemetry(writer, log_every=opt.log_every, image_every=opt.image_every, enabled=mode == 'telemetry')
+
+    synchronize(opt.device)
+    start = time.perf_counter()
+    for step in range(1, opt.steps + 1):
+        optimizer.zero_grad()
+        preds = head(model(images))
+        loss = F.binary_cross_entropy_with_logits(preds, gts)
+        loss.backward()
+        optimizer.step()
+        if mode == 'inline' and step % opt.log_every == 0:
+            inline_logging(writer, step, loss, images[:, :3], preds)
+        telemetry.update(Loss_total=loss)
+        telemetry.log(step, 'Step [{:04d}]'.format(step))
+        telemetry.images(step, maps={'RGB': images[0, :3]}, logits={'Pred': preds[0]})
+    synchronize(opt.device)
+    elapsed = time.perf_counter() - start
+    telemetry.close()
+    return elapsed / opt.steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batchsize', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=60)
+    parser.add_argument('--log_every', type=int, default=20)
+    parser.add_argument('--image_every', type=int, default=200)
+    opt = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logdir:
+        writer = SummaryWriter(logdir)
+        times = {mode: run(mode, opt, writer) for mode in ('off', 'inline', 'telemetry')}
+        writer.close()
+    for mode, seconds in times.items():
+        print('{:<10s} {:8.2f} ms/step ({:+.1%} vs off)'.format(mode, seconds * 1e3, seconds / times['off'] - 1))
+
+
+if __name__ == '__main__':
+    main()
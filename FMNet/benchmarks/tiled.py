@@ -0,0 +1,86 @@
+"""
+TiledPredictor: a per-pixel model must give the same logits tiled as on the whole image for
+any overlap (checks the window accumulation and feathering), a single window must match a
+direct forward of Network, then time and peak memory per megapixel as the image grows,
+against a whole-image forward where it fits.
+
+    python -m benchmarks.tiled --device cuda --tile 416 --overlap 64 --sizes 1024 2048 4096
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from benchmarks.common import peak_memory, synchronize
+from lib.FMNet import Network
+from lib.checkpoint import load_checkpoint
+from utils.tiling import TiledPredictor
+
+
+class Pointwise(nn.Module):
+    """Per-pixel logits, so tiling can not change them."""
+
+    def __init__(self):
+        super(Pointwise, self).__init__()
+        self.conv = nn.Conv2d(3, 1, 1)
+
+    def forward(self, x, return_all=False):
+        return self.conv(x)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--tile', type=int, default=416)
+    parser.add_argument('--overlap', type=int, default=64)
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048])
+    parser.add_argument('--full_max', type=int, default=1024, help='largest size also run as one whole-image forward')
+    parser.add_argument('--pth_path', type=str, default=None)
+    opt = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+    image = rng.integers(0, 256, (999, 1337, 3), dtype=np.uint8)
+    pointwise = Pointwise().to(opt.device)
+    whole = TiledPredictor(pointwise, tile=1376, overlap=0, device=opt.device).predict(image)
+    for overlap in (0, 32, opt.overlap, opt.tile // 2):
+        tiled = TiledPredictor(pointwise, tile=opt.tile, overlap=overlap, device=opt.device).predict(image)
+        assert np.allclose(tiled, whole, atol=1e-5), 'overlap {}: tiled logits differ'.format(overlap)
+
+    model = Network(channels=128, pretrained=False, init=opt.pth_path is None)
+    if opt.pth_path is not None:
+        load_checkpoint(model, opt.pth_path)
+    predictor = TiledPredictor(model, tile=opt.tile, overlap=opt.overlap, batch_size=opt.batchsize,
+                               device=opt.device)
+    window = rng.integers(0, 256, (opt.tile, opt.tile, 3), dtype=np.uint8)
+    with torch.no_grad():
+        direct = predictor.logits(predictor.tiles(window[None]))[0].cpu().numpy()
+    assert np.allclose(predictor.predict(window), direct, atol=1e-5), 'single window differs from a direct forward'
+    print('blending and single-window checks passed')
+
+    for size in opt.sizes:
+        image = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        mp = size * size / 1e6
+        predictor.predict(image)
+        synchronize(opt.device)
+        start = time.perf_counter()
+        predictor.predict(image)
+        synchronize(opt.device)
+        seconds = time.perf_counter() - start
+        peak = peak_memory(lambda: predictor.predict(image), opt.device) / 2 ** 20
+        line = '{0}x{0} ({1:.1f} MP): tiled {2:.2f} s/MP, peak {3:.1f} MB ({4:.1f} MB/MP)'.format(
+            size, mp, seconds / mp, peak, peak / mp)
+        if size <= opt.full_max:
+            crop = torch.from_numpy(image[:size // 32 * 32, :size // 32 * 32]).to(opt.device)
+            batch = (crop.permute(2, 0, 1)[None].float() - predictor.mean) / predictor.std
+            with torch.no_grad():
+                full = peak_memory(lambda: predictor.logits(batch), opt.device) / 2 ** 20
+            line += ' | whole image peak {:.1f} MB'.format(full)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+VideoPredictor on a synthetic clip (a textured background with a slowly drifting blob and a
+scene cut every `--cut` frames): every-frame inference must match a direct forward, the
+keyframe policy must cut at scene changes, then frames per second with and without
+keyframe reuse.
+
+    python -m benchmarks.video --device cpu --frames 64 --size 360x640 --threshold 0.02
+"""
+import argparse
+
+import numpy as np
+import torch
+
+from lib.FMNet import Network
+from lib.checkpoint import load_checkpoint
+from utils.video import VideoPredictor, batched
+
+
+def parse_size(text):
+    h, _, w = text.partition('x')
+    return int(h), int(w or h)
+
+
+def synthetic_clip(frames, size, cut, seed=0):
+    rng = np.random.default_rng(seed)
+    h, w = size
+    yy, xx = np.mgrid[:h, :w]
+    for i in range(frames):
+        if i % cut == 0:
+            background = rng.integers(0, 256, (h, w, 3)).astype(np.float32)
+            cy, cx = rng.uniform(0.3, 0.7) * h, rng.uniform(0.3, 0.7) * w
+        blob = ((yy - cy - i % cut) ** 2 + (xx - cx - 2 * (i % cut)) ** 2) < (0.1 * h) ** 2
+        frame = background.copy()
+        frame[blob] = 0.7 * frame[blob] + 60
+        yield np.clip(frame + rng.normal(0, 2, frame.shape), 0, 255).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--frames', type=int, default=64)
+    parser.add_argument('--size', type=parse_size, default=(360, 640))
+    parser.add_argument('--cut', type=int, default=16, help='frames between scene cuts')
+    parser.add_argument('--testsize', type=int, default=416)
+    parser.add_argument('--batchsize', type=int, default=8)
+    parser.add_argument('--threshold', type=float, default=0.02)
+    parser.add_argument('--max_gap', type=int, default=10)
+    parser.add_argument('--pth_path', type=str, default=None)
+    opt = parser.parse_args()
+
+    model = Network(channels=128, pretrained=False, init=opt.pth_path is None)
+    if opt.pth_path is not None:
+        load_checkpoint(model, opt.pth_path)
+    every = VideoPredictor(model, testsize=opt.testsize, batch_size=opt.batchsize, device=opt.device)
+    reuse = VideoPredictor(model, testsize=opt.testsize, batch_size=opt.batchsize, device=opt.device,
+                           threshold=opt.threshold, max_gap=opt.max_gap)
+
+    _, resized = next(batched(synthetic_clip(opt.batchsize, opt.size, opt.cut), opt.batchsize, opt.testsize))
+    logits, computed = every.predict(resized)
+    images = torch.from_numpy(resized).to(opt.device).permute(0, 3, 1, 2).float()
+    with torch.no_grad():
+        direct = model((images - every.mean) / every.std, return_all=False)
+    assert computed == len(resized) and torch.allclose(logits, direct, atol=1e-5), 'every-frame logits differ'
+
+    # over the whole clip every scene cut has to start a new keyframe, i.e. get fresh logits
+    reuse.reset()
+    clip = batched(synthetic_clip(opt.frames, opt.size, opt.cut), opt.batchsize, opt.testsize)
+    for first, (_, resized) in zip(range(0, opt.frames, opt.batchsize), clip):
+        logits, _ = reuse.predict(resized)
+        for i in range(len(resized)):
+            if (first + i) % opt.cut == 0:
+                image = torch.from_numpy(resized[i:i + 1]).to(opt.device).permute(0, 3, 1, 2).float()
+                with torch.no_grad():
+                    direct = model((image - reuse.mean) / reuse.std, return_all=False)
+                assert torch.allclose(logits[i:i + 1], direct, atol=1e-5), 'frame {} is not a keyframe'.format(first + i)
+    print('every-frame logits match a direct forward, scene cuts start keyframes')
+
+    for name, predictor in (('every frame', every), ('threshold {}'.format(opt.threshold), reuse)):
+        predictor.run(synthetic_clip(opt.batchsize, opt.size, opt.cut))  # warm-up
+        stats = predictor.run(synthetic_clip(opt.frames, opt.size, opt.cut))
+        print('{:<16s} {} frames, {} keyframes, {:.2f} fps'.format(name, stats['frames'], stats['keyframes'],
+                                                                  stats['fps']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+
+import timm
+import torch.nn as nn
+import torch
+import torch.nn.functional as F
+import torch.utils.checkpoint as checkpoint
+from contextlib import contextmanager, nullcontext
+from lib.modules import  PFAE, MFM, FRD_1, FRD_2, FRD_3
+from lib.encoder import ENCODER_NAME, build_encoder
+
+
+@contextmanager
+def keep_bn_stats(module):
+    """
+    Restore the BatchNorm running statistics of module on exit. Wraps the backward recompute
+    of a checkpointed stage, which runs it in train mode a second time.
+    """
+    buffers = [(buffer, buffer.clone()) for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)
+               for buffer in (m.running_mean, m.running_var, m.num_batches_tracked) if buffer is not None]
+    try:
+        yield
+    finally:
+        for buffer, saved in buffers:
+            buffer.copy_(saved)
+
+
+class Network(nn.Module):
+    # decoder stages that can be activation-checkpointed
+    CHECKPOINT_STAGES = ('MFM_5', 'MFM_4', 'MFM_3', 'MFM_2', 'PFAE', 'FRD_1', 'FRD_2', 'FRD_3')
+
+    # resnet based encoder decoder
+    def __init__(self, channels=128, spectral='fft', pretrained=True, encoder_path=ENCODER_NAME, cache_dir=None,
+                 checkpoint_stages=(), init=False):
+        """
+        spectral: 'fft' keeps the original complex FFTs in the MFM / FRD spectral gating,
+        'rfft' uses the half-spectrum real FFT path (same outputs up to float error at
+        inference, see lib.modules.spectral_gate).
+        pretrained / encoder_path / cache_dir / init: see lib.encoder.build_encoder. Use
+        pretrained=False when a full FMNet checkpoint is loaded right after construction,
+        and add init=True when none is (the encoder would otherwise be uninitialized).
+        checkpoint_stages: names from CHECKPOINT_STAGES whose activations are recomputed in
+        backward instead of stored while training. Outputs, gradients and BatchNorm running
+        stats are unchanged.
+        """
+        super(Network, self).__init__()
+        unknown = set(checkpoint_stages) - set(self.CHECKPOINT_STAGES)
+        if unknown:
+            raise ValueError('unknown checkpoint stages {}, expected a subset of {}'.format(
+                sorted(unknown), self.CHECKPOINT_STAGES))
+        self.checkpoint_stages = frozenset(checkpoint_stages)
+        self.shared_encoder = build_encoder(encoder_path, pretrained=pretrained, cache_dir=cache_dir, init=init)
+        
+        base_d_state = 4
+        base_H_W = 13
+
+        self.dePixelShuffle = torch.nn.PixelShuffle(2)
+       
+        self.up = nn.Sequential(
+            nn.Conv2d(channels//4, channels, kernel_size=1),nn.BatchNorm2d(channels),
+            nn.Conv2d(channels, channels, kernel_size=3, padding=1),nn.BatchNorm2d(channels),nn.ReLU(True)
+        )
+        self.MFM_5 = MFM(
+                dim=int(512+channels),
+                out_channel=channels,
+                input_resolution = (base_H_W,base_H_W),
+                mlp_ratio=4,
+                num_heads = 8,
+                sr_ratio=1,
+                spectral=spectral,
+            )
+        self.MFM_4 = MFM(
+                dim=int(256+channels),
+                out_channel=channels,
+                input_resolution = (base_H_W*2,base_H_W*2),
+                mlp_ratio=4,
+                num_heads = 8,
+                sr_ratio=1,
+                spectral=spectral,
+            )
+        self.MFM_3 = MFM(
+                dim=int(128+channels),
+                out_channel=channels,
+                input_resolution = (base_H_W*4,base_H_W*4),
+                mlp_ratio=8,
+                num_heads = 8,
+                sr_ratio=1,
+                spectral=spectral,
+            )
+        self.MFM_2 = MFM(
+                dim=int(64+channels),
+                out_channel=channels,
+                input_resolution = (base_H_W*8,base_H_W*8),
+                mlp_ratio=8,
+                num_heads = 8,
+                sr_ratio = 1,
+                spectral=spectral,
+            )
+
+
+
+        self.PFAE = PFAE(512, channels)
+
+
+        self.FRD_1 = FRD_1(channels, channels, spectral=spectral)
+        self.FRD_2 = FRD_2(channels, channels, spectral=spectral)
+        self.FRD_3 = FRD_3(channels,channels, spectral=spectral)
+
+
+    def stage(self, name, *inputs):
+        """Run decoder stage `name`, recomputing it in backward if it is checkpointed."""
+        module = getattr(self, name)
+        if name in self.checkpoint_stages and self.training and torch.is_grad_enabled():
+            # the recompute must not update the BatchNorm running stats a second time
+            return checkpoint.checkpoint(module, *inputs, use_reentrant=False,
+                                         context_fn=lambda: (nullcontext(), keep_bn_stats(module)))
+        return module(*inputs)
+
+    def forward(self, x, return_all=True):
+        """
+        Returns the five side outputs (p0, f4, f3, f2, f1) at input resolution for deep
+        supervision, or with return_all=False only the final map f1, skipping the four
+        unused full-resolution upsamples.
+        """
+        image = x
+        _, _, H, W = image.shape
+
+        # the encoder is a registered submodule, so .to(device) / .train() / .eval()
+        # on the network already reach it; nothing is re-placed per call
+        out_avg_pool, en_feats = self.shared_encoder(image)
+        x1, x2, x3, x4 = en_feats
+
+
+        p1 = self.stage('PFAE', x4)
+        x5_4 = p1
+        x5_4_1 = x5_4.expand(-1, 128, -1, -1)
+
+        x4   = self.stage('MFM_5', torch.cat((x4,x5_4_1),1))
+        x4_up = self.up(self.dePixelShuffle(x4))
+
+        x3   = self.stage('MFM_4', torch.cat((x3,x4_up),1))
+        x3_up = self.up(self.dePixelShuffle(x3))
+
+        x2   = self.stage('MFM_3', torch.cat((x2,x3_up),1))
+        x2_up = self.up(self.dePixelShuffle(x2))
+
+
+        x1   = self.stage('MFM_2', torch.cat((x1,x2_up),1))
+
+
+        x4 = self.stage('FRD_1', x4,x5_4)
+        x3 = self.stage('FRD_1', x3,x4)
+        x2 = self.stage('FRD_2', x2,x3,x4)
+        x1 = self.stage('FRD_3', x1,x2,x3,x4)
+
+
+        if not return_all:
+            return F.interpolate(x1, size=image.size()[2:], mode='bilinear', align_corners=True)
+
+        p0 = F.interpolate(p1, size=image.size()[2:], mode='bilinear', align_corners=True)
+        f4 = F.interpolate(x4, size=image.size()[2:], mode='bilinear', align_corners=True)
+        f3 = F.interpolate(x3, size=image.size()[2:], mode='bilinear', align_corners=True)
+        f2 = F.interpolate(x2, size=image.size()[2:], mode='bilinear', align_corners=True)
+        f1 = F.interpolate(x1, size=image.size()[2:], mode='bilinear', align_corners=True)
+
+
+        return p0, f4, f3, f2, f1
+ 
+
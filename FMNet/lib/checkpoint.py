@@ -0,0 +1,179 @@
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def strip_prefix(state_dict, prefix='module.'):
+    """Drop the DataParallel prefix. Only keys are rebuilt, tensors are shared, not copied."""
+    return {(k[len(prefix):] if k.startswith(prefix) else k): v for k, v in state_dict.items()}
+
+
+def open_state_dict(path):
+    """
+    Memory-map a checkpoint and return its state dict with the `module.` prefix stripped.
+
+    .safetensors files are always mapped; .pth files are mapped when torch supports
+    torch.load(mmap=True) (2.1+) and the file uses the zip format, otherwise read normally.
+    Tensors stay on the CPU, backed by the file pages rather than private memory.
+    """
+    if path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        return strip_prefix(load_file(path, device='cpu'))
+    try:
+        state_dict = torch.load(path, map_location='cpu', mmap=True)
+    except (TypeError, RuntimeError):
+        # torch < 2.1 has no mmap argument; legacy (non-zip) files cannot be mapped
+        state_dict = torch.load(path, map_location='cpu')
+    if isinstance(state_dict.get('model'), dict):
+        # a resume checkpoint (training_state), keep the weights
+        state_dict = state_dict['model']
+    return strip_prefix(state_dict)
+
+
+def load_checkpoint(model, path, device=None, strict=True):
+    """
+    Load a Net_epoch_*.pth or converted .safetensors file into model.
+
+    The model is moved to `device` first and every tensor is copied straight from the
+    mapped file into its parameter on that device, so no full host-side copy of the
+    checkpoint is ever made.
+    """
+    if device is not None:
+        model.to(device)
+    model.load_state_dict(open_state_dict(path), strict=strict)
+    return model
+
+
+def unwrap(model):
+    """The network inside a DataParallel / DistributedDataParallel wrapper."""
+    return model.module if hasattr(model, 'module') else model
+
+
+def rng_state():
+    """Python, numpy and torch (CPU and CUDA) generator states, as tensors and plain types only."""
+    kind, keys, pos, has_gauss, cached = np.random.get_state()
+    return {
+        'python': random.getstate(),
+        'numpy': (kind, torch.from_numpy(keys.copy()), pos, has_gauss, cached),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    kind, keys, pos, has_gauss, cached = state['numpy']
+    np.random.set_state((kind, keys.numpy(), pos, has_gauss, cached))
+    torch.set_rng_state(state['torch'])
+    if torch.cuda.is_available() and len(state['cuda']) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def training_state(model, optimizer, scheduler=None, scaler=None, **counters):
+    """
+    Everything needed to continue training: model (unprefixed), optimizer, scheduler and
+    GradScaler states, RNG states and counters such as epoch / step / best_score / best_epoch.
+    """
+    return {
+        'model': unwrap(model).state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'scheduler': scheduler.state_dict() if scheduler is not None else None,
+        'scaler': scaler.state_dict() if scaler is not None else None,
+        'rng': rng_state(),
+        'counters': counters,
+    }
+
+
+def resume_training(path, model, optimizer=None, scheduler=None, scaler=None, restore_rng=True):
+    """
+    Restore a checkpoint into model (and optimizer / scheduler / scaler / RNG when it is a
+    training_state). Returns its counters, or None for a weights-only Net_epoch_*.pth,
+    in which case only the model is loaded.
+    """
+    state = torch.load(path, map_location='cpu')
+    if not isinstance(state.get('model'), dict):
+        unwrap(model).load_state_dict(strip_prefix(state))
+        return None
+    unwrap(model).load_state_dict(strip_prefix(state['model']))
+    if optimizer is not None:
+        optimizer.load_state_dict(state['optimizer'])
+    if scheduler is not None and state['scheduler'] is not None:
+        scheduler.load_state_dict(state['scheduler'])
+    if scaler is not None and state['scaler'] is not None:
+        scaler.load_state_dict(state['scaler'])
+    if restore_rng:
+        set_rng_state(state['rng'])
+    return state['counters']
+
+
+def _to_cpu(obj):
+    """Deep copy of the tensors in a (nested) state onto the CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+def _write(state, path):
+    # write then rename, so an interrupted save never replaces the previous checkpoint
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class AsyncCheckpointer:
+    """
+    Save checkpoints from a background thread. save() only snapshots the state into host
+    memory (the tensors keep changing in place while training continues); serialization
+    and the disk write happen on the writer thread. One write is in flight at a time.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def save(self, state, path):
+        self.wait()
+        self.pending = self.executor.submit(_write, _to_cpu(state), path)
+
+    def wait(self):
+        """Block until the last save is on disk; re-raises its error, if any."""
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+
+def convert_checkpoint(src, dst=None):
+    """Write a .pth state dict written by Train.py as an unprefixed .safetensors file."""
+    from safetensors.torch import save_file
+
+    dst = dst or os.path.splitext(src)[0] + '.safetensors'
+    state_dict = {k: v.contiguous() for k, v in open_state_dict(src).items()}
+    save_file(state_dict, dst)
+    return dst
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='convert Net_epoch_*.pth checkpoints to .safetensors')
+    parser.add_argument('pth_paths', type=str, nargs='+')
+    parser.add_argument('--out_dir', type=str, default=None, help='defaults to next to each input')
+    opt = parser.parse_args()
+
+    for pth_path in opt.pth_paths:
+        dst = None
+        if opt.out_dir is not None:
+            os.makedirs(opt.out_dir, exist_ok=True)
+            dst = os.path.join(opt.out_dir, os.path.splitext(os.path.basename(pth_path))[0] + '.safetensors')
+        print('{} -> {}'.format(pth_path, convert_checkpoint(pth_path, dst)))
@@ -0,0 +1,111 @@
+"""
+Opt-in torch.compile for Network and a per-module graph-break report.
+
+Stages are compiled in place (nn.Module.compile) one by one rather than wrapping the whole
+network, so state_dict keys stay unchanged, activation checkpointing (Network.stage) and
+DDP wrap the compiled stages as before, and each stage is a separate graph whose breaks
+can be listed on their own. FRD_1 and `up` run at several feature resolutions and compile
+once per resolution; the four MFMs share one forward and compile once per channel width.
+Shapes are static by default: every call site keeps its own specialized graph instead of
+the slower dynamic-shape one dynamo falls back to after the second size.
+"""
+import torch
+import torch._dynamo as dynamo
+
+# decoder modules compiled by compile_network, in forward order
+DECODER = ('PFAE', 'MFM_5', 'up', 'MFM_4', 'MFM_3', 'MFM_2', 'FRD_1', 'FRD_2', 'FRD_3')
+# graphs per forward code object: the MFMs x resolutions x train / eval
+RECOMPILE_LIMIT = 32
+# inductor can not compile the backward of FrequencyAttention's complex attention (its
+# generated backward views a strided complex tensor as real), so PFAE stays eager in training
+NO_BACKWARD = ('PFAE',)
+
+
+def compile_network(model, encoder=True, exclude=(), **kwargs):
+    """
+    Compile the decoder modules of model except `exclude` (pass NO_BACKWARD when training)
+    and, with encoder=True, the encoder in place. kwargs go to torch.compile (mode, dynamic,
+    backend, ...; dynamic defaults to False). Compilation happens on the first call of each
+    module; code dynamo can not capture falls back to eager at a graph break instead of
+    failing, which is what makes the encoder safe to try.
+    """
+    kwargs.setdefault('dynamic', False)
+    # the default limit of 8 graphs per code object is below what the MFMs need in
+    # training + validation; past it dynamo would silently run them eagerly
+    config = dynamo.config
+    if hasattr(config, 'recompile_limit'):
+        config.recompile_limit = max(config.recompile_limit, RECOMPILE_LIMIT)
+    else:
+        config.cache_size_limit = max(config.cache_size_limit, RECOMPILE_LIMIT)
+    for name in DECODER:
+        if name not in exclude:
+            getattr(model, name).compile(**kwargs)
+    if encoder:
+        model.shared_encoder.compile(**kwargs)
+    return model
+
+
+def stage_inputs(model, x):
+    """Run one eager forward and record the positional inputs of each module's first call."""
+    inputs = {}
+
+    def record(name):
+        def hook(module, args):
+            inputs.setdefault(name, args)  # returns None: the call's inputs stay untouched
+        return hook
+
+    handles = [getattr(model, name).register_forward_pre_hook(record(name)) for name in ('shared_encoder',) + DECODER]
+    try:
+        with torch.no_grad():
+            model(x, return_all=False)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return inputs
+
+
+def graph_break_report(model, x):
+    """
+    {module name: (graph count, [(reason, file:line), ...])} for the encoder and every
+    decoder module, from torch._dynamo.explain on the inputs it sees in a forward of x.
+    """
+    report = {}
+    for name, args in stage_inputs(model, x).items():
+        dynamo.reset()
+        with torch.no_grad():
+            explanation = dynamo.explain(getattr(model, name))(*args)
+        breaks = []
+        for reason in explanation.break_reasons:
+            frame = reason.user_stack[-1] if reason.user_stack else None
+            where = '{}:{}'.format(frame.filename.split('/')[-1], frame.lineno) if frame is not None else '?'
+            breaks.append((reason.reason.splitlines()[0], where))
+        report[name] = (explanation.graph_count, breaks)
+    dynamo.reset()
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from lib.FMNet import Network
+    from lib.checkpoint import load_checkpoint
+    from lib.encoder import ENCODER_NAME
+
+    parser = argparse.ArgumentParser(description='list torch.compile graph breaks per FMNet module')
+    parser.add_argument('--testsize', type=int, default=416)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME)
+    parser.add_argument('--cache_dir', type=str, default=None)
+    parser.add_argument('--pth_path', type=str, default=None, help='checkpoint to report on, random init without')
+    opt = parser.parse_args()
+
+    net = Network(channels=128, pretrained=False, init=opt.pth_path is None, encoder_path=opt.encoder_path,
+                  cache_dir=opt.cache_dir)
+    if opt.pth_path is not None:
+        load_checkpoint(net, opt.pth_path)
+    net.to(opt.device).eval()
+    example = torch.randn(1, 3, opt.testsize, opt.testsize, device=opt.device)
+    for module, (graphs, reasons) in graph_break_report(net, example).items():
+        print('{:<16s} {} graph(s), {} break(s)'.format(module, graphs, len(reasons)))
+        for reason, where in reasons:
+            print('    {}: {}'.format(where, reason))
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+from huggingface_hub import snapshot_download
+from mamba_ssm.ops.selective_scan_interface import selective_scan_ref
+from transformers import AutoConfig, AutoModel
+
+try:
+    from transformers.modeling_utils import no_init_weights
+except ImportError:
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # very old transformers, random init is simply not skipped
+        from contextlib import nullcontext as no_init_weights
+
+ENCODER_NAME = "nvidia/MambaVision-S-1K"
+
+
+def cpu_selective_scan(encoder):
+    """
+    MambaVision calls the CUDA-only `selective_scan_fn` kernel. Wrap it once so that
+    CPU tensors are routed to the pure PyTorch reference scan instead; CUDA tensors
+    keep using the fused kernel.
+    """
+    for module in encoder.modules():
+        owner = sys.modules.get(type(module).__module__)
+        scan_fn = getattr(owner, 'selective_scan_fn', None)
+        if scan_fn is None or getattr(scan_fn, 'cpu_dispatch', False):
+            continue
+
+        def dispatch(u, *args, _cuda_scan=scan_fn, **kwargs):
+            if u.is_cuda:
+                return _cuda_scan(u, *args, **kwargs)
+            return selective_scan_ref(u, *args, **kwargs)
+
+        dispatch.cpu_dispatch = True
+        owner.selective_scan_fn = dispatch
+    return encoder
+
+
+def cache_encoder(cache_dir, name_or_path=ENCODER_NAME):
+    """
+    Download the encoder snapshot (code, config and weights) once into cache_dir and return
+    its local path. Pass that path as name_or_path later to build without touching the hub.
+    """
+    return snapshot_download(name_or_path, cache_dir=cache_dir)
+
+
+def build_encoder(name_or_path=ENCODER_NAME, pretrained=True, cache_dir=None, local_files_only=None, verbose=False,
+                  init=False):
+    """
+    Build the MambaVision encoder.
+
+    pretrained=False builds the architecture from its config only: no weight download and
+    no random init, for when a full FMNet checkpoint is loaded right afterwards. The
+    parameters are then uninitialized memory; add init=True to randomly initialize them
+    when no checkpoint follows (benchmarks, equivalence checks).
+    name_or_path may be a hub id or a local snapshot directory (see cache_encoder).
+    local_files_only defaults to True for local directories and when HF_HUB_OFFLINE=1.
+    """
+    start = time.perf_counter()
+    if local_files_only is None:
+        local_files_only = os.path.isdir(name_or_path) or os.environ.get('HF_HUB_OFFLINE') == '1'
+    kwargs = dict(trust_remote_code=True, cache_dir=cache_dir, local_files_only=local_files_only)
+
+    if pretrained:
+        encoder = AutoModel.from_pretrained(name_or_path, **kwargs)
+    else:
+        config = AutoConfig.from_pretrained(name_or_path, **kwargs)
+        with nullcontext() if init else no_init_weights():
+            encoder = AutoModel.from_config(config, trust_remote_code=True)
+    encoder = cpu_selective_scan(encoder)
+
+    if verbose:
+        print('encoder {} ({}) built in {:.2f}s'.format(
+            name_or_path, 'pretrained' if pretrained else 'config only, random init' if init else 'config only',
+            time.perf_counter() - start))
+    return encoder
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='pin the encoder snapshot into a local cache directory')
+    parser.add_argument('--cache_dir', type=str, required=True)
+    parser.add_argument('--encoder_path', type=str, default=ENCODER_NAME)
+    opt = parser.parse_args()
+    print(cache_encoder(opt.cache_dir, opt.encoder_path))
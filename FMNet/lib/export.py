@@ -0,0 +1,64 @@
+"""
+Graph capture of a full Network for one fixed input shape, saved as an artifact that loads
+without the Python model code:
+
+    'trace'  -> TorchScript (torch.jit.trace), .pt, optionally frozen for inference
+    'export' -> torch.export program (non-strict), .pt2
+
+Capture specializes on the example shape: the token-grid sizes in LinearAttention_B, the
+rearrange patterns, the cached RoPE tables and the FFT shapes become constants of the
+graph, and the Python-side dispatch of every call disappears. The artifact only accepts
+the shape it was captured with, which is stored next to it.
+"""
+import json
+
+import torch
+import torch.nn as nn
+
+METHODS = ('trace', 'export')
+
+
+class FinalMap(nn.Module):
+    """Network with a single tensor in and out: the final logit map (return_all=False)."""
+
+    def __init__(self, model):
+        super(FinalMap, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x, return_all=False)
+
+
+def export_network(model, shape, path, method='trace', freeze=False, device=None):
+    """
+    Capture model (eval mode) for inputs of `shape` (B, 3, H, W) on `device` and save it to
+    path. freeze folds parameters into the TorchScript graph (trace only).
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, got {}'.format(METHODS, method))
+    if path.endswith('.pt2') != (method == 'export'):
+        raise ValueError("save 'export' artifacts as .pt2 and 'trace' ones as .pt, got {}".format(path))
+    device = torch.device(device or next(model.parameters()).device)
+    wrapped = FinalMap(model.to(device).eval()).eval()
+    example = torch.randn(*shape, device=device)
+    meta = {'_meta.json': json.dumps({'shape': list(shape), 'method': method, 'device': device.type})}
+    with torch.no_grad():
+        if method == 'trace':
+            artifact = torch.jit.trace(wrapped, example, check_trace=False)
+            if freeze:
+                artifact = torch.jit.freeze(artifact)
+            torch.jit.save(artifact, path, _extra_files=meta)
+        else:
+            program = torch.export.export(wrapped, (example,), strict=False)
+            torch.export.save(program, path, extra_files=meta)
+    return path
+
+
+def load_exported(path, device=None):
+    """Load an artifact of export_network. Returns (callable module, captured input shape)."""
+    meta = {'_meta.json': ''}
+    if path.endswith('.pt2'):
+        module = torch.export.load(path, extra_files=meta).module()
+    else:
+        module = torch.jit.load(path, map_location=device, _extra_files=meta)
+    return module, tuple(json.loads(meta['_meta.json'])['shape'])
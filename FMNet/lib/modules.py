@@ -5,6 +5,7 @@ import fvcore.nn.weight_init as weight_init
 import numbers
 from torch.nn import Softmax
 import math
+from collections import OrderedDict
 import torch.utils.checkpoint as checkpoint
 from functools import partial
 from typing import Optional, Callable
@@ -104,6 +105,56 @@ def custom_complex_normalization(input_tensor, dim=-1):
     return normalized_tensor
 
 
+def full_precision(x):
+    """
+    Autocast-disabled region on x's device. FFTs, complex products and the rotary tables
+    run in fp32 inside it (cuFFT has no bf16 and fp16 only for power-of-two sizes, and
+    spectra easily leave the fp16 range), while the rest of the network stays under AMP.
+    """
+    return torch.autocast(x.device.type, enabled=False)
+
+
+def spectral_gate(x, gate, spectral='fft'):
+    """
+    abs(ifft2(gate(Re X) * X)) with X = fft2(x) for a real map x.
+
+    With spectral='rfft' only the non-redundant half of the Hermitian spectrum is
+    computed. gate is pointwise in space and Re X is symmetric, so the result is the
+    same up to float error, except that BatchNorm inside gate sees half the bins
+    when collecting training statistics. 'fft' keeps the original computation.
+
+    Computed in fp32 (gate included) and returned in the dtype of x.
+    """
+    dtype = x.dtype
+    with full_precision(x):
+        x = x.float()
+        if spectral == 'rfft':
+            X = torch.fft.rfft2(x)
+            out = torch.abs(torch.fft.irfft2(gate(X.real) * X, s=x.shape[-2:]))
+        else:
+            X = torch.fft.fft2(x)
+            out = torch.abs(torch.fft.ifft2(gate(X.real) * X))
+    return out.to(dtype)
+
+
+def spectrum_magnitude(x, spectral='fft'):
+    """
+    abs(fft2(x)) for a real map x; 'rfft' computes half and mirrors the rest.
+    Always returned in fp32, the raw magnitude can exceed the fp16 range.
+    """
+    with full_precision(x):
+        x = x.float()
+        if spectral != 'rfft':
+            return torch.abs(torch.fft.fft2(x))
+        half = torch.abs(torch.fft.rfft2(x))
+        missing = x.shape[-1] - half.shape[-1]
+        if missing == 0:
+            return half
+        # |X(u, v)| = |X(-u, -v)|: mirror columns 1..missing and map rows u -> -u mod H
+        mirror = torch.roll(half[..., 1:missing + 1].flip(-1).flip(-2), 1, dims=-2)
+        return torch.cat((half, mirror), dim=-1)
+
+
 class Mlp(nn.Module):
     def __init__(self, in_features, hidden_features=None, out_features=None, act_layer=nn.GELU, drop=0.):
         super().__init__()
@@ -143,14 +194,15 @@ class LinearAttention_B(nn.Module):
         self.lepe = nn.Conv2d(dim, dim, 3, padding=1, groups=dim)
         self.rope = RoPE(shape=(input_resolution[0], input_resolution[1], dim))
 
-    def forward(self, x):
+    def forward(self, x, h=None, w=None):
         """
         Args:
             x: input features with shape of (B, N, C)
+            h, w: spatial size of the token grid, N = h * w. Square if omitted.
         """
         b, n, c = x.shape
-        h = int(n ** 0.5)
-        w = int(n ** 0.5)
+        if h is None or w is None:
+            h = w = int(n ** 0.5)
         num_heads = self.num_heads
         head_dim = c // num_heads
 
@@ -184,8 +236,13 @@ class LinearAttention_B(nn.Module):
     
 class RoPE(torch.nn.Module):
     r"""Rotary Positional Embedding.
+
+    Rotation tables are built lazily for every spatial shape seen in forward and kept in a
+    small LRU cache keyed by (shape, device, dtype), so the same module serves any input
+    resolution and aspect ratio. `shape` only fixes the feature dim and the number of
+    spatial dims.
     """
-    def __init__(self, shape, base=10000):
+    def __init__(self, shape, base=10000, cache_size=8):
         super(RoPE, self).__init__()
 
         channel_dims, feature_dim = shape[:-1], shape[-1]
@@ -193,22 +250,49 @@ class RoPE(torch.nn.Module):
 
         assert feature_dim % k_max == 0
 
+        self.base = base
+        self.k_max = k_max
+        self.cache_size = cache_size
+        self.tables = OrderedDict()
+
+    def rotations(self, channel_dims, device, dtype=torch.float32):
+        key = (tuple(channel_dims), device, dtype)
+        table = self.tables.get(key)
+        if table is not None:
+            self.tables.move_to_end(key)
+            return table
+
         # angles
-        theta_ks = 1 / (base ** (torch.arange(k_max) / k_max))
+        theta_ks = 1 / (self.base ** (torch.arange(self.k_max) / self.k_max))
         angles = torch.cat([t.unsqueeze(-1) * theta_ks for t in torch.meshgrid([torch.arange(d) for d in channel_dims], indexing='ij')], dim=-1)
 
         # rotation
         rotations_re = torch.cos(angles).unsqueeze(dim=-1)
         rotations_im = torch.sin(angles).unsqueeze(dim=-1)
-        rotations = torch.cat([rotations_re, rotations_im], dim=-1)
-        self.register_buffer('rotations', rotations)
+        rotations = torch.cat([rotations_re, rotations_im], dim=-1).to(device=device, dtype=dtype)
+        table = torch.view_as_complex(rotations)
+
+        self.tables[key] = table
+        if len(self.tables) > self.cache_size:
+            self.tables.popitem(last=False)
+        return table
 
     def forward(self, x):
-        if x.dtype != torch.float32:
-            x = x.to(torch.float32)
-        x = torch.view_as_complex(x.reshape(*x.shape[:-1], -1, 2))
-        pe_x = torch.view_as_complex(self.rotations) * x
-        return torch.view_as_real(pe_x).flatten(-2)
+        # complex rotation in fp32 (see full_precision), result back in the input dtype
+        dtype = x.dtype
+        with full_precision(x):
+            x = x.float()
+            rotations = self.rotations(x.shape[1:-1], x.device, x.dtype)
+            x = torch.view_as_complex(x.reshape(*x.shape[:-1], -1, 2))
+            pe_x = torch.view_as_real(rotations * x).flatten(-2)
+        return pe_x.to(dtype)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints written before the tables were cached carry a fixed-size buffer
+        state_dict.pop(prefix + 'rotations', None)
+        super(RoPE, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+
 def custom_complex_normalization(input_tensor, dim=-1):
     real_part = input_tensor.real
     imag_part = input_tensor.imag
@@ -243,14 +327,15 @@ class LinearAttention(nn.Module):
         self.lepe = nn.Conv2d(dim, dim, 3, padding=1, groups=dim)
         self.rope = RoPE(shape=(input_resolution[0], input_resolution[1], dim))
 
-    def forward(self, x):
+    def forward(self, x, h=None, w=None):
         """
         Args:
             x: input features with shape of (B, N, C)
+            h, w: spatial size of the token grid, N = h * w. Square if omitted.
         """
         b, n, c = x.shape
-        h = int(n ** 0.5)
-        w = int(n ** 0.5)
+        if h is None or w is None:
+            h = w = int(n ** 0.5)
         num_heads = self.num_heads
         head_dim = c // num_heads
 
@@ -285,13 +370,14 @@ class LinearAttention(nn.Module):
 
 class MFM(nn.Module):
      def __init__(self, dim,out_channel, input_resolution, num_heads, mlp_ratio=4., qkv_bias=True, drop=0., drop_path=0.,
-                 act_layer=nn.GELU, norm_layer=nn.LayerNorm, sr_ratio = 1, **kwargs):
+                 act_layer=nn.GELU, norm_layer=nn.LayerNorm, sr_ratio = 1, spectral='fft', **kwargs):
         super().__init__()
 
         self.dim = dim
         self.input_resolution = input_resolution
         self.num_heads = num_heads
         self.mlp_ratio = mlp_ratio
+        self.spectral = spectral
 
         self.cpe1 = nn.Conv2d(dim, dim, 3, padding=1, groups=dim)
         self.norm1 = norm_layer(dim)
@@ -361,34 +447,32 @@ class MFM(nn.Module):
 
         x = x.flatten(2).permute(0, 2, 1) + self.cpe1(x).flatten(2).permute(0, 2, 1)
         shortcut = x
-        tepx = torch.fft.fft2(x.reshape(B, H, W, C).permute(0, 3, 1, 2).float())
-        fmt = self.relu(self.norm(torch.abs(torch.fft.ifft2(self.weight(tepx.real) * tepx)))).flatten(2).permute(0, 2, 1)
+        fmt = self.relu(self.norm(spectral_gate(x.reshape(B, H, W, C).permute(0, 3, 1, 2), self.weight, self.spectral))).flatten(2).permute(0, 2, 1)
         
 
         x_s = self.norm1(x)
         x_s3 = self.dwconv_3(x_s.reshape(B, H, W, C).permute(0, 3, 1, 2)).flatten(2).permute(0, 2, 1)
         x_s5 = self.dwconv_5(x_s.reshape(B, H, W, C).permute(0, 3, 1, 2)).flatten(2).permute(0, 2, 1)
         act_res = self.act(self.act_proj(x_s.reshape(B, H, W, C).permute(0, 3, 1, 2)).permute(0, 2, 3, 1).view(B, L, C ))
-        x_s3 = self.in_proj2(x_s3.reshape(B, H, W, C // 2))
+        x_s3 = self.in_proj2(x_s3.reshape(B, H, W, C // 2).permute(0, 3, 1, 2)).permute(0, 2, 3, 1)
         x_s3 = self.act(self.dwc2(x_s3.permute(0, 3, 1, 2))).permute(0, 2, 3, 1).view(B, L, C // 2)
-        x_s5 = self.in_proj2(x_s5.reshape(B, H, W, C // 2))
+        x_s5 = self.in_proj2(x_s5.reshape(B, H, W, C // 2).permute(0, 3, 1, 2)).permute(0, 2, 3, 1)
         x_s5 = self.act(self.dwc2(x_s5.permute(0, 3, 1, 2))).permute(0, 2, 3, 1).view(B, L, C // 2)
 
 
         # Linear Attention
-        x_s3 = self.attn(x_s3)
-        x_s5 = self.attn(x_s5)
+        x_s3 = self.attn(x_s3, H, W)
+        x_s5 = self.attn(x_s5, H, W)
         x_s = torch.cat((x_s3,x_s5),2)
 
         x_s = self.out_proj((x_s * act_res).reshape(B, H, W, C).permute(0, 3, 1, 2)).permute(0, 2, 3, 1).view(B, L, C )
         x = shortcut + self.drop_path(x) + fmt
         x = x + self.cpe2(x.reshape(B, H, W, C).permute(0, 3, 1, 2)).flatten(2).permute(0, 2, 1)
 
-        tepx = torch.fft.fft2(x.reshape(B, H, W, C).permute(0, 3, 1, 2).float())
-        fmt = self.relu(self.norm(torch.abs(torch.fft.ifft2(self.weight(tepx.real) * tepx)))).flatten(2).permute(0, 2, 1)
+        fmt = self.relu(self.norm(spectral_gate(x.reshape(B, H, W, C).permute(0, 3, 1, 2), self.weight, self.spectral))).flatten(2).permute(0, 2, 1)
 
         # FFN
-        x = x + self.drop_path(self.ffn(self.norm2(x).reshape(B, H, W, C).permute(0, 3, 1, 2))).flatten(2).permute(0, 2, 1) + fmt
+        x = x + self.drop_path(self.ffn(self.norm2(x))) + fmt
         x = x.reshape(B, H, W, C).permute(0, 3, 1, 2) # B C H W
         x = self.project_out(x)
 
@@ -398,7 +482,48 @@ class MFM(nn.Module):
 
      def extra_repr(self) -> str:
         return f"dim={self.dim}, input_resolution={self.input_resolution}, num_heads={self.num_heads}, " \
-               f"mlp_ratio={self.mlp_ratio}"
+               f"mlp_ratio={self.mlp_ratio}, spectral={self.spectral}"
+
+
+class FrequencyAttention(nn.Module):
+    r"""Channel attention in the Fourier domain plus a learned spectral gate, with a residual.
+
+    The spectrum of the input is computed once and shared as query, key and value (they were
+    always the same tensor) and by the gating path.
+
+    Args:
+        dim (int): Number of input channels.
+        num_heads (int): Number of attention heads.
+    """
+    def __init__(self, dim, num_heads=8):
+        super(FrequencyAttention, self).__init__()
+        self.num_heads = num_heads
+        self.temperature = nn.Parameter(torch.ones(num_heads, 1, 1))
+        self.project_out = nn.Conv2d(dim*2, dim, kernel_size=1, bias=False)
+
+        self.weight = nn.Sequential(
+            nn.Conv2d(dim, dim // 16, 1, bias=True),
+            nn.BatchNorm2d(dim // 16),
+            nn.ReLU(True),
+            nn.Conv2d(dim // 16, dim, 1, bias=True),
+            nn.Sigmoid())
+
+    def forward(self, x):
+        b, c, h, w = x.shape
+
+        # the spectral attention and gate run in fp32, project_out under AMP if enabled
+        with full_precision(x):
+            spectrum = torch.fft.fft2(x.float())
+
+            qkv = rearrange(spectrum, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
+            qk = torch.nn.functional.normalize(qkv, dim=-1)
+            attn = (qk @ qk.transpose(-2, -1)) * self.temperature
+            attn = custom_complex_normalization(attn, dim=-1)
+            out_f = torch.abs(torch.fft.ifft2(attn @ qkv))
+            out_f = rearrange(out_f, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
+            out_f_l = torch.abs(torch.fft.ifft2(self.weight(spectrum.real)*spectrum))
+        out = self.project_out(torch.cat((out_f,out_f_l),1).to(x.dtype))
+        return torch.add(out, x)
 
 
 class PFAE(nn.Module): 
@@ -461,120 +586,30 @@ class PFAE(nn.Module):
             nn.Conv2d(down_dim//2, 1, kernel_size=1)
         )
 
-
-        self.temperature = nn.Parameter(torch.ones(8, 1, 1))
-        self.project_out = nn.Conv2d(down_dim*2, down_dim, kernel_size=1, bias=False)
-
-        self.weight = nn.Sequential(
-            nn.Conv2d(down_dim, down_dim // 16, 1, bias=True),
-            nn.BatchNorm2d(down_dim // 16),
-            nn.ReLU(True),
-            nn.Conv2d(down_dim // 16, down_dim, 1, bias=True),
-            nn.Sigmoid())
+        # shared by the four dilated branches
+        self.freq_attn = FrequencyAttention(down_dim, num_heads=8)
 
         self.softmax = Softmax(dim=-1)
         self.norm = nn.BatchNorm2d(down_dim)
         self.relu = nn.ReLU(True)
         self.num_heads = 8
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before FrequencyAttention kept its parameters on PFAE itself
+        for key in list(state_dict.keys()):
+            name = key[len(prefix):]
+            if key.startswith(prefix) and name.split('.')[0] in ('temperature', 'project_out', 'weight'):
+                state_dict[prefix + 'freq_attn.' + name] = state_dict.pop(key)
+        super(PFAE, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x):
         x = self.down_conv(x)
         conv1 = self.conv1(x)
 
-       
-        conv2 = self.conv2(x)
-        b, c, h, w = conv2.shape
-
-        q_f_2 = torch.fft.fft2(conv2.float())
-        k_f_2 = torch.fft.fft2(conv2.float())
-        v_f_2 = torch.fft.fft2(conv2.float())
-        tepqkv = torch.fft.fft2(conv2.float())
-
-        q_f_2 = rearrange(q_f_2, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        k_f_2 = rearrange(k_f_2, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        v_f_2 = rearrange(v_f_2, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-
-        q_f_2 = torch.nn.functional.normalize(q_f_2, dim=-1)
-        k_f_2 = torch.nn.functional.normalize(k_f_2, dim=-1)
-        attn_f_2 = (q_f_2 @ k_f_2.transpose(-2, -1)) * self.temperature
-        attn_f_2 = custom_complex_normalization(attn_f_2, dim=-1)
-        out_f_2 = torch.abs(torch.fft.ifft2(attn_f_2 @ v_f_2))
-        out_f_2 = rearrange(out_f_2, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
-        out_f_l_2 = torch.abs(torch.fft.ifft2(self.weight(tepqkv.real)*tepqkv))
-        out_2 = self.project_out(torch.cat((out_f_2,out_f_l_2),1))
-        F_2 = torch.add(out_2, conv2)
-
-
-
-        conv3 = self.conv3(x+F_2)
-        b, c, h, w = conv3.shape
-
-        q_f_3 = torch.fft.fft2(conv3.float())
-        k_f_3 = torch.fft.fft2(conv3.float())
-        v_f_3 = torch.fft.fft2(conv3.float())
-        tepqkv = torch.fft.fft2(conv3.float())
-
-        q_f_3 = rearrange(q_f_3, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        k_f_3 = rearrange(k_f_3, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        v_f_3 = rearrange(v_f_3, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-
-        q_f_3 = torch.nn.functional.normalize(q_f_3, dim=-1)
-        k_f_3 = torch.nn.functional.normalize(k_f_3, dim=-1)
-        attn_f_3 = (q_f_3 @ k_f_3.transpose(-2, -1)) * self.temperature
-        attn_f_3 = custom_complex_normalization(attn_f_3, dim=-1)
-        out_f_3 = torch.abs(torch.fft.ifft2(attn_f_3 @ v_f_3))
-        out_f_3 = rearrange(out_f_3, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
-        out_f_l_3 = torch.abs(torch.fft.ifft2(self.weight(tepqkv.real)*tepqkv))
-        out_3 = self.project_out(torch.cat((out_f_3,out_f_l_3),1))
-        F_3 = torch.add(out_3, conv3)
-
-
-
-        conv4 = self.conv4(x+F_3)
-        b, c, h, w = conv4.shape
-
-        q_f_4 = torch.fft.fft2(conv4.float())
-        k_f_4 = torch.fft.fft2(conv4.float())
-        v_f_4 = torch.fft.fft2(conv4.float())
-        tepqkv = torch.fft.fft2(conv4.float())
-
-        q_f_4 = rearrange(q_f_4, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        k_f_4 = rearrange(k_f_4, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        v_f_4 = rearrange(v_f_4, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-
-        q_f_4 = torch.nn.functional.normalize(q_f_4, dim=-1)
-        k_f_4 = torch.nn.functional.normalize(k_f_4, dim=-1)
-        attn_f_4 = (q_f_4 @ k_f_4.transpose(-2, -1)) * self.temperature
-        attn_f_4 = custom_complex_normalization(attn_f_4, dim=-1)
-        out_f_4 = torch.abs(torch.fft.ifft2(attn_f_4 @ v_f_4))
-        out_f_4 = rearrange(out_f_4, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
-        out_f_l_4 = torch.abs(torch.fft.ifft2(self.weight(tepqkv.real)*tepqkv))
-        out_4 = self.project_out(torch.cat((out_f_4,out_f_l_4),1))
-        F_4 = torch.add(out_4, conv4)
-
-        conv5 = self.conv5(x+F_4)
-        b, c, h, w = conv5.shape
-
-        q_f_5 = torch.fft.fft2(conv5.float())
-        k_f_5 = torch.fft.fft2(conv5.float())
-        v_f_5 = torch.fft.fft2(conv5.float())
-        tepqkv = torch.fft.fft2(conv5.float())
-
-        q_f_5 = rearrange(q_f_5, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        k_f_5 = rearrange(k_f_5, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-        v_f_5 = rearrange(v_f_5, 'b (head c) h w -> b head c (h w)', head=self.num_heads)
-
-        q_f_5 = torch.nn.functional.normalize(q_f_5, dim=-1)
-        k_f_5 = torch.nn.functional.normalize(k_f_5, dim=-1)
-        attn_f_5 = (q_f_5 @ k_f_5.transpose(-2, -1)) * self.temperature
-        attn_f_5 = custom_complex_normalization(attn_f_5, dim=-1)
-        out_f_5 = torch.abs(torch.fft.ifft2(attn_f_5 @ v_f_5))
-        out_f_5 = rearrange(out_f_5, 'b head c (h w) -> b (head c) h w', head=self.num_heads, h=h, w=w)
-        out_f_l_5 = torch.abs(torch.fft.ifft2(self.weight(tepqkv.real)*tepqkv))
-        out_5 = self.project_out(torch.cat((out_f_5,out_f_l_5),1))
-        F_5 = torch.add(out_5, conv5)
-
-
+        F_2 = self.freq_attn(self.conv2(x))
+        F_3 = self.freq_attn(self.conv3(x+F_2.repeat(1, 2, 1, 1)))
+        F_4 = self.freq_attn(self.conv4(x+F_3.repeat(1, 2, 1, 1)))
+        F_5 = self.freq_attn(self.conv5(x+F_4.repeat(1, 2, 1, 1)))
 
         conv5 = F.upsample(self.conv6(F.adaptive_avg_pool2d(x, 1)), size=x.size()[2:], mode='bilinear') # 如果batch设为1，这里就会有问题。
 
@@ -584,8 +619,9 @@ class PFAE(nn.Module):
 
 
 class FRD_1(nn.Module): 
-    def __init__(self, in_channels, mid_channels):
+    def __init__(self, in_channels, mid_channels, spectral='fft'):
         super(FRD_1, self).__init__()
+        self.spectral = spectral
         self.conv = nn.Sequential(
             nn.Conv2d(in_channels * 2, in_channels, kernel_size=1), nn.BatchNorm2d(in_channels),
             nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, stride=1), nn.BatchNorm2d(in_channels),
@@ -623,7 +659,7 @@ class FRD_1(nn.Module):
         yt_s = self.conv3(yt)
         yt_out = yt_s
 
-        r_prior_cam_f = torch.abs(torch.fft.fft2(prior_cam))
+        r_prior_cam_f = spectrum_magnitude(prior_cam, self.spectral)
         r_prior_cam_f = -1 * (torch.sigmoid(r_prior_cam_f)) + 1
         r_prior_cam_s = -1 * (torch.sigmoid(prior_cam)) + 1
         r_prior_cam = r_prior_cam_s + r_prior_cam_f
@@ -637,8 +673,9 @@ class FRD_1(nn.Module):
         return y
 
 class FRD_2(nn.Module): 
-    def __init__(self, in_channels, mid_channels):
+    def __init__(self, in_channels, mid_channels, spectral='fft'):
         super(FRD_2, self).__init__()
+        self.spectral = spectral
         self.conv = nn.Sequential(
             nn.Conv2d(in_channels * 3, in_channels, kernel_size=1), nn.BatchNorm2d(in_channels),
             nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, stride=1), nn.BatchNorm2d(in_channels),
@@ -676,12 +713,12 @@ class FRD_2(nn.Module):
         yt_s = self.conv3(yt)
         yt_out = yt_s
 
-        r_prior_cam_f = torch.abs(torch.fft.fft2(prior_cam))
+        r_prior_cam_f = spectrum_magnitude(prior_cam, self.spectral)
         r_prior_cam_f = -1 * (torch.sigmoid(r_prior_cam_f)) + 1
         r_prior_cam_s = -1 * (torch.sigmoid(prior_cam)) + 1
         r_prior_cam = r_prior_cam_s + r_prior_cam_f
 
-        r1_prior_cam_f = torch.abs(torch.fft.fft2(x1_prior_cam))
+        r1_prior_cam_f = spectrum_magnitude(x1_prior_cam, self.spectral)
         r1_prior_cam_f = -1 * (torch.sigmoid(r1_prior_cam_f)) + 1
         r1_prior_cam_s = -1 * (torch.sigmoid(x1_prior_cam)) + 1
         r1_prior_cam = r1_prior_cam_s + r1_prior_cam_f
@@ -697,8 +734,9 @@ class FRD_2(nn.Module):
         return y
 
 class FRD_3(nn.Module): 
-    def __init__(self, in_channels, mid_channels):
+    def __init__(self, in_channels, mid_channels, spectral='fft'):
         super(FRD_3, self).__init__()
+        self.spectral = spectral
         self.conv = nn.Sequential(
             nn.Conv2d(in_channels * 4, in_channels, kernel_size=1), nn.BatchNorm2d(in_channels),
             nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, stride=1), nn.BatchNorm2d(in_channels),
@@ -737,17 +775,17 @@ class FRD_3(nn.Module):
         yt_s = self.conv3(yt)
         yt_out = yt_s
 
-        r_prior_cam_f = torch.abs(torch.fft.fft2(prior_cam))
+        r_prior_cam_f = spectrum_magnitude(prior_cam, self.spectral)
         r_prior_cam_f = -1 * (torch.sigmoid(r_prior_cam_f)) + 1
         r_prior_cam_s = -1 * (torch.sigmoid(prior_cam)) + 1
         r_prior_cam = r_prior_cam_s + r_prior_cam_f
 
-        r1_prior_cam_f = torch.abs(torch.fft.fft2(x1_prior_cam))
+        r1_prior_cam_f = spectrum_magnitude(x1_prior_cam, self.spectral)
         r1_prior_cam_f = -1 * (torch.sigmoid(r1_prior_cam_f)) + 1
         r1_prior_cam_s = -1 * (torch.sigmoid(x1_prior_cam)) + 1
         r1_prior_cam1 = r1_prior_cam_s + r1_prior_cam_f
 
-        r2_prior_cam_f = torch.abs(torch.fft.fft2(x2_prior_cam))
+        r2_prior_cam_f = spectrum_magnitude(x2_prior_cam, self.spectral)
         r2_prior_cam_f = -1 * (torch.sigmoid(r2_prior_cam_f)) + 1
         r2_prior_cam_s = -1 * (torch.sigmoid(x2_prior_cam)) + 1
         r1_prior_cam2 = r2_prior_cam_s + r2_prior_cam_f
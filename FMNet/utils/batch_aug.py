@@ -0,0 +1,114 @@
+"""
+Batched, tensor-side version of the PolypObjDataset augmentations.
+
+The dataset only decodes and resizes (augment=False returns uint8 tensors), and
+`batch_augment` then applies flip, crop, rotation, the four ImageEnhance colour ops and
+salt-and-pepper noise to the whole uint8 batch on whatever device it lives on, with the
+same parameter ranges as cv_random_flip / randomCrop / randomRotation / colorEnhance /
+randomPeper. Geometry is one affine grid per sample shared by image, GT and edge.
+"""
+import math
+
+import torch
+import torch.nn.functional as F
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def _randint(low, high, n, generator):
+    # same half-open ranges as random.randint(low, high - 1) / np.random.randint(low, high)
+    return torch.randint(low, high, (n,), generator=generator).float()
+
+
+def _gray(images):
+    # ITU-R 601-2 luma rounded to uint8 levels, as PIL's convert('L')
+    r, g, b = images[:, 0:1], images[:, 1:2], images[:, 2:3]
+    return (r * 0.299 + g * 0.587 + b * 0.114).round_()
+
+
+def _blend(degenerate, images, factor):
+    # PIL ImageEnhance: degenerate + factor * (image - degenerate), clipped and truncated to uint8 as Image.blend
+    out = images - degenerate
+    out.mul_(factor.view(-1, 1, 1, 1)).add_(degenerate)
+    return out.clamp_(0, 255).floor_()
+
+
+def geometry(n, size, generator=None, border=30):
+    """
+    Affine matrices for flip -> centered crop (width and height drawn independently in
+    [size - border, size), as randomCrop) -> rotation (p=0.2, angle in [-15, 15)), mapping
+    output to input coordinates.
+    """
+    flip = torch.where(torch.rand(n, generator=generator) < 0.5, -1.0, 1.0)
+    crop_x = (size - _randint(1, border + 1, n, generator)) / size
+    crop_y = (size - _randint(1, border + 1, n, generator)) / size
+    rotate = torch.rand(n, generator=generator) > 0.8
+    angle = torch.where(rotate, _randint(-15, 15, n, generator), torch.zeros(n)) * math.pi / 180
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    theta = torch.zeros(n, 2, 3)
+    theta[:, 0, 0] = crop_x * cos * flip
+    theta[:, 0, 1] = -crop_x * sin
+    theta[:, 1, 0] = crop_y * sin * flip
+    theta[:, 1, 1] = crop_y * cos
+    return theta
+
+
+def color_enhance(images, generator=None):
+    """Brightness, contrast, saturation and sharpness in colorEnhance's order and ranges, on 0..255 floats."""
+    n = images.shape[0]
+    device = images.device
+    brightness = _randint(5, 16, n, generator).to(device) / 10.0
+    contrast = _randint(5, 16, n, generator).to(device) / 10.0
+    color = _randint(0, 21, n, generator).to(device) / 10.0
+    sharpness = _randint(0, 31, n, generator).to(device) / 10.0
+
+    images = _blend(torch.zeros_like(images), images, brightness)
+    mean = _gray(images).mean(dim=(1, 2, 3), keepdim=True).add(0.5).floor()
+    images = _blend(mean.expand_as(images), images, contrast)
+    images = _blend(_gray(images).expand_as(images), images, color)
+
+    # PIL's SMOOTH filter [[1, 1, 1], [1, 5, 1], [1, 1, 1]] / 13 as a box sum plus 4x centre
+    # (much cheaper than a depthwise conv on CPU); border pixels are left untouched
+    smooth = (F.avg_pool2d(images, 3, stride=1) * 9 + images[:, :, 1:-1, 1:-1] * 4) / 13
+    degenerate = images.clone()
+    degenerate[:, :, 1:-1, 1:-1] = smooth.round()
+    return _blend(degenerate, images, sharpness)
+
+
+def pepper(masks, generator=None, amount=0.0015):
+    """Salt-and-pepper on (B, 1, H, W) maps in 0..255, int(amount * H * W) draws per sample."""
+    b, _, h, w = masks.shape
+    num = int(amount * h * w)
+    index = torch.randint(0, h * w, (b, num), generator=generator).to(masks.device)
+    value = torch.randint(0, 2, (b, num), generator=generator).to(masks) * 255
+    return masks.flatten(1).scatter(1, index, value).view_as(masks)
+
+
+def batch_augment(images, gts, edges=None, generator=None):
+    """
+    images (B, 3, S, S), gts / edges (B, 1, S, S) uint8 batches from PolypObjDataset(augment=False).
+    Returns the normalized image batch, GT in [0, 1] and binarized edges, like __getitem__.
+    With edges=None (a loader built without the 'edge' target) only images and GT are returned.
+    `generator` is a CPU torch.Generator driving every random draw. GT and edges are moved to
+    the device of images.
+    """
+    b, _, h, w = images.shape
+    maps = (gts,) if edges is None else (gts, edges)
+    stack = torch.cat((images,) + tuple(m.to(images.device, non_blocking=True) for m in maps), dim=1).float()
+
+    theta = geometry(b, w, generator).to(stack.device)
+    grid = F.affine_grid(theta, list(stack.shape), align_corners=False)
+    stack = F.grid_sample(stack, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    images = color_enhance(stack[:, :3].round(), generator)
+    gts = pepper(stack[:, 3:4], generator)
+
+    mean = images.new_tensor(MEAN).view(1, 3, 1, 1)
+    std = images.new_tensor(STD).view(1, 3, 1, 1)
+    images = (images / 255 - mean) / std
+    gts = gts / 255
+    if edges is None:
+        return images, gts
+    edges = (pepper(stack[:, 4:5], generator) > 0).float()
+    return images, gts, edges
@@ -0,0 +1,111 @@
+"""
+Packed training-set cache.
+
+`build_cache` decodes TrainDataset/Imgs|GT|Edge once (image as RGB, GT as L, edge as
+grayscale already dilated; edges are skipped when `edge_root` is None) into one flat uint8 file `<cache>.bin`, with `<cache>.npz`
+holding the per-sample offsets, shapes and names. `PackedSamples` memory-maps the file
+and hands out zero-copy numpy views, so epochs decode nothing and dataset start-up scans
+no directories.
+"""
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def cache_files(cache_path):
+    return cache_path + '.bin', cache_path + '.npz'
+
+
+def list_samples(image_root, gt_root, edge_root=None):
+    """Sorted, size-matched (image, gt, edge) paths, same rules as PolypObjDataset.filter_files.
+    edge is None for every sample when `edge_root` is None."""
+    images = sorted([image_root + f for f in os.listdir(image_root) if f.endswith('.jpg') or f.endswith('.png')])
+    gts = sorted([gt_root + f for f in os.listdir(gt_root) if f.endswith('.jpg') or f.endswith('.png')])
+    if edge_root is None:
+        edges = [None] * len(images)
+    else:
+        edges = sorted([edge_root + f for f in os.listdir(edge_root) if f.endswith('.jpg') or f.endswith('.png')])
+    assert len(images) == len(gts) and len(edges) == len(images)
+    samples = []
+    for img_path, gt_path, edge_path in zip(images, gts, edges):
+        # Image.open only parses the header
+        size = Image.open(img_path).size
+        if size == Image.open(gt_path).size and (edge_path is None or size == Image.open(edge_path).size):
+            samples.append((img_path, gt_path, edge_path))
+    return samples
+
+
+def build_cache(image_root, gt_root, edge_root, cache_path, kernel=np.ones((3, 3), np.uint8)):
+    """Decode every sample once and pack it into `<cache_path>.bin` + `<cache_path>.npz`."""
+    bin_path, index_path = cache_files(cache_path)
+    samples = list_samples(image_root, gt_root, edge_root)
+    offsets = np.zeros(len(samples), np.int64)
+    shapes = np.zeros((len(samples), 2), np.int64)
+
+    offset = 0
+    with open(bin_path + '.tmp', 'wb') as f:
+        for i, (img_path, gt_path, edge_path) in enumerate(samples):
+            image = np.asarray(Image.open(img_path).convert('RGB'), np.uint8)
+            gt = np.asarray(Image.open(gt_path).convert('L'), np.uint8)
+            arrays = (image, gt)
+            if edge_path is not None:
+                edge = cv2.dilate(cv2.imread(edge_path, cv2.IMREAD_GRAYSCALE), kernel, iterations=1)
+                arrays += (edge,)
+            offsets[i] = offset
+            shapes[i] = image.shape[:2]
+            for array in arrays:
+                f.write(np.ascontiguousarray(array).tobytes())
+                offset += array.size
+
+    names = np.array([os.path.basename(img_path) for img_path, _, _ in samples])
+    np.savez(index_path + '.tmp.npz', offsets=offsets, shapes=shapes, names=names,
+             has_edge=np.array(edge_root is not None))
+    os.replace(bin_path + '.tmp', bin_path)
+    os.replace(index_path + '.tmp.npz', index_path)
+    return cache_path
+
+
+class PackedSamples:
+    """Read-only view of a cache built by build_cache. The mapping is opened lazily per process."""
+
+    def __init__(self, cache_path):
+        self.bin_path, index_path = cache_files(cache_path)
+        index = np.load(index_path)
+        self.offsets = index['offsets']
+        self.shapes = index['shapes']
+        self.names = list(index['names'])
+        # caches built before edges became optional always hold them
+        self.has_edge = bool(index['has_edge']) if 'has_edge' in index.files else True
+        self.data = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if self.data is None:
+            # opened on first access so each DataLoader worker maps the file itself
+            self.data = np.memmap(self.bin_path, dtype=np.uint8, mode='r')
+        h, w = self.shapes[index]
+        start = self.offsets[index]
+        image = self.data[start:start + h * w * 3].reshape(h, w, 3)
+        start += h * w * 3
+        gt = self.data[start:start + h * w].reshape(h, w)
+        if not self.has_edge:
+            return image, gt, None
+        start += h * w
+        edge = self.data[start:start + h * w].reshape(h, w)
+        return image, gt, edge
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='pack TrainDataset/Imgs|GT|Edge into a memory-mapped cache')
+    parser.add_argument('--train_root', type=str, required=True)
+    parser.add_argument('--cache_path', type=str, required=True, help='writes <cache_path>.bin and <cache_path>.npz')
+    parser.add_argument('--no_edge', action='store_true', help='pack only Imgs|GT, for training without an edge loss')
+    opt = parser.parse_args()
+    build_cache(opt.train_root + 'Imgs/', opt.train_root + 'GT/', None if opt.no_edge else opt.train_root + 'Edge/',
+                opt.cache_path)
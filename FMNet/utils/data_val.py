@@ -7,6 +7,7 @@ import numpy as np
 from PIL import ImageEnhance
 import torch
 import cv2
+from utils.data_cache import PackedSamples
 
 
 
@@ -17,12 +18,11 @@ def cv_random_flip(img, label, edge):
     if flip_flag == 1:
         img = img.transpose(Image.FLIP_LEFT_RIGHT)
         label = label.transpose(Image.FLIP_LEFT_RIGHT)
-        edge = edge.transpose(Image.FLIP_LEFT_RIGHT)
+        edge = edge.transpose(Image.FLIP_LEFT_RIGHT) if edge is not None else None
     return img, label, edge
 
 
-def randomCrop(image, label, edge):
-    border = 30
+def randomCrop(image, label, edge, border=30):
     image_width = image.size[0]
     image_height = image.size[1]
     crop_win_width = np.random.randint(image_width - border, image_width)
@@ -30,7 +30,20 @@ def randomCrop(image, label, edge):
     random_region = (
         (image_width - crop_win_width) >> 1, (image_height - crop_win_height) >> 1, (image_width + crop_win_width) >> 1,
         (image_height + crop_win_height) >> 1)
-    return image.crop(random_region), label.crop(random_region), edge.crop(random_region)
+    return image.crop(random_region), label.crop(random_region), edge.crop(random_region) if edge is not None else None
+
+
+def bound_size(image, label, edge, work_size):
+    """
+    Uniformly downsample so the shorter side is at most work_size. Uniform scaling commutes
+    with the later crop and rotation, so the augmented geometry is unchanged. Returns the scale.
+    """
+    scale = min(1.0, work_size / min(image.size))
+    if scale < 1.0:
+        size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        image, label, edge = (a.resize(size, Image.BILINEAR, reducing_gap=2.0) if a is not None else None
+                              for a in (image, label, edge))
+    return image, label, edge, scale
 
 
 def randomRotation(image, label, edge):
@@ -39,7 +52,7 @@ def randomRotation(image, label, edge):
         random_angle = np.random.randint(-15, 15)
         image = image.rotate(random_angle, mode)
         label = label.rotate(random_angle, mode)
-        edge = edge.rotate(random_angle, mode)
+        edge = edge.rotate(random_angle, mode) if edge is not None else None
     return image, label, edge
 
 
@@ -55,49 +68,58 @@ def colorEnhance(image):
     return image
 
 
-def randomGaussian(image, mean=0.1, sigma=0.35):
-    def gaussianNoisy(im, mean=mean, sigma=sigma):
-        for _i in range(len(im)):
-            im[_i] += random.gauss(mean, sigma)
-        return im
+def _randint(rng, low, high, size):
+    # rng: np.random.Generator for reproducible streams, None for the global (per-worker seeded) state
+    if rng is None:
+        return np.random.randint(low, high, size)
+    return rng.integers(low, high, size)
+
 
+def randomGaussian(image, mean=0.1, sigma=0.35, rng=None):
     img = np.asarray(image)
-    width, height = img.shape
-    img = gaussianNoisy(img[:].flatten(), mean, sigma)
-    img = img.reshape([width, height])
-    return Image.fromarray(np.uint8(img))
+    noise = (np.random if rng is None else rng).normal(mean, sigma, img.shape)
+    # float -> uint8 truncates toward zero like the old per-element in-place add, but clips instead of wrapping
+    img = np.clip(img + noise, 0, 255)
+    return Image.fromarray(img.astype(np.uint8))
 
 
-def randomPeper(img):
+def randomPeper(img, rng=None, amount=0.0015):
     img = np.array(img)
-    noiseNum = int(0.0015 * img.shape[0] * img.shape[1])
-    for i in range(noiseNum):
-
-        randX = random.randint(0, img.shape[0] - 1)
-
-        randY = random.randint(0, img.shape[1] - 1)
-
-        if random.randint(0, 1) == 0:
-
-            img[randX, randY] = 0
-
-        else:
-
-            img[randX, randY] = 255
+    noiseNum = int(amount * img.shape[0] * img.shape[1])
+    randX = _randint(rng, 0, img.shape[0], noiseNum)
+    randY = _randint(rng, 0, img.shape[1], noiseNum)
+    # half salt, half pepper
+    img[randX, randY] = _randint(rng, 0, 2, noiseNum).astype(np.uint8) * 255
     return Image.fromarray(img)
 
 
 # dataset for training
 class PolypObjDataset(data.Dataset):
-    def __init__(self, image_root, gt_root, edge_root, trainsize):
+    def __init__(self, image_root, gt_root, edge_root, trainsize, cache_path=None, augment=True, work_size=None,
+                 targets=('gt', 'edge')):
         self.trainsize = trainsize
-        self.images = [image_root + f for f in os.listdir(image_root) if f.endswith('.jpg')or f.endswith('.png')]
-        self.gts = [gt_root + f for f in os.listdir(gt_root) if f.endswith('.jpg') or f.endswith('.png')]
-        self.edges = [edge_root + f for f in os.listdir(edge_root) if f.endswith('.jpg') or f.endswith('.png')]
-        self.images = sorted(self.images)
-        self.gts = sorted(self.gts)
-        self.edges = sorted(self.edges)
-        self.filter_files()
+        # targets the losses consume; without 'edge' no Edge/ folder is needed and samples are (image, gt)
+        self.with_edge = 'edge' in targets
+        # resize-before-augment: bound the shorter side to work_size before cropping/rotating/enhancing,
+        # so the per-sample cost follows trainsize instead of the source resolution
+        self.work_size = work_size
+        # augment=False only resizes and returns uint8 tensors, for utils.batch_aug.batch_augment
+        self.augment = augment
+        # packed cache built by utils.data_cache.build_cache: no directory scan, no decode
+        self.packed = PackedSamples(cache_path) if cache_path is not None else None
+        if self.packed is not None:
+            if self.with_edge and not self.packed.has_edge:
+                raise ValueError('{} was built without edges but the edge target was requested'.format(cache_path))
+            self.images = self.packed.names
+        else:
+            self.images = [image_root + f for f in os.listdir(image_root) if f.endswith('.jpg')or f.endswith('.png')]
+            self.gts = [gt_root + f for f in os.listdir(gt_root) if f.endswith('.jpg') or f.endswith('.png')]
+            self.edges = [edge_root + f for f in os.listdir(edge_root) if f.endswith('.jpg') or f.endswith('.png')] \
+                if self.with_edge else []
+            self.images = sorted(self.images)
+            self.gts = sorted(self.gts)
+            self.edges = sorted(self.edges)
+            self.filter_files()
         self.img_transform = transforms.Compose([
             transforms.Resize((self.trainsize, self.trainsize)),
             transforms.ToTensor(),
@@ -114,22 +136,54 @@ class PolypObjDataset(data.Dataset):
         self.size = len(self.images)
 
     def __getitem__(self, index):
-        image = self.rgb_loader(self.images[index])
-        gt = self.binary_loader(self.gts[index])
-        edge = cv2.imread(self.edges[index], cv2.IMREAD_GRAYSCALE)
-        edge = cv2.dilate(edge, self.kernel, iterations=1)
-        edge = Image.fromarray(edge)  
+        edge = None
+        if self.packed is not None:
+            image, gt, edge = self.packed[index]
+            image, gt = Image.fromarray(image), Image.fromarray(gt)
+            edge = Image.fromarray(edge) if self.with_edge else None
+        else:
+            image = self.rgb_loader(self.images[index])
+            gt = self.binary_loader(self.gts[index])
+            if self.with_edge:
+                edge = cv2.imread(self.edges[index], cv2.IMREAD_GRAYSCALE)
+                edge = cv2.dilate(edge, self.kernel, iterations=1)
+                edge = Image.fromarray(edge)  
+
+        if not self.augment:
+            size = (self.trainsize, self.trainsize)
+            image, gt = (torch.from_numpy(np.array(a.resize(size, Image.BILINEAR))) for a in (image, gt))
+            if edge is None:
+                return image.permute(2, 0, 1), gt.unsqueeze(0)
+            edge = torch.from_numpy(np.array(edge.resize(size, Image.BILINEAR)))
+            return image.permute(2, 0, 1), gt.unsqueeze(0), edge.unsqueeze(0)
+
+        return self.augment_sample(image, gt, edge)
+
+    def augment_sample(self, image, gt, edge):
+        border, gt_peper, edge_peper = 30, 0.0015, 0.0015
+        if self.work_size is not None:
+            image, gt, edge, scale = bound_size(image, gt, edge, self.work_size)
+            border = max(1, round(border * scale))
+            # salt-and-pepper used to be drawn at source resolution, where the final resize averages
+            # each flip over scale**-2 times more pixels: scale**2 as many GT flips keep its variance,
+            # while Threshold_process keeps every averaged-down edge flip, so the edge map needs
+            # the same number of flips, scale**-2 times the density
+            gt_peper *= scale ** 2
+            edge_peper = min(1.0, edge_peper / scale ** 2)
 
         image, gt, edge = cv_random_flip(image, gt, edge)
-        image, gt, edge = randomCrop(image, gt, edge)
+        image, gt, edge = randomCrop(image, gt, edge, border)
         image, gt, edge = randomRotation(image, gt, edge)
 
         image = colorEnhance(image)
-        gt = randomPeper(gt)
-        edge = randomPeper(edge)
+        gt = randomPeper(gt, amount=gt_peper)
 
         image = self.img_transform(image)
         gt = self.gt_transform(gt)
+        if edge is None:
+            return image, gt
+
+        edge = randomPeper(edge, amount=edge_peper)
         edge = self.edge_transform(edge)
 
         edge_small = self.Threshold_process(edge)
@@ -138,19 +192,20 @@ class PolypObjDataset(data.Dataset):
         return image, gt, edge_small
 
     def filter_files(self):
-        assert len(self.images) == len(self.gts) and len(self.edges) == len(self.images) \
-               and len(self.edges) == len(self.gts)
+        assert len(self.images) == len(self.gts)
+        assert not self.with_edge or len(self.edges) == len(self.images)
         images = []
         gts = []
         edges = []
-        for img_path, gt_path, edge_path in zip(self.images, self.gts, self.edges):
+        for i, (img_path, gt_path) in enumerate(zip(self.images, self.gts)):
             img = Image.open(img_path)
             gt = Image.open(gt_path)
-            edge = Image.open(edge_path)
+            edge = Image.open(self.edges[i]) if self.with_edge else gt
             if img.size == gt.size and img.size == edge.size:
                 images.append(img_path)
                 gts.append(gt_path)
-                edges.append(edge_path)
+                if self.with_edge:
+                    edges.append(self.edges[i])
         self.images = images
         self.gts = gts
         self.edges = edges
@@ -179,11 +234,16 @@ def seed_worker(worker_id):
     np.random.seed(worker_seed)
 
 # dataloader for training
-def get_loader(image_root, gt_root, edge_root, batchsize, trainsize, shuffle=True, num_workers=12, pin_memory=True):
-    dataset = PolypObjDataset(image_root, gt_root, edge_root, trainsize)
+def get_loader(image_root, gt_root, edge_root, batchsize, trainsize, shuffle=True, num_workers=12, pin_memory=True,
+               cache_path=None, augment=True, work_size=None, targets=('gt', 'edge'), distributed=False):
+    dataset = PolypObjDataset(image_root, gt_root, edge_root, trainsize, cache_path=cache_path, augment=augment,
+                              work_size=work_size, targets=targets)
+    # distributed: each rank iterates its own shard; call loader.sampler.set_epoch(epoch) every epoch
+    sampler = data.DistributedSampler(dataset, shuffle=shuffle) if distributed else None
     data_loader = data.DataLoader(dataset=dataset,
                                   batch_size=batchsize,
-                                  shuffle=shuffle,
+                                  shuffle=shuffle and sampler is None,
+                                  sampler=sampler,
                                   num_workers=num_workers,
                                   pin_memory=pin_memory,
                                   worker_init_fn=seed_worker)
@@ -193,7 +253,8 @@ def get_loader(image_root, gt_root, edge_root, batchsize, trainsize, shuffle=Tru
 # test dataset and loader
 class test_dataset:
     def __init__(self, image_root, gt_root, testsize):
-        self.testsize = testsize
+        # an int for square inputs or an (h, w) pair, both multiples of 32
+        self.testsize = testsize if isinstance(testsize, (tuple, list)) else (testsize, testsize)
 
         self.images = [image_root + f for f in os.listdir(image_root) if f.endswith('.jpg') or f.endswith('.png')]
         self.gts = [gt_root + f for f in os.listdir(gt_root) if f.endswith('.tif') or f.endswith('.png')]
@@ -201,7 +262,7 @@ class test_dataset:
         self.gts = sorted(self.gts)
         
         self.transform = transforms.Compose([
-            transforms.Resize((self.testsize, self.testsize)),
+            transforms.Resize(tuple(self.testsize)),
             transforms.ToTensor(),
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])])
         self.gt_transform = transforms.ToTensor()
@@ -209,7 +270,10 @@ class test_dataset:
         self.size = len(self.images)
         self.index = 0
 
-    def load_data(self):
+    def load_data(self, index=None):
+        # index: read that sample instead of the next one (used to shard validation across ranks)
+        if index is not None:
+            self.index = index
         image = self.rgb_loader(self.images[self.index])
         image = self.transform(image).unsqueeze(0)
 
@@ -242,6 +306,44 @@ class test_dataset:
         return self.size
 
 
+# inference dataset: decoded and resized inside DataLoader workers, batched by the loader
+class InferDataset(data.Dataset):
+    def __init__(self, image_root, testsize):
+        self.testsize = testsize if isinstance(testsize, (tuple, list)) else (testsize, testsize)
+        self.images = sorted([image_root + f for f in os.listdir(image_root) if f.endswith('.jpg') or f.endswith('.png')])
+        self.transform = transforms.Compose([
+            transforms.Resize(tuple(self.testsize)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])])
+        self.size = len(self.images)
+
+    def __getitem__(self, index):
+        image = self.rgb_loader(self.images[index])
+        # original (h, w), predictions are resized back to it
+        size = torch.tensor([image.size[1], image.size[0]])
+        name = os.path.basename(self.images[index])
+        if name.endswith('.jpg'):
+            name = name.split('.jpg')[0] + '.png'
+        return self.transform(image), size, name
+
+    def rgb_loader(self, path):
+        with open(path, 'rb') as f:
+            img = Image.open(f)
+            return img.convert('RGB')
+
+    def __len__(self):
+        return self.size
+
+
+def get_infer_loader(image_root, testsize, batchsize, num_workers=4, pin_memory=True):
+    dataset = InferDataset(image_root, testsize)
+    return data.DataLoader(dataset=dataset,
+                           batch_size=batchsize,
+                           shuffle=False,
+                           num_workers=num_workers,
+                           pin_memory=pin_memory)
+
+
 if __name__ =='__main__':
     train_root = '/dataset/COD/TrainDataset/'
     batchsize = 36
@@ -260,4 +362,64 @@ if __name__ =='__main__':
         cv2.imwrite('ceshi_gt.png',res_gt*255)
         res = (edge - edge.min()) / (edge.max() - edge.min() + 1e-8)
         cv2.imwrite('ceshi_edge.png',res*255)
-        break
\ No newline at end of file
+        break
+
+# evaluation dataset for utils.metrics: the network input (or, with pred_root, a saved
+# prediction map) plus the GT at its original size; the collate pads GTs to a common size
+class EvalDataset(data.Dataset):
+    def __init__(self, image_root, gt_root, testsize, pred_root=None):
+        self.testsize = testsize if isinstance(testsize, (tuple, list)) else (testsize, testsize)
+        self.images = sorted([image_root + f for f in os.listdir(image_root) if f.endswith('.jpg') or f.endswith('.png')])
+        self.gts = sorted([gt_root + f for f in os.listdir(gt_root) if f.endswith('.tif') or f.endswith('.png')])
+        self.pred_root = pred_root
+        self.transform = transforms.Compose([
+            transforms.Resize(tuple(self.testsize)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])])
+        self.size = len(self.gts)
+
+    def __getitem__(self, index):
+        gt = Image.open(self.gts[index]).convert('L')
+        name = os.path.basename(self.gts[index])
+        if self.pred_root is not None:
+            pred = Image.open(os.path.join(self.pred_root, os.path.splitext(name)[0] + '.png')).convert('L')
+            if pred.size != gt.size:
+                pred = pred.resize(gt.size, Image.BILINEAR)
+            item = torch.from_numpy(np.array(pred))
+        else:
+            item = self.transform(Image.open(self.images[index]).convert('RGB'))
+        return item, torch.from_numpy(np.array(gt)), name
+
+    def __len__(self):
+        return self.size
+
+
+def pad_maps(maps):
+    """Zero-pad 2-D maps to the largest height / width. Returns the (B, H, W) batch and (B, 2) sizes."""
+    sizes = torch.tensor([m.shape for m in maps])
+    batch = maps[0].new_zeros(len(maps), *sizes.max(0).values.tolist())
+    for i, m in enumerate(maps):
+        batch[i, :m.shape[0], :m.shape[1]] = m
+    return batch, sizes
+
+
+def eval_collate(batch):
+    items, gts, names = zip(*batch)
+    # network inputs share testsize; saved maps vary like the GTs (resized to them above)
+    items = torch.stack(items) if items[0].dim() == 3 else pad_maps(items)[0]
+    gts, sizes = pad_maps(gts)
+    return items, gts, sizes, list(names)
+
+
+def get_eval_loader(image_root, gt_root, testsize, batchsize, num_workers=4, pin_memory=True, pred_root=None,
+                    rank=0, world_size=1):
+    dataset = EvalDataset(image_root, gt_root, testsize, pred_root=pred_root)
+    if world_size > 1:
+        # every rank scores its own slice, the metric sums are reduced afterwards
+        dataset = data.Subset(dataset, range(rank, len(dataset), world_size))
+    return data.DataLoader(dataset=dataset,
+                           batch_size=batchsize,
+                           shuffle=False,
+                           num_workers=num_workers,
+                           pin_memory=pin_memory,
+                           collate_fn=eval_collate)
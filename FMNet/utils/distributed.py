@@ -0,0 +1,65 @@
+"""
+Process-group helpers for Train.py. Launched by torchrun (RANK / WORLD_SIZE / LOCAL_RANK set)
+every process joins the default group and drives one device; started as a plain script it
+runs as a single process without a group, and every helper degrades to a no-op.
+
+    torchrun --nproc_per_node 4 Train.py --gpu_id 0,1,2,3 ...
+    torchrun --nproc_per_node 2 Train.py --backend gloo ...      # CPU, for testing
+"""
+import os
+from contextlib import contextmanager
+
+import torch
+import torch.distributed as dist
+
+
+def init_distributed(backend=None):
+    """
+    Join the torchrun process group if there is one. Returns (rank, world_size, device);
+    device is cuda:LOCAL_RANK when CUDA is available, else the CPU. backend defaults to
+    nccl on CUDA and gloo on CPU.
+    """
+    if 'RANK' not in os.environ:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        return 0, 1, device
+
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    if torch.cuda.is_available() and backend != 'gloo':
+        torch.cuda.set_device(local_rank)
+        device = torch.device('cuda', local_rank)
+    else:
+        device = torch.device('cpu')
+    dist.init_process_group(backend=backend or ('nccl' if device.type == 'cuda' else 'gloo'))
+    return dist.get_rank(), dist.get_world_size(), device
+
+
+def is_main():
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+
+def barrier():
+    if dist.is_initialized():
+        dist.barrier()
+
+
+@contextmanager
+def main_first():
+    """Rank 0 runs the block first (downloads, cache builds), the other ranks after it finished."""
+    if not is_main():
+        barrier()
+    yield
+    if is_main():
+        barrier()
+
+
+def all_reduce_sum(values, device):
+    """Sum a list of python numbers over all ranks."""
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    if dist.is_initialized():
+        dist.all_reduce(tensor)
+    return tensor.tolist()
+
+
+def cleanup():
+    if dist.is_initialized():
+        dist.destroy_process_group()
@@ -0,0 +1,133 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import torch
+import torch.nn.functional as F
+
+from utils.data_val import get_infer_loader
+from utils.telemetry import _to_host
+
+
+def postprocess(logits, size):
+    """
+    Resize one logit map (1, 1, h, w) to the original (H, W), then sigmoid and min-max
+    normalize it, exactly as Test.py did per image. Stays on the model device.
+    """
+    res = F.interpolate(logits, size=size, mode='bilinear', align_corners=False)
+    res = res.sigmoid().squeeze()
+    return (res - res.min()) / (res.max() - res.min() + 1e-8)
+
+
+def postprocess_batch(logits, sizes):
+    """
+    postprocess for a (B, 1, h, w) logit batch and the original (H, W) of every map, as 8-bit
+    masks. Maps of the same size are resized and normalized together.
+    """
+    groups = {}
+    for i, size in enumerate(sizes):
+        groups.setdefault(tuple(size), []).append(i)
+    masks = [None] * len(sizes)
+    for size, index in groups.items():
+        res = F.interpolate(logits[index], size=size, mode='bilinear', align_corners=False).sigmoid()
+        low = res.amin(dim=(1, 2, 3), keepdim=True)
+        high = res.amax(dim=(1, 2, 3), keepdim=True)
+        res = ((res - low) / (high - low + 1e-8)).mul(255).round().byte()
+        for j, i in enumerate(index):
+            masks[i] = res[j, 0]
+    return masks
+
+
+class InferenceEngine:
+    """
+    Batched, pipelined inference around a Network:
+
+        decode/resize (DataLoader workers) -> H2D copy (side stream, one batch ahead)
+        -> model -> postprocess on device -> one non-blocking D2H copy per batch
+        -> PNG write (thread pool, waits for the copy)
+
+    so decoding, host-to-device copies, compute and write-back of neighbouring batches
+    overlap instead of running one image at a time. amp_dtype (torch.bfloat16 /
+    torch.float16) runs the model under autocast; spectral and RoPE math stays fp32.
+    """
+
+    def __init__(self, model, device=None, batch_size=8, num_workers=4, write_workers=4, amp_dtype=None):
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model = model.to(self.device).eval()
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.write_workers = write_workers
+        self.amp_dtype = amp_dtype
+
+    @torch.no_grad()
+    def predict(self, images):
+        """Final-stage fp32 logits for a normalized (B, 3, H, W) batch."""
+        with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+            logits = self.model(images.to(self.device, non_blocking=True), return_all=False)
+        return logits.float()
+
+    def prefetch(self, loader):
+        """Yield batches already on device; on CUDA the next copy runs while the current batch computes."""
+        stream = torch.cuda.Stream() if self.device.type == 'cuda' else None
+
+        def load(batch):
+            images, sizes, names = batch
+            if stream is None:
+                return images.to(self.device), sizes, names
+            with torch.cuda.stream(stream):
+                return images.to(self.device, non_blocking=True), sizes, names
+
+        batches = iter(loader)
+        upcoming = next(batches, None)
+        upcoming = load(upcoming) if upcoming is not None else None
+        while upcoming is not None:
+            if stream is not None:
+                torch.cuda.current_stream().wait_stream(stream)
+                upcoming[0].record_stream(torch.cuda.current_stream())
+            current = upcoming
+            upcoming = next(batches, None)
+            upcoming = load(upcoming) if upcoming is not None else None
+            yield current
+
+    def run(self, image_root, save_path, testsize=416, verbose=False):
+        """
+        Predict every .jpg/.png under image_root and write 8-bit masks to save_path.
+        Returns throughput statistics.
+        """
+        os.makedirs(save_path, exist_ok=True)
+        loader = get_infer_loader(image_root, testsize, self.batch_size,
+                                  num_workers=self.num_workers, pin_memory=self.device.type == 'cuda')
+
+        count = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.write_workers) as writer:
+            # batches whose copy / writes may still be in flight; bounds the pinned buffers too
+            pending = deque()
+            for images, sizes, names in self.prefetch(loader):
+                logits = self.predict(images)
+                sizes = [tuple(size) for size in sizes.tolist()]
+                masks = postprocess_batch(logits, sizes)
+                flat, event = _to_host(torch.cat([mask.flatten() for mask in masks]))
+                if len(pending) >= 2 * self.write_workers:
+                    pending.popleft().result()
+                pending.append(writer.submit(self.write, flat, event, sizes, names, save_path))
+                count += len(names)
+                if verbose:
+                    print('> {} images, {:.2f} img/s'.format(count, count / (time.perf_counter() - start)))
+            for future in pending:
+                future.result()
+        elapsed = time.perf_counter() - start
+        return {'images': count, 'seconds': elapsed, 'images_per_sec': count / elapsed if elapsed > 0 else 0.0}
+
+    @staticmethod
+    def write(flat, event, sizes, names, save_path):
+        """Wait for a batch's device-to-host copy, then write its masks (flattened back to back)."""
+        if event is not None:
+            event.synchronize()
+        flat = flat.numpy()
+        offset = 0
+        for (h, w), name in zip(sizes, names):
+            cv2.imwrite(os.path.join(save_path, name), flat[offset:offset + h * w].reshape(h, w))
+            offset += h * w
@@ -0,0 +1,78 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def structure_loss(pred, mask):
+    weit = 1 + 5 * torch.abs(F.avg_pool2d(mask, kernel_size=31, stride=1, padding=15) - mask)
+    wbce = F.binary_cross_entropy_with_logits(pred, mask, reduction='none')
+    wbce = (weit * wbce).sum(dim=(2, 3)) / weit.sum(dim=(2, 3))
+
+    pred = torch.sigmoid(pred)
+    inter = ((pred * mask) * weit).sum(dim=(2, 3))
+    union = ((pred + mask) * weit).sum(dim=(2, 3))
+    wiou = 1 - (inter + 1) / (union - inter + 1)
+    return (wbce + wiou).mean()
+
+
+def box_mean(x, radius):
+    """
+    F.avg_pool2d(x, 2 * radius + 1, stride=1, padding=radius) (zero padding counted) from
+    running sums along each axis, O(1) per pixel instead of O(radius^2).
+    """
+    size = 2 * radius + 1
+    for dim in (-1, -2):
+        pad = [0, 0, 0, 0]
+        pad[0 if dim == -1 else 2] = radius + 1
+        pad[1 if dim == -1 else 3] = radius
+        # a leading zero so the window sum is a plain difference of the running sums
+        csum = F.pad(x, pad).cumsum(dim)
+        n = x.shape[dim]
+        x = csum.narrow(dim, size, n) - csum.narrow(dim, 0, n)
+    return x / (size * size)
+
+
+class DeepSupervisionLoss(nn.Module):
+    """
+    Weighted BCE + IoU structure loss over all side outputs plus the uncertainty-aware loss
+    (cal_ual) on the last one, as Train.py sums them:
+
+        sum_k weights[k] * structure_loss(preds[k], gts) + 2 * ual_coef * cal_ual(preds[-1], gts)
+
+    The boundary weight map depends only on gts, so it is computed once per batch (with an
+    integral-image box filter) and shared by every prediction, which are evaluated together.
+    Returns (loss, loss_init, loss_final): loss_init is the weighted sum over the intermediate
+    outputs, loss_final the structure loss of the last.
+    """
+
+    def __init__(self, weights=(0.0625, 0.125, 0.25, 0.5, 1.0), radius=15, ual_weight=2.0):
+        super(DeepSupervisionLoss, self).__init__()
+        self.register_buffer('weights', torch.tensor(weights), persistent=False)
+        self.radius = radius
+        self.ual_weight = ual_weight
+
+    def forward(self, preds, gts, ual_coef=1.0):
+        assert len(preds) == len(self.weights)
+        weit = 1 + 5 * torch.abs(box_mean(gts, self.radius) - gts)
+        weit_sum = weit.sum(dim=(2, 3))
+        preds = torch.stack(tuple(preds))  # K, B, 1, H, W
+
+        wbce = F.binary_cross_entropy_with_logits(preds, gts.expand_as(preds), reduction='none')
+        wbce = (weit * wbce).sum(dim=(3, 4)) / weit_sum
+
+        prob = torch.sigmoid(preds)
+        inter = ((prob * gts) * weit).sum(dim=(3, 4))
+        union = ((prob + gts) * weit).sum(dim=(3, 4))
+        wiou = 1 - (inter + 1) / (union - inter + 1)
+        per_output = (wbce + wiou).mean(dim=(1, 2)) * self.weights
+
+        # cal_ual on the final output, reusing its sigmoid
+        ual = (1 - (2 * prob[-1] - 1).abs().pow(2)).mean()
+
+        loss_init = per_output[:-1].sum()
+        loss_final = per_output[-1]
+        loss = loss_init + loss_final + self.ual_weight * ual_coef * ual
+        return loss, loss_init, loss_final
+
+    def extra_repr(self) -> str:
+        return f'weights={self.weights.tolist()}, radius={self.radius}, ual_weight={self.ual_weight}'
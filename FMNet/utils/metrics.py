@@ -0,0 +1,262 @@
+"""
+Batched COD metrics on device: MAE, S-measure, adaptive / mean E-measure and weighted
+F-measure, following the definitions of the standard SOD/COD evaluation toolbox
+(PySODMetrics). Every metric takes a padded batch of prediction maps in [0, 1] and binary
+GTs with a mask of the valid (unpadded) pixels, so images of different sizes are scored
+together. CODMetrics accumulates the per-image scores on device; only compute() syncs.
+"""
+import math
+
+import torch
+import torch.distributed as dist
+import torch.nn.functional as F
+
+from utils.inference import postprocess
+
+EPS = 2.220446049250313e-16  # np.spacing(1), as in the reference implementation
+METRICS = ('mae', 'sm', 'adp_em', 'mean_em', 'wfm')
+HIGHER_IS_BETTER = {'mae': False, 'sm': True, 'adp_em': True, 'mean_em': True, 'wfm': True}
+DISPLAY_NAMES = {'mae': 'MAE', 'sm': 'Sm', 'adp_em': 'adpEm', 'mean_em': 'meanEm', 'wfm': 'wFm'}
+
+
+def valid_mask(sizes, shape, device):
+    """(B, H, W) bool mask of the top-left sizes[b] = (h, w) region of each padded map."""
+    sizes = torch.as_tensor(sizes, device=device)
+    rows = torch.arange(shape[0], device=device)
+    cols = torch.arange(shape[1], device=device)
+    return (rows[None, :, None] < sizes[:, 0, None, None]) & (cols[None, None, :] < sizes[:, 1, None, None])
+
+
+def _sum(x):
+    return x.sum(dim=(-2, -1))
+
+
+def mae(pred, gt, mask):
+    return _sum((pred - gt).abs() * mask) / _sum(mask)
+
+
+def _s_object(x, region):
+    count = _sum(region)
+    mean = _sum(x * region) / count
+    std = (_sum((x - mean[:, None, None]) ** 2 * region) / (count - 1).clamp_min(1)).sqrt()
+    return 2 * mean / (mean ** 2 + 1 + std + EPS)
+
+
+def _ssim(pred, gt, region):
+    count = _sum(region)
+    n = count.clamp_min(1)
+    x = _sum(pred * region) / n
+    y = _sum(gt * region) / n
+    dx = (pred - x[..., None, None]) * region
+    dy = (gt - y[..., None, None]) * region
+    sigma_x = _sum(dx ** 2) / (count - 1).clamp_min(1)
+    sigma_y = _sum(dy ** 2) / (count - 1).clamp_min(1)
+    sigma_xy = _sum(dx * dy) / (count - 1).clamp_min(1)
+    alpha = 4 * x * y * sigma_xy
+    beta = (x ** 2 + y ** 2) * (sigma_x + sigma_y)
+    score = torch.where(alpha != 0, alpha / (beta + EPS), (beta == 0).to(pred.dtype))
+    # an empty quadrant has weight 0
+    return torch.where(count > 0, score, torch.zeros_like(score))
+
+
+def s_measure(pred, gt, mask, sizes, alpha=0.5):
+    """Structure measure: object-aware + region-aware (4 quadrants split at the GT centroid)."""
+    b, h, w = pred.shape
+    n = _sum(mask)
+    y = _sum(gt) / n
+    fg = pred * gt
+    bg = (1 - pred) * (1 - gt) * mask
+    object_score = y * _s_object(fg, gt) + (1 - y) * _s_object(bg, (1 - gt) * mask)
+
+    # centroid of the GT (rounded half to even like numpy), 1-based split position
+    rows = torch.arange(h, device=pred.device, dtype=pred.dtype)
+    cols = torch.arange(w, device=pred.device, dtype=pred.dtype)
+    fg_count = _sum(gt).clamp_min(1)
+    cy = torch.round(_sum(gt * rows[:, None]) / fg_count) + 1
+    cx = torch.round(_sum(gt * cols[None, :]) / fg_count) + 1
+    height, width = sizes[:, 0].to(pred.dtype), sizes[:, 1].to(pred.dtype)
+    top = rows[None, :, None] < cy[:, None, None]
+    left = cols[None, None, :] < cx[:, None, None]
+    quadrants = torch.stack((top & left, top & ~left, ~top & left, ~top & ~left), dim=1) & mask[:, None].bool()
+    area = height * width
+    w1 = cx * cy / area
+    w2 = cy * (width - cx) / area
+    w3 = (height - cy) * cx / area
+    weights = torch.stack((w1, w2, w3, 1 - w1 - w2 - w3), dim=1)
+    region_score = (weights * _ssim(pred[:, None], gt[:, None], quadrants.to(pred.dtype))).sum(dim=1)
+
+    score = (alpha * object_score + (1 - alpha) * region_score).clamp_min(0)
+    mean_pred = _sum(pred * mask) / n
+    return torch.where(y == 0, 1 - mean_pred, torch.where(y == 1, mean_pred, score))
+
+
+def _enhanced_alignment(fg_fg, fg_bg, gt_fg, n):
+    """E-measure from pixel counts, the closed form of the reference (counts broadcast over thresholds)."""
+    pred_fg = fg_fg + fg_bg
+    pred_bg = n - pred_fg
+    bg_fg = gt_fg - fg_fg
+    bg_bg = pred_bg - bg_fg
+    mean_pred = pred_fg / n
+    mean_gt = gt_fg / n
+    total = 0
+    for count, a, b in ((fg_fg, 1 - mean_pred, 1 - mean_gt), (fg_bg, 1 - mean_pred, -mean_gt),
+                        (bg_fg, -mean_pred, 1 - mean_gt), (bg_bg, -mean_pred, -mean_gt)):
+        align = 2 * a * b / (a ** 2 + b ** 2 + EPS)
+        total = total + (align + 1) ** 2 / 4 * count
+    total = torch.where(gt_fg == 0, pred_bg, torch.where(gt_fg == n, pred_fg, total))
+    return total / (n - 1 + EPS)
+
+
+def e_measure(pred, gt, mask):
+    """
+    Returns (adaptive E-measure (B,), E-measure curve (B, 256)). The curve thresholds the
+    map quantized to uint8 at every level, its mean over levels is the mean E-measure.
+    """
+    n = _sum(mask)
+    gt_fg = _sum(gt)
+    b = pred.shape[0]
+
+    threshold = (2 * _sum(pred * mask) / n).clamp_max(1)
+    binary = (pred >= threshold[:, None, None]).to(pred.dtype) * mask
+    adaptive = _enhanced_alignment(_sum(binary * gt), _sum(binary * (1 - gt)), gt_fg, n)
+
+    # per-level counts from one histogram per image, accumulated from the top level down
+    levels = (pred * 255).floor().long().clamp(0, 255).flatten(1)
+    fg_hist = pred.new_zeros(b, 256).scatter_add_(1, levels, gt.flatten(1))
+    bg_hist = pred.new_zeros(b, 256).scatter_add_(1, levels, ((1 - gt) * mask).flatten(1))
+    fg_fg = fg_hist.flip(1).cumsum(1)
+    fg_bg = bg_hist.flip(1).cumsum(1)
+    curve = _enhanced_alignment(fg_fg, fg_bg, gt_fg[:, None], n[:, None])
+    return adaptive, curve
+
+
+def distance_transform(fg, max_distance=None):
+    """
+    Euclidean distance from every pixel to the nearest True pixel of fg (B, H, W), and the flat
+    index of that pixel (scipy.ndimage.distance_transform_edt(~fg, return_indices=True)).
+    Separable: nearest source per column from running max / min, then per row a sweep over
+    column offsets up to max_distance (all of them when None). Exact up to max_distance; pixels
+    farther than that from every source, or in images without any source, get inf.
+    """
+    b, h, w = fg.shape
+    device = fg.device
+    rows = torch.arange(h, device=device)[None, :, None].expand(b, h, w)
+    big = h + w + 1
+    above = torch.where(fg, rows, torch.full_like(rows, -big)).cummax(dim=1).values
+    below = torch.where(fg, rows, torch.full_like(rows, 2 * big)).flip(1).cummin(dim=1).values.flip(1)
+    nearest_row = torch.where(rows - above <= below - rows, above, below)
+    column_d2 = (rows - nearest_row).float() ** 2
+    column_d2 = torch.where(nearest_row.abs() < big, column_d2, torch.full_like(column_d2, math.inf))
+
+    cols = torch.arange(w, device=device)
+    d2 = column_d2.clone()
+    source_col = cols.expand(b, h, w).clone()
+    reach = w - 1 if max_distance is None else min(w - 1, int(max_distance))
+    for k in range(1, reach + 1):
+        # sources k columns to the left, then to the right, of every target column
+        for target, source in ((slice(k, None), slice(None, -k)), (slice(None, -k), slice(k, None))):
+            candidate = column_d2[..., source] + k * k
+            better = candidate < d2[..., target]
+            d2[..., target] = torch.where(better, candidate, d2[..., target])
+            source_col[..., target] = torch.where(better, cols[source], source_col[..., target])
+    if max_distance is not None:
+        d2 = torch.where(d2 <= max_distance ** 2, d2, torch.full_like(d2, math.inf))
+    index = nearest_row.gather(2, source_col) * w + source_col
+    return d2.sqrt(), index.clamp(0, h * w - 1)
+
+
+def _gaussian_kernel(size=7, sigma=5, device=None):
+    # fspecial('gaussian', 7, 5)
+    r = (size - 1) / 2
+    x = torch.arange(size, dtype=torch.float64) - r
+    k = torch.exp(-(x[:, None] ** 2 + x[None, :] ** 2) / (2 * sigma ** 2))
+    k[k < torch.finfo(k.dtype).eps * k.max()] = 0
+    return (k / k.sum()).float().to(device).view(1, 1, size, size)
+
+
+def weighted_f_measure(pred, gt, mask, beta=1.0, max_distance=80):
+    """
+    Weighted F-measure (Margolin et al.); 0 for images without foreground. The distance
+    transform stops at max_distance: nearest-foreground errors are only read inside the 7x7
+    blur around foreground pixels, and past 80 px the background importance is within 2e-5
+    of its limit 2.
+    """
+    fg = gt.bool()
+    error = (pred - gt).abs() * mask
+    dist, nearest = distance_transform(fg, max_distance)
+    # every background pixel takes the error of its nearest foreground pixel
+    error_t = torch.where(fg, error, error.flatten(1).gather(1, nearest.flatten(1)).view_as(error)) * mask
+    error_a = F.conv2d(error_t[:, None], _gaussian_kernel(device=pred.device), padding=3)[:, 0]
+    min_error = torch.where(fg & (error_a < error), error_a, error)
+    importance = torch.where(fg, torch.ones_like(pred), 2 - torch.exp(math.log(0.5) / 5 * dist))
+    error_w = min_error * importance * mask
+
+    gt_fg = _sum(gt)
+    tp = gt_fg - _sum(error_w * gt)
+    fp = _sum(error_w * (1 - gt))
+    recall = 1 - _sum(error_w * gt) / gt_fg.clamp_min(1)
+    precision = tp / (tp + fp + EPS)
+    score = (1 + beta) * recall * precision / (recall + beta * precision + EPS)
+    return torch.where(gt_fg > 0, score, torch.zeros_like(score))
+
+
+def batch_maps(logits, sizes, shape=None):
+    """
+    Model logits (B, 1, h, w) -> (B, H, W) maps in [0, 1], each resized to its own sizes[b]
+    (sigmoid + min-max, see utils.inference.postprocess) and zero-padded to a common shape.
+    """
+    sizes = [tuple(s) for s in torch.as_tensor(sizes).tolist()]
+    shape = shape or (max(s[0] for s in sizes), max(s[1] for s in sizes))
+    maps = logits.new_zeros(len(sizes), *shape, dtype=torch.float32)
+    for i, (h, w) in enumerate(sizes):
+        maps[i, :h, :w] = postprocess(logits[i:i + 1].float(), (h, w))
+    return maps
+
+
+class CODMetrics:
+    """
+    Running MAE / S-measure / adaptive and mean E-measure / weighted F-measure over a dataset.
+
+        metrics = CODMetrics(device)
+        for preds, gts, sizes in ...:       # padded (B, H, W) maps in [0, 1], uint8 GTs, (B, 2) sizes
+            metrics.update(preds, gts, sizes)
+        metrics.all_reduce()                # sums over ranks when running distributed
+        scores = metrics.compute()          # {'mae': ..., 'sm': ..., ...}, one host sync
+    """
+
+    def __init__(self, device):
+        self.device = torch.device(device)
+        self.reset()
+
+    def reset(self):
+        # per-image sums of mae, sm, adaptive em, wfm, the image count and the E curve
+        self.totals = torch.zeros(5 + 256, dtype=torch.float64, device=self.device)
+
+    @torch.no_grad()
+    def update(self, preds, gts, sizes):
+        preds = preds.to(self.device, torch.float32)
+        gts = (gts.to(self.device, non_blocking=True) > 128).float()
+        sizes = torch.as_tensor(sizes).to(self.device, non_blocking=True)
+        mask = valid_mask(sizes, preds.shape[-2:], self.device).float()
+        gts = gts * mask
+        preds = preds * mask
+        adaptive, curve = e_measure(preds, gts, mask)
+        scores = torch.stack((mae(preds, gts, mask), s_measure(preds, gts, mask, sizes), adaptive,
+                              weighted_f_measure(preds, gts, mask), torch.ones_like(adaptive)), dim=1)
+        self.totals[:5] += scores.sum(0).double()
+        self.totals[5:] += curve.sum(0).double()
+
+    def all_reduce(self):
+        if dist.is_initialized():
+            dist.all_reduce(self.totals)
+
+    def compute(self):
+        totals = self.totals.cpu()
+        count = max(totals[4].item(), 1)
+        return {
+            'mae': totals[0].item() / count,
+            'sm': totals[1].item() / count,
+            'adp_em': totals[2].item() / count,
+            'mean_em': totals[5:].mean().item() / count,
+            'wfm': totals[3].item() / count,
+        }
@@ -0,0 +1,244 @@
+"""
+A small asyncio HTTP/1.1 inference server (standard library only):
+
+    POST /predict   body: a .jpg / .png image -> image/png mask at the image size
+    GET  /metrics   JSON latency percentiles, throughput and batch sizes
+    GET  /health    200 once the model is loaded
+
+Concurrent /predict requests are collected into dynamic batches by DynamicBatcher and the
+model runs once per batch in a worker thread, so the event loop keeps accepting requests.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+
+from utils.inference import postprocess
+from utils.tiling import MEAN, STD
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class BatchPredictor:
+    """Decoded RGB images of any size -> PNG-encoded masks, one model call for the whole list."""
+
+    def __init__(self, model, testsize=416, device=None, amp_dtype=None):
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model = model.to(self.device).eval()
+        self.testsize = testsize
+        self.amp_dtype = amp_dtype
+        self.mean = torch.tensor(MEAN, device=self.device).view(1, 3, 1, 1) * 255
+        self.std = torch.tensor(STD, device=self.device).view(1, 3, 1, 1) * 255
+
+    @torch.no_grad()
+    def __call__(self, images):
+        resized = np.stack([cv2.resize(image, (self.testsize, self.testsize)) for image in images])
+        batch = torch.from_numpy(resized).to(self.device).permute(0, 3, 1, 2).float()
+        with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+            logits = self.model((batch - self.mean) / self.std, return_all=False).float()
+        masks = [postprocess(logits[i:i + 1], image.shape[:2]).mul(255).round().byte()
+                 for i, image in enumerate(images)]
+        return [cv2.imencode('.png', mask.cpu().numpy())[1].tobytes() for mask in masks]
+
+
+class DynamicBatcher:
+    """
+    Collects submitted items into batches of at most max_batch_size, waiting at most
+    max_wait_ms after the first item of a batch for more to arrive, and runs fn(list) once
+    per batch on a single worker thread.
+    """
+
+    def __init__(self, fn, max_batch_size=8, max_wait_ms=5.0):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.queue = None
+        self.worker = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_sizes = deque(maxlen=1000)
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.ensure_future(self.loop())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            items, futures = zip(*batch)
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, list(items))
+            except Exception as error:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class LatencyStats:
+    """Latencies of the last `window` requests and totals since the server started."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+
+    def add(self, seconds, ok=True):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.errors += not ok
+
+    def summary(self, batch_sizes=()):
+        latencies = np.array(self.latencies) * 1e3
+        elapsed = time.perf_counter() - self.start
+        percentile = lambda q: float(np.percentile(latencies, q)) if latencies.size else None
+        return {'requests': self.requests, 'errors': self.errors, 'uptime_s': elapsed,
+                'throughput_rps': self.requests / elapsed if elapsed > 0 else 0.0,
+                'p50_ms': percentile(50), 'p90_ms': percentile(90), 'p99_ms': percentile(99),
+                'mean_batch_size': float(np.mean(batch_sizes)) if len(batch_sizes) else None}
+
+
+class InferenceServer:
+    """HTTP front end: parses requests, decodes uploads on a thread pool and feeds the batcher."""
+
+    def __init__(self, predictor, host='127.0.0.1', port=8000, max_batch_size=8, max_wait_ms=5.0,
+                 max_body=32 * 2 ** 20, decode_workers=4):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.batcher = DynamicBatcher(predictor, max_batch_size, max_wait_ms)
+        self.decoder = ThreadPoolExecutor(max_workers=decode_workers)
+        self.stats = LatencyStats()
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # the bound port when port=0
+        return self
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+        self.decoder.shutdown()
+
+    async def handle(self, reader, writer):
+        """One connection; requests are served in turn while the client keeps it alive."""
+        try:
+            while True:
+                request = await read_request(reader, self.max_body)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload = await self.route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(response(status, content_type, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as error:  # malformed request
+            writer.write(response(400, 'text/plain', str(error).encode(), False))
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        path = path.split('?')[0]
+        if path == '/predict':
+            if method != 'POST':
+                return 405, 'text/plain', b'POST an image'
+            return await self.predict(body)
+        if path == '/metrics' and method == 'GET':
+            summary = self.stats.summary(self.batcher.batch_sizes)
+            return 200, 'application/json', json.dumps(summary).encode()
+        if path == '/health' and method == 'GET':
+            return 200, 'text/plain', b'ok'
+        return 404, 'text/plain', b'not found'
+
+    async def predict(self, body):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self.decoder, decode_image, body)
+        if image is None:
+            self.stats.add(time.perf_counter() - start, ok=False)
+            return 400, 'text/plain', b'body is not a decodable image'
+        try:
+            mask = await self.batcher.submit(image)
+        except Exception as error:
+            self.stats.add(time.perf_counter() - start, ok=False)
+            return 500, 'text/plain', repr(error).encode()
+        self.stats.add(time.perf_counter() - start)
+        return 200, 'image/png', mask
+
+
+def decode_image(data):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return None if image is None else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+async def read_request(reader, max_body):
+    """(method, path, lower-cased headers, body) of the next request, None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError('bad request line')
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > max_body:
+        raise ValueError('body larger than {} bytes'.format(max_body))
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def response(status, content_type, payload, keep_alive=True):
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+        status, REASONS[status], content_type, len(payload), 'keep-alive' if keep_alive else 'close')
+    return head.encode('latin-1') + payload
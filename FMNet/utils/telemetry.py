@@ -0,0 +1,113 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import torch
+from torchvision.utils import make_grid
+
+
+def _to_host(tensor):
+    """
+    Start a device-to-host copy without waiting for it. Returns the (pinned) CPU tensor and a
+    CUDA event to wait on before reading it, or None when the tensor already is on the CPU.
+    """
+    if tensor.device.type != 'cuda':
+        return tensor.detach().clone(), None
+    host = tensor.detach().to('cpu', non_blocking=True)
+    event = torch.cuda.Event()
+    event.record()
+    return host, event
+
+
+def _normalize(x):
+    return (x - x.min()) / (x.max() - x.min() + 1e-8)
+
+
+class Telemetry:
+    """
+    Training logs without host syncs in the training loop.
+
+    update() adds the step's scalar tensors into running sums on their device. Every
+    `log_every` steps log() starts a non-blocking copy of the interval means and hands it to a
+    writer thread, which waits for the copy, prints, logs and writes TensorBoard. images()
+    does the same for sample maps every `image_every` steps. The training loop itself never
+    calls .item() / .cpu() / .numpy() on a device tensor.
+    """
+
+    def __init__(self, writer, log_every=20, image_every=200, enabled=True):
+        self.writer = writer
+        self.log_every = log_every
+        self.image_every = image_every
+        self.enabled = enabled
+        self.sums = {}
+        self.count = 0
+        self.executor = ThreadPoolExecutor(max_workers=1) if enabled else None
+        self.pending = []
+
+    def update(self, **scalars):
+        """Accumulate 0-dim tensors (losses) on device."""
+        if not self.enabled:
+            return
+        for name, value in scalars.items():
+            value = value.detach()
+            if name in self.sums:
+                self.sums[name] += value
+            else:
+                self.sums[name] = value.clone()
+        self.count += 1
+
+    def log(self, step, prefix, force=False):
+        """Flush the means since the last flush every log_every steps, or now when force is set."""
+        if not self.enabled or self.count == 0 or not (force or step % self.log_every == 0):
+            return
+        names = list(self.sums)
+        means, event = _to_host(torch.stack([self.sums[name] for name in names]) / self.count)
+        self.sums, self.count = {}, 0
+        self._submit(self._write_scalars, step, prefix, names, means, event)
+
+    def images(self, step, maps=None, logits=None):
+        """
+        Every image_every steps write sample images: `maps` are (C, H, W) tensors shown
+        min-max normalized (input, GT), `logits` are (1, H, W) side outputs shown as their
+        normalized sigmoid.
+        """
+        if not self.enabled or step % self.image_every != 0:
+            return
+        maps = {name: _to_host(x) for name, x in (maps or {}).items()}
+        logits = {name: _to_host(x) for name, x in (logits or {}).items()}
+        self._submit(self._write_images, step, maps, logits)
+
+    def close(self):
+        """Wait for every pending write; re-raises the first error."""
+        if self.executor is None:
+            return
+        for future in self.pending:
+            future.result()
+        self.pending = []
+        self.executor.shutdown()
+
+    def _submit(self, fn, *args):
+        # drop finished writes, surfacing their errors in the training thread
+        for future in [f for f in self.pending if f.done()]:
+            future.result()
+        self.pending = [f for f in self.pending if not f.done()]
+        self.pending.append(self.executor.submit(fn, *args))
+
+    def _write_scalars(self, step, prefix, names, means, event):
+        if event is not None:
+            event.synchronize()
+        values = dict(zip(names, means.tolist()))
+        text = ' '.join('{}: {:.4f}'.format(name, value) for name, value in values.items())
+        print('{} {}, {}'.format(datetime.now(), prefix, text))
+        logging.info('[Train Info]:{}, {}'.format(prefix, text))
+        self.writer.add_scalars('Loss_Statistics', values, global_step=step)
+
+    def _write_images(self, step, maps, logits):
+        for name, (x, event) in maps.items():
+            if event is not None:
+                event.synchronize()
+            self.writer.add_image(name, make_grid(x, 1, normalize=True), step)
+        for name, (x, event) in logits.items():
+            if event is not None:
+                event.synchronize()
+            self.writer.add_image(name, _normalize(x.float().sigmoid().squeeze()), step, dataformats='HW')
@@ -0,0 +1,153 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def tile_starts(length, tile, stride):
+    """Window offsets covering [0, length): `stride` apart, the last one flush with the end."""
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def feather(tile, overlap, device=None):
+    """
+    (tile, tile) blending weights: 1 in the interior, ramping linearly down over the
+    `overlap` border pixels (never to 0), so overlapping windows cross-fade.
+    """
+    ramp = torch.ones(tile, device=device)
+    if overlap > 0:
+        edge = torch.arange(1, overlap + 1, device=device, dtype=torch.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge.flip(0)
+    return ramp[:, None] * ramp[None, :]
+
+
+class TiledPredictor:
+    """
+    Sliding-window inference at native resolution for images much larger than testsize:
+
+        overlapping tile x tile windows (stride tile - overlap) -> batches of tiles
+        -> model -> logits weighted by a feathered window into a band accumulator
+
+    Tiles are cut from the uint8 image and normalized on device. Windows are visited one
+    tile row at a time and a band of `tile` rows is accumulated on device; rows no later
+    window touches are normalized by the summed weights and moved to the host. Device
+    memory is therefore one batch of tiles plus a tile-high band, whatever the image height.
+    `scale` resizes the image before tiling (and the logits back) to match the object
+    scale seen in training.
+    """
+
+    def __init__(self, model, tile=416, overlap=64, batch_size=8, device=None, amp_dtype=None, scale=1.0):
+        assert tile % 32 == 0, 'tile must be a multiple of 32'
+        assert 0 <= overlap <= tile // 2, 'overlap must be within [0, tile / 2]'
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model = model.to(self.device).eval()
+        self.tile = tile
+        self.stride = tile - overlap
+        self.batch_size = batch_size
+        self.amp_dtype = amp_dtype
+        self.scale = scale
+        self.window = feather(tile, overlap, self.device)
+        self.mean = torch.tensor(MEAN, device=self.device).view(1, 3, 1, 1) * 255
+        self.std = torch.tensor(STD, device=self.device).view(1, 3, 1, 1) * 255
+
+    def tiles(self, crops):
+        """uint8 (N, h, w, 3) crops -> normalized (N, 3, tile, tile) batch, zero-padded past the image."""
+        batch = torch.from_numpy(np.ascontiguousarray(crops))
+        if self.device.type == 'cuda':
+            batch = batch.pin_memory()
+        batch = batch.to(self.device, non_blocking=True).permute(0, 3, 1, 2).float()
+        batch = (batch - self.mean) / self.std
+        return F.pad(batch, (0, self.tile - batch.shape[3], 0, self.tile - batch.shape[2]))
+
+    @torch.no_grad()
+    def logits(self, batch):
+        with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+            logits = self.model(batch, return_all=False)
+        if logits.shape[-2:] != batch.shape[-2:]:
+            logits = F.interpolate(logits.float(), size=batch.shape[-2:], mode='bilinear', align_corners=False)
+        return logits[:, 0].float()
+
+    @torch.no_grad()
+    def predict(self, image):
+        """(H, W, 3) uint8 RGB image -> (H, W) float32 logits on the host."""
+        size = image.shape[:2]
+        if self.scale != 1:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_LINEAR)
+        h, w = image.shape[:2]
+        t = self.tile
+        out = np.empty((h, w), np.float32)
+        band = min(t, h)
+        acc = torch.zeros(band, w, device=self.device)
+        weight = torch.zeros(band, w, device=self.device)
+        top = 0
+        xs = tile_starts(w, t, self.stride)
+        for y in tile_starts(h, t, self.stride):
+            if y > top:
+                # rows above this tile row are final: flush them, shift the rest of the band up
+                done = y - top
+                out[top:y] = (acc[:done] / weight[:done]).cpu().numpy()
+                acc = torch.cat((acc[done:], acc.new_zeros(done, w)))
+                weight = torch.cat((weight[done:], weight.new_zeros(done, w)))
+                top = y
+            for start in range(0, len(xs), self.batch_size):
+                row = xs[start:start + self.batch_size]
+                crops = np.stack([image[y:y + t, x:x + t] for x in row])
+                ch, cw = crops.shape[1:3]
+                logits = self.logits(self.tiles(crops))[:, :ch, :cw] * self.window[:ch, :cw]
+                for x, tile_logits in zip(row, logits):
+                    acc[:ch, x:x + cw] += tile_logits
+                    weight[:ch, x:x + cw] += self.window[:ch, :cw]
+        out[top:] = (acc[:h - top] / weight[:h - top]).cpu().numpy()
+        if self.scale != 1:
+            out = cv2.resize(out, (size[1], size[0]), interpolation=cv2.INTER_LINEAR)
+        return out
+
+    def run(self, image_root, save_path, verbose=False):
+        """
+        Predict every .jpg/.png under image_root at native resolution and write 8-bit masks
+        (sigmoid + min-max, as postprocess) to save_path. The next image is decoded while the
+        current one runs. Returns throughput and peak device memory, also per megapixel.
+        """
+        os.makedirs(save_path, exist_ok=True)
+        names = sorted(f for f in os.listdir(image_root) if f.endswith('.jpg') or f.endswith('.png'))
+        read = lambda name: cv2.cvtColor(cv2.imread(os.path.join(image_root, name)), cv2.COLOR_BGR2RGB)
+        if self.device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        megapixels = largest = 0.0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pending = []
+            upcoming = pool.submit(read, names[0]) if names else None
+            for i, name in enumerate(names):
+                image = upcoming.result()
+                upcoming = pool.submit(read, names[i + 1]) if i + 1 < len(names) else None
+                tic = time.perf_counter()
+                res = torch.from_numpy(self.predict(image)).sigmoid_()
+                res = (res - res.min()) / (res.max() - res.min() + 1e-8)
+                mask = res.mul_(255).round_().byte().numpy()
+                pending.append(pool.submit(cv2.imwrite, os.path.join(save_path, os.path.splitext(name)[0] + '.png'), mask))
+                mp = image.shape[0] * image.shape[1] / 1e6
+                megapixels += mp
+                largest = max(largest, mp)
+                if verbose:
+                    print('> {}: {:.1f} MP, {:.2f} MP/s'.format(name, mp, mp / (time.perf_counter() - tic)))
+            for future in pending:
+                future.result()
+        elapsed = time.perf_counter() - start
+        peak = torch.cuda.max_memory_allocated(self.device) / 2 ** 20 if self.device.type == 'cuda' else None
+        return {'images': len(names), 'megapixels': megapixels, 'seconds': elapsed,
+                'megapixels_per_sec': megapixels / elapsed if elapsed > 0 else 0.0,
+                'seconds_per_megapixel': elapsed / megapixels if megapixels > 0 else 0.0,
+                'peak_memory_mb': peak,
+                'peak_memory_mb_per_megapixel': peak / largest if peak is not None and largest > 0 else None}
@@ -3,6 +3,10 @@ import numpy as np
 from thop import profile
 from thop import clever_format
 
+# --amp choices of Train.py / Test.py
+AMP_DTYPES = {'none': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+
 def get_coef(iter_percentage, method):
     if method == "linear":
         milestones = (0.3, 0.7)
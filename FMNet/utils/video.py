@@ -0,0 +1,196 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from utils.tiling import MEAN, STD
+
+
+def read_frames(source):
+    """
+    Yield RGB uint8 frames from a video file, a camera index ('0') or a directory of
+    .jpg/.png frames (sorted by name). All frames of a directory must have the same size,
+    like those of a video.
+    """
+    if os.path.isdir(source):
+        size = None
+        for name in sorted(f for f in os.listdir(source) if f.endswith('.jpg') or f.endswith('.png')):
+            frame = cv2.imread(os.path.join(source, name))
+            if size is None:
+                size = frame.shape[:2]
+            elif frame.shape[:2] != size:
+                raise ValueError('frame {} is {}x{}, the frames before it are {}x{}'.format(
+                    name, frame.shape[1], frame.shape[0], size[1], size[0]))
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not capture.isOpened():
+        raise IOError('can not open video source {}'.format(source))
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def batched(frames, batch_size, testsize):
+    """Group frames into (originals, resized uint8 (B, testsize, testsize, 3)) batches."""
+    originals = []
+    for frame in frames:
+        originals.append(frame)
+        if len(originals) == batch_size:
+            yield originals, np.stack([cv2.resize(f, (testsize, testsize)) for f in originals])
+            originals = []
+    if originals:
+        yield originals, np.stack([cv2.resize(f, (testsize, testsize)) for f in originals])
+
+
+def keyframes(distances, gap, threshold, max_gap):
+    """
+    Pick keyframes of a batch from its (B + 1, B + 1) frame distance matrix, whose row / column
+    0 is the last keyframe of the previous batch (None for the first batch). A frame is a
+    keyframe when it differs from the last keyframe by at least `threshold` or `max_gap`
+    frames have passed since it. Returns the batch index of every frame's keyframe and the
+    updated gap.
+    """
+    n = distances.shape[0] - 1
+    key = 0 if gap is not None else None
+    source = []
+    for i in range(1, n + 1):
+        if key is None or distances[key, i] >= threshold or gap >= max_gap:
+            key, gap = i, 0
+        else:
+            gap += 1
+        source.append(key - 1)
+    return source, gap
+
+
+class VideoPredictor:
+    """
+    Streaming inference over a frame generator:
+
+        decode + resize (thread, one batch ahead) -> frame change vs the last keyframe
+        -> model on the keyframes only -> postprocess -> ordered mask writes (thread)
+
+    A frame whose mean absolute change from the last keyframe (on 64x64 grey thumbnails,
+    in [0, 1]) is below `threshold` skips the encoder and decoder and reuses the keyframe's
+    logits; at most `max_gap` frames in a row do. The decoder depends on the encoder features
+    only, so decoding cached keyframe features would reproduce the keyframe map anyway, the
+    cache therefore holds the final logits. threshold=0 runs every frame.
+    """
+
+    def __init__(self, model, testsize=416, batch_size=8, device=None, amp_dtype=None, threshold=0.0,
+                 max_gap=10):
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model = model.to(self.device).eval()
+        self.testsize = testsize
+        self.batch_size = batch_size
+        self.amp_dtype = amp_dtype
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.mean = torch.tensor(MEAN, device=self.device).view(1, 3, 1, 1) * 255
+        self.std = torch.tensor(STD, device=self.device).view(1, 3, 1, 1) * 255
+        self.reset()
+
+    def reset(self):
+        """Forget the last keyframe, e.g. between clips."""
+        self.key_thumb = None
+        self.key_logits = None
+        self.gap = None
+
+    @torch.no_grad()
+    def predict(self, resized):
+        """
+        uint8 (B, testsize, testsize, 3) frames -> (B, 1, testsize, testsize) fp32 logits and
+        the number of frames the model actually ran on.
+        """
+        images = torch.from_numpy(resized)
+        if self.device.type == 'cuda':
+            images = images.pin_memory()
+        images = images.to(self.device, non_blocking=True).permute(0, 3, 1, 2).float()
+        thumbs = F.adaptive_avg_pool2d(images.mean(1, keepdim=True), 64).flatten(1) / 255
+        if self.threshold > 0:
+            # row 0 is the previous keyframe (a placeholder, never compared, on the first batch)
+            previous = self.key_thumb if self.key_thumb is not None else thumbs[:1]
+            candidates = torch.cat((previous, thumbs))
+            distances = torch.cdist(candidates, candidates, p=1).div_(thumbs.shape[1]).cpu().numpy()
+            source, self.gap = keyframes(distances, self.gap, self.threshold, self.max_gap)
+        else:
+            source = list(range(len(resized)))
+
+        # logits rows: this batch's keyframes, then the keyframe carried over (source index -1)
+        keys = sorted(set(i for i in source if i >= 0))
+        rows = []
+        if keys:
+            with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+                rows.append(self.model((images[keys] - self.mean) / self.std, return_all=False).float())
+        if self.key_logits is not None:
+            rows.append(self.key_logits)
+        rows = torch.cat(rows)
+        position = {k: j for j, k in enumerate(keys)}
+        position[-1] = len(keys)
+        last = source[-1]
+        if last >= 0:
+            self.key_thumb = thumbs[last:last + 1]
+            self.key_logits = rows[position[last]:position[last] + 1]
+        return rows[[position[i] for i in source]], len(keys)
+
+    def run(self, frames, save_path=None, video_out=None, fps=25.0, verbose=False):
+        """
+        Predict every frame of the `frames` iterable (see read_frames), streaming 8-bit masks
+        as numbered PNGs to save_path and / or into an .mp4 at video_out, in frame order.
+        Returns frame / keyframe counts and frames per second.
+        """
+        if save_path is not None:
+            os.makedirs(save_path, exist_ok=True)
+        self.reset()
+        writer = None
+        count = computed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(max_workers=1) as saver:
+            batches = batched(frames, self.batch_size, self.testsize)
+            upcoming = reader.submit(next, batches, None)
+            pending = []
+            while True:
+                batch = upcoming.result()
+                if batch is None:
+                    break
+                upcoming = reader.submit(next, batches, None)
+                originals, resized = batch
+                logits, keys = self.predict(resized)
+                h, w = originals[0].shape[:2]  # one size per clip, see read_frames
+                res = F.interpolate(logits, size=(h, w), mode='bilinear', align_corners=False).sigmoid()[:, 0]
+                low = res.amin(dim=(1, 2), keepdim=True)
+                high = res.amax(dim=(1, 2), keepdim=True)
+                masks = ((res - low) / (high - low + 1e-8)).mul(255).round().byte().cpu().numpy()
+                if video_out is not None and writer is None:
+                    writer = cv2.VideoWriter(video_out, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h), isColor=False)
+                # a single saver thread keeps the writes in frame order
+                pending.append(saver.submit(self.write, masks, count, save_path, writer))
+                count += len(originals)
+                computed += keys
+                if verbose:
+                    print('> {} frames ({} computed), {:.2f} fps'.format(
+                        count, computed, count / (time.perf_counter() - start)))
+            for future in pending:
+                future.result()
+        if writer is not None:
+            writer.release()
+        elapsed = time.perf_counter() - start
+        return {'frames': count, 'keyframes': computed, 'seconds': elapsed,
+                'fps': count / elapsed if elapsed > 0 else 0.0}
+
+    @staticmethod
+    def write(masks, first, save_path, writer):
+        for i, mask in enumerate(masks):
+            if save_path is not None:
+                cv2.imwrite(os.path.join(save_path, '{:06d}.png'.format(first + i)), mask)
+            if writer is not None:
+                writer.write(mask)